@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class API(AppConfig):
     name = 'radioco.api'
+
+    def ready(self):
+        if getattr(settings, 'SNAPSHOT_ROOT', None):
+            from radioco import snapshot
+            snapshot.enable()
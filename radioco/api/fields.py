@@ -0,0 +1,50 @@
+import re
+
+from rest_framework import relations
+
+
+# only these lookup values are formatted into a template, others are quoted by reverse()
+PLAIN_VALUE_RE = re.compile(r'^[-_a-zA-Z0-9]+$')
+MARKER = 'lookupvalue0marker'
+
+
+class TemplateURLMixin(object):
+    """
+        Reverse the URL of a view once per request into a prefix and a
+        suffix, and put the lookup value of every object between them
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TemplateURLMixin, self).__init__(*args, **kwargs)
+        self._templates = {}
+        self._templates_request = None
+
+    def get_url_template(self, view_name, request):
+        if self._templates_request is not request:
+            self._templates = {}
+            self._templates_request = request
+        if view_name not in self._templates:
+            url = self.reverse(
+                view_name, kwargs={self.lookup_url_kwarg: MARKER}, request=request)
+            prefix, marker, suffix = url.partition(MARKER)
+            # e.g. an escaped or transformed value, reversed per object instead
+            self._templates[view_name] = (
+                (prefix, suffix) if marker and MARKER not in suffix else None)
+        return self._templates[view_name]
+
+    def get_url(self, obj, view_name, request, format):
+        lookup_value = getattr(obj, self.lookup_field, None)
+        if format or lookup_value in (None, '') or not PLAIN_VALUE_RE.match(str(lookup_value)):
+            return super(TemplateURLMixin, self).get_url(obj, view_name, request, format)
+        template = self.get_url_template(view_name, request)
+        if template is None:
+            return super(TemplateURLMixin, self).get_url(obj, view_name, request, format)
+        return template[0] + str(lookup_value) + template[1]
+
+
+class TemplateHyperlinkedRelatedField(TemplateURLMixin, relations.HyperlinkedRelatedField):
+    pass
+
+
+class TemplateHyperlinkedIdentityField(TemplateURLMixin, relations.HyperlinkedIdentityField):
+    pass
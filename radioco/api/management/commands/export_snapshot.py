@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from radioco import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Render the public pages, the API and the feeds into a static directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root', help='Directory of the snapshot, SNAPSHOT_ROOT by default')
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Render every page, not only the ones changed since the last export')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of processes rendering a full export')
+        parser.add_argument(
+            '--host', help='Host of the absolute URLs, the first of ALLOWED_HOSTS by default')
+        parser.add_argument('--secure', action='store_true', help='Use https URLs')
+        parser.add_argument(
+            '--weeks', type=int, default=2, help='Number of week grids from the current week')
+
+    def handle(self, *args, **options):
+        root = options['root'] or getattr(settings, 'SNAPSHOT_ROOT', None)
+        if not root:
+            raise CommandError('Pass --root or set SNAPSHOT_ROOT in your settings file')
+        started = time.perf_counter()
+        export = snapshot.export(
+            root, full=options['full'], workers=options['workers'], host=options['host'],
+            secure=options['secure'], weeks=options['weeks'])
+        for page in export.skipped:
+            self.stderr.write('{:s} returned {:d}, skipped'.format(page.path, page.status))
+        self.stdout.write('{:d} pages rendered, {:d} removed in {:.1f} s'.format(
+            len(export.rendered), len(export.removed), time.perf_counter() - started))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from radioco.warmup import warm_caches
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the caches of the transmissions, the transmissions on air, the recorder, '
+        'the feeds and the configuration')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help='Date the caches are warmed for, now by default')
+        parser.add_argument(
+            '--weeks', type=int, default=2, help='Number of week grids from the current week')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of threads warming the programme feeds')
+
+    def handle(self, *args, **options):
+        at = timezone.now()
+        if options['at']:
+            at = parse_datetime(options['at'])
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+
+        self.stdout.write('{:<15s} {:>8s} {:>10s}'.format('family', 'entries', 'ms'))
+        total = 0
+        for family, entries, seconds in warm_caches(at, options['weeks'], options['workers']):
+            total += seconds
+            self.stdout.write('{:<15s} {:>8d} {:>10.1f}'.format(family, entries, seconds * 1000))
+        self.stdout.write('caches warmed in {:.1f} ms'.format(total * 1000))
@@ -0,0 +1,96 @@
+"""
+A faster JSON renderer for the API.
+
+Select it in the settings, before the browsable API::
+
+    REST_FRAMEWORK = {
+        'DEFAULT_RENDERER_CLASSES': (
+            'radioco.api.renderers.FastJSONRenderer',
+            'rest_framework.renderers.BrowsableAPIRenderer',
+        ),
+    }
+
+orjson is used when it's installed and STRICT_JSON is off, the standard
+library otherwise. The output is the same as the one of
+rest_framework.renderers.JSONRenderer, except for NaN and infinities, which
+orjson writes as null.
+"""
+
+
+import datetime
+import json
+
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None and not hasattr(orjson, 'OPT_PASSTHROUGH_DATETIME'):
+    # older versions format datetimes themselves, unlike the standard renderer
+    orjson = None
+
+
+_encoder = encoders.JSONEncoder()
+
+
+def _datetime(value):
+    # like rest_framework.utils.encoders.JSONEncoder
+    representation = value.isoformat()
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+def _timedelta(value):
+    return str(value.total_seconds())
+
+
+ENCODERS = {
+    datetime.datetime: _datetime,
+    datetime.timedelta: _timedelta,
+    datetime.date: datetime.date.isoformat,
+}
+
+
+def default(value):
+    encode = ENCODERS.get(type(value))
+    if encode is not None:
+        return encode(value)
+    return _encoder.default(value)
+
+
+def dumps(data, allow_nan):
+    if orjson is not None and allow_nan:
+        # keep the datetime format of the standard renderer, orjson can't
+        # raise ValueError on NaN like a strict one
+        return orjson.dumps(
+            data, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(
+        data, default=default, ensure_ascii=False, check_circular=False,
+        allow_nan=allow_nan, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+        Compact UTF-8 JSON rendered by orjson if not strict, or the standard
+        library
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super(FastJSONRenderer, self).render(
+                data, accepted_media_type, renderer_context)
+        try:
+            content = dumps(data, allow_nan=not self.strict)
+        except TypeError:
+            # e.g. keys orjson can't serialize
+            return super(FastJSONRenderer, self).render(
+                data, accepted_media_type, renderer_context)
+        # a strict javascript subset, like the standard renderer
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
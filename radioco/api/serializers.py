@@ -1,15 +1,20 @@
+import copy
 import datetime
 
 import django.utils.timezone
 
-from radioco.programmes.models import Programme, Episode
+from radioco.api import fields
+from radioco.programmes.models import Programme, Episode, Podcast
+from radioco.programmes.recordings import upsert_podcasts
+from radioco.programmes.search import EPISODE, PROGRAMME
+from radioco.schedules.conflicts import describe, find_conflicts
 from radioco.schedules.models import Slot, Schedule, Transmission
 from rest_framework import serializers
 
 
 class ProgrammeSerializer(serializers.HyperlinkedModelSerializer):
     photo = serializers.ImageField()
-    url = serializers.HyperlinkedIdentityField(
+    url = fields.TemplateHyperlinkedIdentityField(
         view_name='api:programme-detail', lookup_field='slug')
 
     class Meta:
@@ -19,10 +24,10 @@ class ProgrammeSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class SlotSerializer(serializers.HyperlinkedModelSerializer):
-    programme = serializers.HyperlinkedRelatedField(
+    programme = fields.TemplateHyperlinkedRelatedField(
         view_name='api:programme-detail', lookup_field='slug', read_only=True)
     name = serializers.SerializerMethodField()
-    url = serializers.HyperlinkedIdentityField(view_name='api:slot-detail')
+    url = fields.TemplateHyperlinkedIdentityField(view_name='api:slot-detail')
 
     class Meta:
         model = Slot
@@ -33,9 +38,9 @@ class SlotSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class EpisodeSerializer(serializers.HyperlinkedModelSerializer):
-    programme = serializers.HyperlinkedRelatedField(
+    programme = fields.TemplateHyperlinkedRelatedField(
         view_name='api:programme-detail', lookup_field='slug', read_only=True)
-    url = serializers.HyperlinkedIdentityField(view_name='api:episode-detail')
+    url = fields.TemplateHyperlinkedIdentityField(view_name='api:episode-detail')
 
     class Meta:
         model = Episode
@@ -44,7 +49,7 @@ class EpisodeSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class ScheduleSerializer(serializers.ModelSerializer):
-    slot = serializers.HyperlinkedRelatedField(
+    slot = fields.TemplateHyperlinkedRelatedField(
         view_name='api:slot-detail',
         queryset=Slot.objects.all(),
         required=False)
@@ -59,11 +64,100 @@ class ScheduleSerializer(serializers.ModelSerializer):
     def get_title(self, schedule):
         return schedule.slot.programme.name
 
+    def validate(self, attrs):
+        if self.instance is None:
+            schedule = Schedule(**attrs)
+        else:
+            schedule = copy.copy(self.instance)
+            schedule.recurrences = copy.deepcopy(self.instance.recurrences)
+            for attr, value in attrs.items():
+                setattr(schedule, attr, value)
+        conflicts = find_conflicts(schedule)
+        errors = [conflict for conflict in conflicts if conflict.is_error]
+        if errors:
+            raise serializers.ValidationError(describe(errors))
+        # reported by the view
+        self.warnings = describe(conflicts)
+        return attrs
+
+
+class MemoizedSerializerMixin(object):
+    """
+        Serialize every instance once per serializer context, keyed by its
+        primary key
+    """
+
+    def to_representation(self, instance):
+        memo = self.context.setdefault('representations', {})
+        key = (type(self), instance.pk)
+        if key not in memo:
+            memo[key] = super(MemoizedSerializerMixin, self).to_representation(instance)
+        return memo[key]
+
+
+class TransmissionProgrammeSerializer(MemoizedSerializerMixin, ProgrammeSerializer):
+    pass
+
+
+class TransmissionEpisodeSerializer(MemoizedSerializerMixin, EpisodeSerializer):
+    pass
+
 
 class TransmissionSerializer(serializers.Serializer):
     start = serializers.DateTimeField()
     end = serializers.DateTimeField()
     type = serializers.CharField(max_length=1)
-    programme = ProgrammeSerializer()
-    episode = EpisodeSerializer()
+    # a daily programme appears 30 times in a month of transmissions
+    programme = TransmissionProgrammeSerializer()
+    episode = TransmissionEpisodeSerializer()
     schedule = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
+class SearchResultSerializer(serializers.BaseSerializer):
+    serializers = {
+        PROGRAMME: ProgrammeSerializer,
+        EPISODE: EpisodeSerializer,
+    }
+
+    def to_representation(self, result):
+        kind, instance, score = result
+        return {
+            'type': kind,
+            'score': score,
+            kind: self.serializers[kind](instance, context=self.context).data,
+        }
+
+
+class PodcastBatchSerializer(serializers.ListSerializer):
+    def validate(self, records):
+        keys = [
+            (record['programme'], record['season'], record['number'])
+            for record in records]
+        episodes = Episode.objects.resolve(keys)
+        missing = ['{:s} {:d}x{:d}'.format(*key) for key in keys if key not in episodes]
+        if missing:
+            raise serializers.ValidationError(
+                'Episodes not found: {:s}'.format(', '.join(missing)))
+        for key, record in zip(keys, records):
+            record['episode'] = episodes[key]
+        return records
+
+    def create(self, validated_data):
+        return upsert_podcasts(
+            Podcast(episode=record['episode'], url=record['url'],
+                    mime_type=record['mime_type'], length=record['length'],
+                    duration=record['duration'])
+            for record in validated_data)
+
+
+class PodcastRecordSerializer(serializers.Serializer):
+    programme = serializers.SlugField()
+    season = serializers.IntegerField(min_value=1)
+    number = serializers.IntegerField(min_value=1)
+    url = serializers.CharField(max_length=2048)
+    length = serializers.IntegerField(min_value=0)
+    duration = serializers.IntegerField(min_value=1)
+    mime_type = serializers.CharField(max_length=20)
+
+    class Meta:
+        list_serializer_class = PodcastBatchSerializer
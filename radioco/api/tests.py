@@ -15,19 +15,37 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import gzip
+import io
+import json
 import mock
+import os
+import shutil
+import tempfile
 
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
-from rest_framework import status
+from rest_framework import relations, renderers, status
+from rest_framework.request import Request
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase, APIRequestFactory
 
-from radioco.api import serializers
+from radioco import compression, metrics, middleware, snapshot, warmup
+from radioco.api import fields, renderers as api_renderers, serializers
 from radioco.api import views
-from radioco.programmes.models import Programme, Episode
+from radioco.example.utils import benchmark
+from radioco.global_settings.models import (
+    PodcastConfiguration, SiteConfiguration, provision_recorder)
+from radioco.programmes import feeds
+from radioco.programmes.models import Programme, Episode, Podcast
+from radioco.programmes.recordings import upsert_podcasts
+from radioco.schedules import grid
 from radioco.schedules.models import Schedule, Transmission
 from radioco.test.utils import TestDataMixin, now
 
@@ -101,6 +119,172 @@ class TestSerializers(TestDataMixin, TestCase):
         self.assertEqual(data['type'], u'L')
         self.assertEqual(data['schedule'], 6)
 
+    def test_transmission_programme_serialized_once(self):
+        after = timezone.make_aware(datetime.datetime(2015, 1, 5))
+        transmissions = list(Transmission.between(
+            after, after + datetime.timedelta(days=7)))
+        to_representation = serializers.ProgrammeSerializer.to_representation
+        with mock.patch.object(
+                serializers.ProgrammeSerializer, 'to_representation',
+                autospec=True, side_effect=to_representation) as serialize:
+            data = serializers.TransmissionSerializer(
+                transmissions, many=True, context={'request': None}).data
+        self.assertEqual(serialize.call_count, len(set(
+            transmission.programme.pk for transmission in transmissions)))
+        self.assertListEqual(
+            [transmission['programme'] for transmission in data],
+            [serializers.ProgrammeSerializer(
+                transmission.programme, context={'request': None}).data
+             for transmission in transmissions])
+
+
+class TestTemplateURLFields(TestDataMixin, TestCase):
+    def assertSameURLs(self, field_class, template_field_class, objects, **kwargs):
+        for request in (None, Request(APIRequestFactory().get('/api/2/episodes'))):
+            field = field_class(read_only=True, **kwargs)
+            template_field = template_field_class(read_only=True, **kwargs)
+            for field_instance in (field, template_field):
+                field_instance.bind('url', serializers.serializers.Serializer(
+                    context={'request': request}))
+            self.assertListEqual(
+                [template_field.to_representation(obj) for obj in objects],
+                [field.to_representation(obj) for obj in objects])
+
+    def test_identity_by_pk(self):
+        self.assertSameURLs(
+            relations.HyperlinkedIdentityField, fields.TemplateHyperlinkedIdentityField,
+            Episode.objects.all(), view_name='api:episode-detail')
+
+    def test_related_by_slug(self):
+        programmes = list(Programme.objects.all())
+        programmes.append(Programme(pk=1000, name='Ñu', slug='ñu'))
+        self.assertSameURLs(
+            relations.HyperlinkedRelatedField, fields.TemplateHyperlinkedRelatedField,
+            programmes, view_name='api:programme-detail', lookup_field='slug')
+
+    def test_reversed_once(self):
+        field = fields.TemplateHyperlinkedIdentityField(view_name='api:episode-detail')
+        field.bind('url', serializers.serializers.Serializer(context={'request': None}))
+        with mock.patch.object(field, 'reverse', wraps=field.reverse) as reverse:
+            urls = [field.to_representation(episode) for episode in Episode.objects.all()]
+        self.assertEqual(reverse.call_count, 1)
+        self.assertEqual(urls[0], '/api/2/episodes/{:d}'.format(Episode.objects.first().pk))
+
+    def test_marker_not_in_url(self):
+        field = fields.TemplateHyperlinkedIdentityField(view_name='api:episode-detail')
+        field.bind('url', serializers.serializers.Serializer(context={'request': None}))
+        reverse = field.reverse
+        episodes = list(Episode.objects.all())
+        with mock.patch.object(
+                field, 'reverse', side_effect=lambda *args, **kwargs: reverse(
+                    *args, **kwargs).upper()):
+            urls = [field.to_representation(episode) for episode in episodes]
+        self.assertListEqual(
+            urls, ['/API/2/EPISODES/{:d}'.format(episode.pk) for episode in episodes])
+
+    def test_unsaved(self):
+        field = fields.TemplateHyperlinkedIdentityField(view_name='api:episode-detail')
+        field.bind('url', serializers.serializers.Serializer(context={'request': None}))
+        self.assertIsNone(field.to_representation(Episode()))
+
+
+class TestFastJSONRenderer(TestDataMixin, TestCase):
+    def assertSameJSON(self, data, accepted_media_type=None):
+        self.assertEqual(
+            api_renderers.FastJSONRenderer().render(data, accepted_media_type),
+            renderers.JSONRenderer().render(data, accepted_media_type))
+
+    def test_transmissions(self):
+        request = Request(APIRequestFactory().get('/api/2/transmissions'))
+        transmissions = Transmission.between(now(), now() + datetime.timedelta(days=7))
+        self.assertSameJSON(serializers.TransmissionSerializer(
+            transmissions, many=True, context={'request': request}).data)
+
+    def test_native_values(self):
+        self.assertSameJSON({
+            'start': now(),
+            'naive': datetime.datetime(2015, 1, 6, 14, 30, 0, 123456),
+            'utc': now().astimezone(timezone.utc),
+            'date': now().date(),
+            'runtime': datetime.timedelta(hours=1, minutes=30),
+            'text': 'Ñu \u2028',
+        })
+
+    def test_indent(self):
+        self.assertSameJSON({'a': [1, 2]}, 'application/json; indent=4')
+
+    def test_none(self):
+        self.assertEqual(api_renderers.FastJSONRenderer().render(None), b'')
+
+    def test_fallback(self):
+        with mock.patch.object(api_renderers, 'dumps', side_effect=TypeError):
+            self.assertSameJSON({'runtime': datetime.timedelta(hours=1)})
+
+    @override_settings(ALLOWED_HOSTS=['radio.example.com'])
+    def test_benchmark(self):
+        at = timezone.make_aware(datetime.datetime(2015, 1, 6))
+        render = benchmark._render(
+            api_renderers.FastJSONRenderer(), at, at + datetime.timedelta(days=7))
+        transmissions = json.loads(render().decode('utf-8'))
+        self.assertTrue(transmissions)
+        self.assertTrue(all(
+            transmission['programme']['photo'].startswith('http://radio.example.com/')
+            for transmission in transmissions))
+
+    def test_strict_nan(self):
+        with self.assertRaises(ValueError):
+            api_renderers.FastJSONRenderer().render({'a': float('nan')})
+
+    def test_orjson(self):
+        fake_orjson = mock.Mock()
+        fake_orjson.dumps.return_value = b'{"a":1}'
+        renderer = api_renderers.FastJSONRenderer()
+        with mock.patch.object(api_renderers, 'orjson', fake_orjson):
+            self.assertSameJSON({'a': 1})
+            self.assertFalse(fake_orjson.dumps.called)
+            renderer.strict = False
+            self.assertEqual(renderer.render({'a': 1}), b'{"a":1}')
+        fake_orjson.dumps.assert_called_once_with(
+            {'a': 1}, default=api_renderers.default,
+            option=fake_orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+class TestCompression(TestCase):
+    content = b'{"transmissions": []}' * 20
+
+    def test_compress(self):
+        variants = compression.compress(self.content)
+        self.assertEqual(variants['identity'], self.content)
+        self.assertEqual(gzip.decompress(variants['gzip']), self.content)
+
+    def test_compress_small(self):
+        self.assertDictEqual(compression.compress('{}'), {'identity': b'{}'})
+
+    def test_accepted_encodings(self):
+        self.assertDictEqual(
+            compression.accepted_encodings('gzip;q=0.5, BR, identity; q=0, *;q=x'),
+            {'gzip': 0.5, 'br': 1.0, 'identity': 0.0, '*': 0.0})
+
+    def test_negotiate(self):
+        variants = {'identity': b'', 'gzip': b'', 'br': b''}
+        with mock.patch.object(compression, 'brotli', mock.Mock()):
+            self.assertEqual(compression.negotiate('gzip, br', variants), 'br')
+            self.assertEqual(compression.negotiate('gzip, br;q=0.5', variants), 'gzip')
+            self.assertEqual(compression.negotiate('*', variants), 'br')
+            self.assertEqual(compression.negotiate('deflate', variants), 'identity')
+            self.assertEqual(compression.negotiate('gzip;q=0, br;q=0', variants), 'identity')
+            self.assertEqual(compression.negotiate('br', {'identity': b''}), 'identity')
+        with mock.patch.object(compression, 'brotli', None):
+            self.assertEqual(compression.negotiate('br, gzip', variants), 'gzip')
+
+    def test_brotli(self):
+        brotli = mock.Mock()
+        brotli.compress.return_value = b'br'
+        with mock.patch.object(compression, 'brotli', brotli):
+            variants = compression.compress(self.content)
+        brotli.compress.assert_called_once_with(self.content)
+        self.assertEqual(variants['br'], b'br')
+
 
 class TestAPI(TestDataMixin, APITestCase):
     def setUp(self):
@@ -192,6 +376,40 @@ class TestAPI(TestDataMixin, APITestCase):
             start='2017-12-26T03:00:00', type='L'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    @mock.patch(
+        'django.utils.timezone.now',
+        lambda: timezone.make_aware(datetime.datetime(2017, 12, 1)))
+    def test_schedules_post_live_conflict(self):
+        self.client.login(username="klaus", password="topsecret")
+        response = self.client.post('/api/2/schedules', dict(
+            slot='http://127.0.0.1:8000/api/2/slots/5',
+            start='2017-12-26T03:00:00',
+            type='L'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/api/2/schedules', dict(
+            slot='http://127.0.0.1:8000/api/2/slots/4',
+            start='2017-12-26T03:30:00',
+            type='L'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('overlaps', response.data['non_field_errors'][0])
+
+    @mock.patch(
+        'django.utils.timezone.now',
+        lambda: timezone.make_aware(datetime.datetime(2017, 12, 1)))
+    def test_schedules_post_conflict_warning(self):
+        self.client.login(username="klaus", password="topsecret")
+        response = self.client.post('/api/2/schedules', dict(
+            slot='http://127.0.0.1:8000/api/2/slots/5',
+            start='2017-12-26T03:00:00',
+            type='L'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/api/2/schedules', dict(
+            slot='http://127.0.0.1:8000/api/2/slots/4',
+            start='2017-12-26T03:30:00',
+            type='R'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('overlaps', response['Warning'])
+
     @mock.patch(
         'django.utils.timezone.now',
         lambda: timezone.make_aware(datetime.datetime(2015, 1, 6, 14, 30, 0)))
@@ -242,3 +460,422 @@ class TestAPI(TestDataMixin, APITestCase):
         self.assertListEqual(
             [(t['programme']['name'], t['start']) for t in response.data],
             [(u'Classic hits', '2015-01-06T14:00:00+01:00')])
+
+    @mock.patch(
+        'django.utils.timezone.now',
+        lambda: timezone.make_aware(datetime.datetime(2015, 1, 6, 14, 30, 0)))
+    def test_transmission_week(self):
+        response = self.client.get('/api/2/transmissions/week')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        week = json.loads(response.content.decode())
+        self.assertEqual(week['week'], '2015-W02')
+        self.assertEqual(
+            json.loads(self.client.get(
+                '/api/2/transmissions/week', {'week': '2015-W02'}).content.decode()),
+            week)
+
+    def test_transmission_week_compressed(self):
+        content = self.client.get('/api/2/transmissions/week').content
+        with mock.patch('radioco.compression.compress_string') as compress_string:
+            response = self.client.get(
+                '/api/2/transmissions/week', HTTP_ACCEPT_ENCODING='gzip')
+        # compressed once, when it was cached
+        self.assertFalse(compress_string.called)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), content)
+
+    def test_transmission_week_invalid(self):
+        response = self.client.get('/api/2/transmissions/week', {'week': '2015-02'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestSearch(TestDataMixin, APITestCase):
+    def search(self, **params):
+        response = self.client.get('/api/2/search', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_search_programme(self):
+        data = self.search(q='classic')
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['type'], 'programme')
+        self.assertEqual(
+            data['results'][0]['programme']['name'], u'Classic hits')
+
+    def test_search_ranked(self):
+        episodes = list(self.programme.episode_set.order_by('pk')[:2])
+        episodes[0].summary = 'An interview'
+        episodes[0].save()
+        episodes[1].title = 'Interview'
+        episodes[1].save()
+        results = self.search(q='interview')['results']
+        self.assertListEqual(
+            [result['episode']['title'] for result in results],
+            ['Interview', 'Episode 1'])
+
+    def test_search_html_stripped(self):
+        self.episode.summary = '<p>An <strong>interview</strong> &amp; more</p>'
+        self.episode.save()
+        results = self.search(q='interview more')['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['episode']['title'], u'Episode 1')
+        self.assertEqual(self.search(q='strong')['count'], 0)
+
+    def test_search_prefix(self):
+        self.assertEqual(self.search(q='gossi')['count'], 1)
+
+    def test_search_paginated(self):
+        data = self.search(q='summary season', page_size=5)
+        self.assertEqual(len(data['results']), 5)
+        self.assertGreater(data['count'], 5)
+        self.assertIn('page=2', data['next'])
+
+    def test_search_deleted(self):
+        Programme.objects.get(name='Classic hits').delete()
+        self.assertEqual(self.search(q='classic')['count'], 0)
+
+    def test_search_operators(self):
+        self.assertEqual(self.search(q='classic*) "')['count'], 1)
+
+    def test_search_without_query(self):
+        response = self.client.get('/api/2/search')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@mock.patch.object(views.RecorderViewSet, 'poll_interval', 0)
+@mock.patch.object(views.RecorderViewSet, 'heartbeat_interval', 0)
+@mock.patch.object(views.RecorderViewSet, 'stream_lifetime', 0)
+@mock.patch(
+    'django.utils.timezone.now',
+    lambda: timezone.make_aware(datetime.datetime(2015, 1, 6, 14, 30, 0)))
+class TestRecorderEvents(TestDataMixin, APITestCase):
+    def setUp(self):
+        PodcastConfiguration.get_global()
+
+    def get_events(self, **headers):
+        response = self.client.get('/api/2/recorder/events', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for message in b''.join(response.streaming_content).decode().split('\n\n'):
+            fields = dict(
+                line.split(': ', 1) for line in message.splitlines())
+            if 'event' in fields:
+                events.append((fields['event'], fields.get('id'),
+                               json.loads(fields['data'])))
+        return events
+
+    def test_window(self):
+        [(name, version, data)] = self.get_events()
+        self.assertEqual(name, 'window')
+        self.assertEqual(data['version'], version)
+        starts = [t['start'] for t in data['transmissions']]
+        self.assertEqual(starts, sorted(starts))
+        self.assertGreaterEqual(starts[0], '2015-01-06T14:30:00+01:00')
+        self.assertLessEqual(starts[-1], '2015-01-07T22:30:00+01:00')
+
+    def test_heartbeat(self):
+        [(name, version, data)] = self.get_events()
+        [(name, _, data)] = self.get_events(HTTP_LAST_EVENT_ID=version)
+        self.assertEqual(name, 'heartbeat')
+        self.assertEqual(data, {'version': version})
+
+    def test_window_changed(self):
+        [(name, version, data)] = self.get_events()
+        self.schedule.save()
+        [(name, new_version, data)] = self.get_events(HTTP_LAST_EVENT_ID=version)
+        self.assertEqual(name, 'window')
+        self.assertNotEqual(new_version, version)
+
+
+class TestRecorderEventsSettings(TestCase):
+    def test_defaults(self):
+        viewset = views.RecorderViewSet()
+        self.assertEqual(viewset.stream_lifetime, 25)
+        self.assertEqual(viewset.poll_interval, 1)
+
+    @override_settings(RECORDER_EVENTS_LIFETIME=300, RECORDER_EVENTS_POLL_INTERVAL=5)
+    def test_settings(self):
+        viewset = views.RecorderViewSet()
+        self.assertEqual(viewset.stream_lifetime, 300)
+        self.assertEqual(viewset.poll_interval, 5)
+
+
+@mock.patch(
+    'django.utils.timezone.now',
+    lambda: timezone.make_aware(datetime.datetime(2015, 1, 6, 14, 30, 0)))
+class TestRecorderManifest(TestDataMixin, APITestCase):
+    def test_manifest(self):
+        response = self.client.get('/api/2/recorder/manifest')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['full'])
+        self.assertEqual(
+            response.data['jobs'][0]['file_name'], 'classic-hits_2x1')
+
+    def test_manifest_since(self):
+        version = self.client.get('/api/2/recorder/manifest').data['version']
+        response = self.client.get('/api/2/recorder/manifest', {'since': version})
+        self.assertFalse(response.data['full'])
+        self.assertListEqual(response.data['jobs'], [])
+
+
+class TestPodcastIngestion(TestDataMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.token = provision_recorder()
+        self.records = [{
+            'programme': 'classic-hits', 'season': episode.season,
+            'number': episode.number_in_season,
+            'url': 'http://example.com/{:d}.mp3'.format(episode.number_in_season),
+            'length': 1024, 'duration': 3600, 'mime_type': 'audio/mpeg',
+        } for episode in self.programme.episode_set.order_by('issue_date')[:3]]
+
+    def post(self, records, token=None):
+        return self.client.post(
+            '/api/2/recorder/podcasts', records, format='json',
+            HTTP_AUTHORIZATION='Token {:s}'.format(token or self.token))
+
+    def test_create(self):
+        response = self.post(self.records)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'podcasts': 3})
+        self.assertListEqual(
+            sorted(Podcast.objects.filter(
+                episode__programme=self.programme).values_list('url', flat=True)),
+            ['http://example.com/1.mp3', 'http://example.com/2.mp3',
+             'http://example.com/3.mp3'])
+
+    def test_update(self):
+        self.post(self.records)
+        self.records[0]['duration'] = 1800
+        response = self.post(self.records)
+        self.assertEqual(response.data, {'podcasts': 1})
+        self.assertEqual(
+            Podcast.objects.get(url='http://example.com/1.mp3').duration, 1800)
+
+    def test_queries(self):
+        # token, user and group permissions, episodes, existing podcasts,
+        # savepoint, insert, release savepoint
+        with self.assertNumQueries(8):
+            self.post(self.records)
+
+    def test_feed_invalidated(self):
+        self.client.get('/api/2/programmes/classic-hits/rss')
+        self.post(self.records)
+        response = self.client.get('/api/2/programmes/classic-hits/rss')
+        self.assertIn(b'http://example.com/1.mp3', response.content)
+
+    def test_unknown_episode(self):
+        self.records[1]['season'] = 9
+        response = self.post(self.records)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Podcast.objects.filter(
+            url__startswith='http://example.com/').exists())
+
+    def test_invalid_record(self):
+        del self.records[0]['url']
+        response = self.post(self.records)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unauthenticated(self):
+        response = self.client.post(
+            '/api/2/recorder/podcasts', self.records, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_without_permission(self):
+        someone = User.objects.create_user(username='someone')
+        token = Token.objects.create(user=someone)
+        response = self.post(self.records, token.key)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestInstrumentation(TestDataMixin, APITestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_server_timing(self):
+        response = self.client.get('/api/2/programmes')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="1 queries", render;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_metrics(self):
+        self.client.get('/api/2/programmes')
+        self.client.get('/api/2/programmes')
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        self.assertIn(
+            'radioco_request_db_queries_bucket{view="api:programme-list",le="1"} 2',
+            content)
+        self.assertIn(
+            'radioco_request_duration_seconds_count{view="api:programme-list"} 2',
+            content)
+        self.assertIn('radioco_response_size_bytes_sum{view="api:programme-list"}', content)
+        self.assertNotIn('view="metrics"', content)
+
+    def test_counts_queries(self):
+        middleware._instrument(connection)
+        middleware._local.stats = stats = middleware.RequestStats()
+        try:
+            Programme.objects.count()
+            list(Programme.objects.iterator())
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        finally:
+            del middleware._local.stats
+        self.assertEqual(stats.queries, 3)
+
+    def test_metrics_remote(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_metrics_behind_proxy(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_wrong_token(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer guess')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(INTERNAL_IPS=['10.0.0.5'])
+    def test_metrics_internal_ips(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_metrics_staff(self):
+        self.client.force_login(User.objects.create_user('prometheus', is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TestSnapshot(TestDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.static = tempfile.mkdtemp()
+        with open(os.path.join(self.static, 'site.css'), 'w') as stream:
+            stream.write('body {}')
+        static = override_settings(
+            STATICFILES_DIRS=[self.static],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'])
+        static.enable()
+        self.addCleanup(static.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.static)
+
+    def read(self, name):
+        with open(os.path.join(self.root, name)) as stream:
+            return stream.read()
+
+    def test_api(self):
+        export = snapshot.export(self.root, workers=1)
+        self.assertListEqual(export.skipped, [])
+        self.assertEqual(
+            json.loads(self.read('api/2/programmes/index.json')),
+            json.loads(self.client.get('/api/2/programmes').content.decode()))
+        self.assertEqual(
+            json.loads(self.read('api/2/transmissions/week/index.json')),
+            json.loads(self.client.get('/api/2/transmissions/week').content.decode()))
+        self.assertIn('<rss', self.read('api/2/programmes/classic-hits/rss/index.xml'))
+        self.assertIn('<rss', self.read('api/2/rss/index.xml'))
+
+    def test_public_pages_need_templates(self):
+        paths = [path for group, path in snapshot.pages()]
+        self.assertNotIn('/programmes/', paths)
+        self.assertNotIn('/programmes/classic-hits/', paths)
+
+    def test_hashed_assets(self):
+        templates = {
+            'programmes/programme_detail.html':
+                '{% load static %}<link href="{% static "site.css" %}">{{ programme.name }}'}
+        with override_settings(TEMPLATES=[{
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', templates)]}}]):
+            snapshot.export(self.root, workers=1)
+        name = snapshot.hashed_name('site.css', b'body {}')
+        self.assertEqual(
+            self.read('programmes/classic-hits/index.html'),
+            '<link href="/static/{:s}">Classic hits'.format(name))
+        self.assertEqual(self.read(os.path.join('static', name)), 'body {}')
+        self.assertEqual(self.read('static/site.css'), 'body {}')
+
+    def test_incremental(self):
+        snapshot.export(self.root, workers=1)
+        snapshot.journal([snapshot.programme_group(self.programme.pk)], self.root)
+        paths = {page.path for page in snapshot.export(self.root, workers=1).rendered}
+        self.assertIn('/api/2/programmes/classic-hits', paths)
+        self.assertIn('/api/2/episodes/{:d}'.format(self.episode.pk), paths)
+        self.assertIn('/api/2/transmissions/week', paths)
+        self.assertNotIn('/api/2/programmes', paths)
+        self.assertNotIn('/api/2/slots', paths)
+
+    def test_incremental_after_upserted_podcasts(self):
+        snapshot.export(self.root, workers=1)
+        with override_settings(SNAPSHOT_ROOT=self.root):
+            snapshot.enable()
+            self.addCleanup(snapshot.disable)
+            upsert_podcasts([Podcast(
+                episode=Episode.objects.select_related('programme').get(pk=self.episode.pk),
+                url='http://example.com/podcast.mp3', mime_type='audio/mp3',
+                length=0, duration=3600)])
+        paths = {page.path for page in snapshot.export(self.root, workers=1).rendered}
+        self.assertIn('/api/2/programmes/classic-hits/rss', paths)
+        self.assertIn('/api/2/rss', paths)
+        self.assertIn('/api/2/episodes/{:d}'.format(self.episode.pk), paths)
+        self.assertNotIn('/api/2/slots', paths)
+
+    def test_removed(self):
+        snapshot.export(self.root, workers=1)
+        programme = Programme.objects.get(name='Local Gossips')
+        programme.delete()
+        export = snapshot.export(self.root, workers=1)
+        self.assertIn('/api/2/programmes/local-gossips', export.removed)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.root, 'api/2/programmes/local-gossips/index.json')))
+
+    def test_journal(self):
+        with override_settings(SNAPSHOT_ROOT=self.root):
+            snapshot.enable()
+            self.addCleanup(snapshot.disable)
+            self.slot.save()
+            self.episode.save()
+        self.assertSetEqual(snapshot.take_journal(self.root), {
+            snapshot.SCHEDULES, snapshot.PROGRAMMES,
+            snapshot.programme_group(self.episode.programme_id)})
+        self.assertSetEqual(snapshot.take_journal(self.root), set())
+
+
+class TestWarmCaches(TestDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_warm(self):
+        at = timezone.make_aware(datetime.datetime(2015, 1, 6, 12, 0))
+        families = [warmed.family for warmed in warmup.warm_caches(at, workers=1)]
+        self.assertListEqual(
+            families, ['configuration', 'week grids', 'now playing', 'recorder', 'feeds'])
+        self.assertIsNotNone(cache.get(SiteConfiguration.version_key()))
+        feed_items = PodcastConfiguration.get_global().feed_items
+        with self.assertNumQueries(0):
+            grid.week_grid(2015, 2)
+            grid.week_grid(2015, 3)
+            feeds.programmes_items([self.programme.pk], feed_items)
+            feeds.station_items(feed_items)
+        with mock.patch.object(Transmission, 'at') as transmission_at:
+            grid.on_air(at)
+        self.assertFalse(transmission_at.called)
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command(
+            'warm_caches', '--at', '2015-01-06T12:00', '--workers', '1', stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertListEqual(
+            [line.split()[0] for line in lines[1:-1]],
+            ['configuration', 'week', 'now', 'recorder', 'feeds'])
+        self.assertTrue(lines[-1].startswith('caches warmed in'))
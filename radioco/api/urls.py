@@ -2,6 +2,7 @@ from django.conf.urls import url, include
 from rest_framework import routers
 
 from radioco.api import views
+from radioco.programmes.feeds import RssProgrammeFeed, RssStationFeed
 
 
 router = routers.DefaultRouter(trailing_slash=False)
@@ -11,5 +12,11 @@ router.register(r'episodes', views.EpisodeViewSet)
 router.register(r'schedules', views.ScheduleViewSet)
 router.register(
     r'transmissions', views.TransmissionViewSet, base_name='transmission')
+router.register(r'search', views.SearchViewSet, base_name='search')
+router.register(r'recorder', views.RecorderViewSet, base_name='recorder')
 
-urlpatterns = router.urls
+urlpatterns = [
+    url(r'^rss$', RssStationFeed(), name='rss'),
+    url(r'^programmes/(?P<slug>[-\w]+)/rss$', RssProgrammeFeed(),
+        name='programme-rss'),
+] + router.urls
@@ -1,19 +1,29 @@
 import datetime
+import time
 
 from django import forms
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 
-from rest_framework import permissions, viewsets
+from rest_framework import (
+    authentication, exceptions, permissions, renderers, viewsets)
 from rest_framework.decorators import list_route
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 from django_filters.fields import IsoDateTimeField
 
 from radioco.api import serializers
+from radioco.compression import compressed_response
 from radioco.programmes.models import Programme, Episode
+from radioco.programmes.search import SearchResults
+from radioco.schedules import grid
 from radioco.schedules.models import Slot, Schedule, Transmission
+from radioco.schedules.recorder import (
+    manifest, recorder_version, recorder_window)
 
 
 class ProgrammeViewSet(viewsets.ReadOnlyModelViewSet):
@@ -36,6 +46,24 @@ class ScheduleViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.DjangoModelPermissionsOrAnonReadOnly,)
     queryset = Schedule.objects.all()
     serializer_class = serializers.ScheduleSerializer
+    warnings = ()
+
+    def perform_create(self, serializer):
+        super(ScheduleViewSet, self).perform_create(serializer)
+        self.warnings = serializer.warnings
+
+    def perform_update(self, serializer):
+        super(ScheduleViewSet, self).perform_update(serializer)
+        self.warnings = serializer.warnings
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ScheduleViewSet, self).finalize_response(
+            request, response, *args, **kwargs)
+        if self.warnings:
+            # overlapping transmissions which aren't both live
+            response['Warning'] = ', '.join(
+                '299 - "{:s}"'.format(warning.replace('"', "'")) for warning in self.warnings)
+        return response
 
 
 class TransmissionForm(forms.Form):
@@ -77,11 +105,156 @@ class TransmissionViewSet(viewsets.GenericViewSet):
 
     @list_route()
     def now(self, request):
-        _now = timezone.now()
-        transmissions = Transmission.at(_now)
+        transmissions = grid.on_air(timezone.now())
         serializer = self.get_serializer(
             transmissions, many=True, context={'request': request})
         return Response(serializer.data)
 
+    @list_route()
+    def week(self, request):
+        """
+            The transmissions of an ISO week (?week=2015-W02, the current week
+            by default) sorted and assigned to columns of overlapping
+            transmissions
+        """
+        if 'week' not in request.query_params:
+            year, week = grid.current_week()
+        else:
+            try:
+                year, week = grid.parse_week(request.query_params['week'])
+            except ValueError as error:
+                raise exceptions.ValidationError({'week': [str(error)]})
+        return compressed_response(
+            request, grid.week_grid_variants(year, week), content_type='application/json')
+
+    def get_queryset(self):
+        pass
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField()
+
+
+class SearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class SearchViewSet(viewsets.GenericViewSet):
+    serializer_class = serializers.SearchResultSerializer
+    pagination_class = SearchPagination
+
+    def list(self, request):
+        params = SearchForm(request.query_params)
+        if not params.is_valid():
+            raise exceptions.ValidationError(params.errors)
+
+        page = self.paginate_queryset(SearchResults(params.cleaned_data['q']))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_queryset(self):
+        pass
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class PodcastPermission(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.has_perms(
+            ('programmes.add_podcast', 'programmes.change_podcast'))
+
+
+class RecorderViewSet(viewsets.GenericViewSet):
+    serializer_class = serializers.TransmissionSerializer
+
+    # in seconds
+    heartbeat_interval = 15
+    # the window moves with time even if nothing changes
+    window_interval = 3600
+
+    @property
+    def poll_interval(self):
+        return getattr(settings, 'RECORDER_EVENTS_POLL_INTERVAL', 1)
+
+    @property
+    def stream_lifetime(self):
+        # every stream holds a worker, clients reconnect with the last version
+        # they received
+        return getattr(settings, 'RECORDER_EVENTS_LIFETIME', 25)
+
+    @list_route()
+    def manifest(self, request):
+        """
+            The recording jobs, only the changes since the manifest with
+            the version given as since parameter if it's still known
+        """
+        return Response(manifest(request.query_params.get('since')))
+
+    @list_route(
+        methods=['post'], serializer_class=serializers.PodcastRecordSerializer,
+        authentication_classes=[
+            authentication.TokenAuthentication,
+            authentication.SessionAuthentication],
+        permission_classes=[PodcastPermission])
+    def podcasts(self, request):
+        """
+            Create or update the podcasts of a list of recorded episodes
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        podcasts = serializer.save()
+        return Response({'podcasts': len(podcasts)})
+
+    @list_route(renderer_classes=[EventStreamRenderer])
+    def events(self, request):
+        """
+            Server-sent events with the recorder window, sent whenever it
+            changes, and heartbeats in between
+        """
+        last_version = request.META.get(
+            'HTTP_LAST_EVENT_ID', request.query_params.get('version'))
+        response = StreamingHttpResponse(
+            self.stream(request, last_version),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, request, last_version):
+        yield 'retry: {:d}\n\n'.format(self.poll_interval * 1000)
+        started = window_sent = heartbeat_sent = time.time()
+        while True:
+            version = str(recorder_version())
+            now = time.time()
+            if version != last_version or now - window_sent >= self.window_interval:
+                yield self.event('window', version, {
+                    'version': version,
+                    'transmissions': self.get_serializer(
+                        recorder_window(), many=True,
+                        context={'request': request}).data})
+                last_version, window_sent, heartbeat_sent = version, now, now
+            elif now - heartbeat_sent >= self.heartbeat_interval:
+                yield self.event('heartbeat', None, {'version': version})
+                heartbeat_sent = now
+            if now - started >= self.stream_lifetime:
+                return
+            time.sleep(self.poll_interval)
+
+    def event(self, name, id, data):
+        lines = ['event: {:s}'.format(name)]
+        if id is not None:
+            lines.append('id: {:s}'.format(id))
+        lines.append('data: {:s}'.format(renderers.JSONRenderer().render(data).decode('utf-8')))
+        return '\n'.join(lines) + '\n\n'
+
     def get_queryset(self):
         pass
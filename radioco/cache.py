@@ -0,0 +1,105 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+# backends whose values are only seen by the process storing them
+LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+_no_cache = DummyCache('radioco-no-cache', {})
+
+
+def is_shared():
+    """
+        Return whether the default cache is shared by every process
+    """
+    return not isinstance(caches['default'], LOCAL_BACKENDS)
+
+
+class SharedCache(object):
+    """
+        The default cache if it's shared by every process, a cache storing
+        nothing otherwise, so no process serves values another one changed
+    """
+
+    def __getattr__(self, name):
+        return getattr(caches['default'] if is_shared() else _no_cache, name)
+
+
+shared_cache = SharedCache()
+
+
+def _initial_generation():
+    # start from a timestamp, so a generation evicted from the cache never
+    # resurrects values stored under an older generation number
+    return int(time.time() * 1000)
+
+
+def get_generation(key):
+    """
+        Return the current generation number stored at key
+    """
+    generation = cache.get(key)
+    if generation is None:
+        initial = _initial_generation()
+        cache.add(key, initial, None)
+        generation = cache.get(key)
+        if generation is None:
+            # evicted meanwhile, or not cached at all like with DummyCache
+            generation = initial
+    return generation
+
+
+def bump_generation(key):
+    """
+        Invalidate every value cached under the current generation of key
+
+        Inside a transaction, the generation is bumped again once it commits:
+        other processes still read the rows before it and may cache them
+        under the first new generation meanwhile.
+    """
+    generation = _bump_generation(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_generation(key))
+    return generation
+
+
+def _bump_generation(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        initial = _initial_generation()
+        cache.add(key, initial, None)
+        generation = cache.get(key)
+        return initial if generation is None else generation
+
+
+def get_generations(keys):
+    """
+        Return a dict with the current generation number of every key
+    """
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generations[key] = get_generation(key)
+    return generations
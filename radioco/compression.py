@@ -0,0 +1,139 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Pre-compressed variants of cached responses.
+
+Content served from the cache is compressed once, when it is stored, with
+gzip and with brotli if it's installed. Every request is then served the
+stored variant preferred by its Accept-Encoding header.
+"""
+
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+IDENTITY = 'identity'
+# smaller content isn't worth compressing, like in GZipMiddleware
+MIN_SIZE = 200
+
+
+def _compressors():
+    # in order of preference when equally accepted
+    if brotli is not None:
+        yield 'br', brotli.compress
+    yield 'gzip', compress_string
+
+
+def compress(content):
+    """
+        Return a dict of content per encoding, compressed variants are only
+        kept if they are smaller
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    variants = {IDENTITY: content}
+    if len(content) < MIN_SIZE:
+        return variants
+    for encoding, compressor in _compressors():
+        compressed = compressor(content)
+        if len(compressed) < len(content):
+            variants[encoding] = compressed
+    return variants
+
+
+def accepted_encodings(accept_encoding):
+    """
+        Return a dict of quality per encoding of an Accept-Encoding header
+    """
+    encodings = {}
+    for part in accept_encoding.split(','):
+        encoding, _, params = part.partition(';')
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[encoding] = quality
+    return encodings
+
+
+def negotiate(accept_encoding, variants):
+    """
+        Return the encoding of variants preferred by an Accept-Encoding
+        header, identity if no compressed variant is accepted
+    """
+    accepted = accepted_encodings(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    best, best_quality = IDENTITY, 0.0
+    for encoding, compressor in _compressors():
+        if encoding not in variants:
+            continue
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressed_response(request, variants, headers=(), **kwargs):
+    """
+        Return an HttpResponse of the variant accepted by request, kwargs are
+        passed to HttpResponse
+    """
+    encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), variants)
+    response = HttpResponse(variants[encoding], **kwargs)
+    for header, value in headers:
+        response[header] = value
+    if encoding != IDENTITY:
+        response['Content-Encoding'] = encoding
+    if len(variants) > 1:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def store_response(response):
+    """
+        Return what the cache stores of a response: its variants and headers
+    """
+    return {
+        'status': response.status_code,
+        'headers': [
+            (header, value) for header, value in response.items()
+            if header.lower() not in ('content-length', 'content-encoding', 'vary')],
+        'variants': compress(response.content),
+    }
+
+
+def load_response(request, stored):
+    """
+        Return the response of request from what store_response returned
+    """
+    return compressed_response(
+        request, stored['variants'], stored['headers'], status=stored['status'])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from radioco.example.utils import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Create a large station to run the benchmarks against'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--programmes', type=int, default=500)
+        parser.add_argument('--schedules', type=int, default=2000)
+        parser.add_argument('--episodes', type=int, default=200000)
+        parser.add_argument('--podcasts', type=int, default=50000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        benchmark.create_benchmark_data(
+            programmes=options['programmes'], schedules=options['schedules'],
+            episodes=options['episodes'], podcasts=options['podcasts'],
+            users=options['users'], seed=options['seed'], stdout=self.stdout)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+
+from radioco.example.utils import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Time the schedules, feeds and API endpoints and count their queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*', help='Only run benchmarks whose name contains one of these')
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument(
+            '--at', help='Date the schedules are looked at, now by default')
+
+    def handle(self, *args, **options):
+        at = None
+        if options['at']:
+            at = parse_datetime(options['at'])
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+
+        self.stdout.write('{:<40s} {:>10s} {:>8s} {:>10s} {:>8s}'.format(
+            'benchmark', 'cold ms', 'queries', 'warm ms', 'queries'))
+        for result in benchmark.run_benchmarks(at, options['runs'], options['names']):
+            self.stdout.write('{:<40s} {:>10.1f} {:>8d} {:>10.1f} {:>8d}'.format(
+                result.name, result.cold_time * 1000, result.cold_queries,
+                result.warm_time * 1000, result.warm_queries))
+
+        self.stdout.write('')
+        self.stdout.write('{:<40s} {:>10s} {:>12s} {:>12s} {:>8s}'.format(
+            'memory', 'objects', 'retained kB', 'peak kB', 'B/object'))
+        for result in benchmark.run_memory_benchmarks(at, options['names']):
+            self.stdout.write('{:<40s} {:>10d} {:>12.1f} {:>12.1f} {:>8.0f}'.format(
+                result.name, result.count, result.retained / 1024, result.peak / 1024,
+                result.retained / max(result.count, 1)))
@@ -0,0 +1,382 @@
+"""
+Large station data and the benchmarks run against it.
+"""
+
+import collections
+import datetime
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+
+import recurrence
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.template.defaultfilters import slugify
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from radioco.api.renderers import FastJSONRenderer
+from radioco.api.serializers import TransmissionSerializer
+from radioco.programmes.feeds import render_item
+from radioco.programmes.models import (
+    Episode, Podcast, Programme, Role, PROGRAMME_LANGUAGES, ROLES)
+from radioco.programmes.search import rebuild_index
+from radioco.schedules.models import Schedule, Slot, Transmission, occurrence_window
+from radioco.schedules.utils import rearrange_episodes
+from radioco.users.models import UserProfile
+
+
+WORDS = (
+    'morning', 'evening', 'news', 'jazz', 'classic', 'hits', 'local', 'world',
+    'gossips', 'sports', 'culture', 'science', 'talk', 'wine', 'places',
+    'radio', 'music', 'politics', 'club', 'session', 'live', 'weekly',
+    'review', 'stories', 'kids', 'hour', 'underground', 'folk', 'electro')
+
+RUNTIMES = [datetime.timedelta(minutes=minutes) for minutes in (30, 60, 90, 120)]
+
+# rows built in memory and primary keys queried at once
+BATCH_SIZE = 500
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _html(rng, paragraphs):
+    return ''.join(
+        '<p>{:s} <strong>{:s}</strong>.</p>'.format(
+            _text(rng, 30).capitalize(), _text(rng, 2))
+        for _ in range(paragraphs))
+
+
+def _recurrences(rng, start):
+    """
+        Return a random recurrence starting in the year after start
+    """
+    dtstart = start + datetime.timedelta(
+        days=rng.randrange(365), hours=rng.randrange(24),
+        minutes=rng.choice((0, 30)))
+    kind = rng.random()
+    if kind < 0.4:
+        rule = recurrence.Rule(recurrence.DAILY)
+    elif kind < 0.7:
+        rule = recurrence.Rule(
+            recurrence.WEEKLY, interval=rng.choice((1, 1, 2)),
+            byday=sorted(rng.sample(range(7), rng.randint(1, 5))))
+    elif kind < 0.85:
+        rule = recurrence.Rule(
+            recurrence.MONTHLY, byday=recurrence.Weekday(
+                rng.randrange(7), rng.choice((1, 2, 3, -1))))
+    else:
+        rule = recurrence.Rule(
+            recurrence.MONTHLY, bymonthday=rng.randint(1, 28))
+    if rng.random() < 0.1:
+        rule.until = dtstart + datetime.timedelta(days=rng.randint(30, 2000))
+
+    exdates = [
+        dtstart + datetime.timedelta(days=rng.randrange(3000))
+        for _ in range(rng.choice((0, 0, 0, 1, 5, 50)))]
+    rdates = [
+        dtstart + datetime.timedelta(days=rng.randrange(3000), hours=rng.randrange(24))
+        for _ in range(rng.choice((0, 0, 0, 1, 3)))]
+    return recurrence.Recurrence(
+        dtstart=dtstart, rrules=[rule], exdates=exdates, rdates=rdates)
+
+
+def create_benchmark_data(programmes=500, schedules=2000, episodes=200000,
+                          podcasts=50000, users=200, seed=0, start=None,
+                          stdout=None):
+    """
+        Create a large station with random but reproducible data
+
+        Rows are created in bulk, so no signals are sent: slugs, profiles,
+        occurrence windows, feed items and the search index are created here.
+    """
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    rng = random.Random(seed)
+    if start is None:
+        start = timezone.make_aware(datetime.datetime(2015, 1, 1))
+
+    with transaction.atomic():
+        log('Creating {:d} users'.format(users))
+        User.objects.bulk_create([
+            User(username='benchmark_{:05d}'.format(number),
+                 first_name=_text(rng, 1).capitalize(),
+                 last_name=_text(rng, 1).capitalize())
+            for number in range(users)])
+        user_ids = list(User.objects.filter(
+            username__startswith='benchmark_').values_list('pk', 'username'))
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=pk, slug=slugify(username), bio=_html(rng, 1))
+            for pk, username in user_ids])
+
+        log('Creating {:d} programmes'.format(programmes))
+        names = ['Benchmark {:05d} {:s}'.format(number, _text(rng, 2).title())
+                 for number in range(programmes)]
+        Programme.objects.bulk_create([
+            Programme(
+                name=name, slug=slugify(name), synopsis=_html(rng, 2),
+                language=rng.choice(PROGRAMME_LANGUAGES)[0],
+                category=rng.choice(Programme.CATEGORY_CHOICES)[0],
+                current_season=rng.randint(1, 5))
+            for name in names])
+        programme_objects = list(Programme.objects.filter(name__in=names).order_by('name'))
+
+        Slot.objects.bulk_create([
+            Slot(programme=programme, runtime=rng.choice(RUNTIMES))
+            for programme in programme_objects])
+        slot_ids = list(Slot.objects.filter(
+            programme__in=programme_objects).values_list('pk', flat=True))
+
+        log('Creating {:d} schedules'.format(schedules))
+        batch = []
+        for _ in range(schedules):
+            schedule = Schedule(
+                slot_id=rng.choice(slot_ids),
+                type=rng.choice('LLLBR'),
+                recurrences=_recurrences(rng, start))
+            schedule.first_occurrence, schedule.last_occurrence = occurrence_window(
+                schedule.recurrences)
+            batch.append(schedule)
+        Schedule.objects.bulk_create(batch)
+
+        log('Creating roles')
+        Role.objects.bulk_create([
+            Role(person_id=pk, programme=programme, role=role,
+                 description=_text(rng, 8))
+            for programme in programme_objects
+            for (pk, username), role in zip(
+                rng.sample(user_ids, min(len(user_ids), rng.randint(1, 3))),
+                rng.sample([code for code, name in ROLES], 3))])
+
+        log('Creating {:d} episodes'.format(episodes))
+        per_programme = max(episodes // max(programmes, 1), 1)
+        batch = []
+        for programme in programme_objects:
+            season, number = 1, 0
+            first = start + datetime.timedelta(hours=rng.randrange(24))
+            for index in range(per_programme):
+                number += 1
+                if number > 30:
+                    season, number = season + 1, 1
+                # the newest episodes aren't scheduled yet
+                issue_date = None
+                if index < per_programme * 0.7:
+                    issue_date = first + datetime.timedelta(days=index)
+                batch.append(Episode(
+                    programme=programme, season=season, number_in_season=number,
+                    title=rng.choice((None, 'Episode {:d}'.format(number), _text(rng, 4))),
+                    summary=_html(rng, 1), issue_date=issue_date))
+            if len(batch) >= BATCH_SIZE:
+                Episode.objects.bulk_create(batch)
+                batch = []
+        Episode.objects.bulk_create(batch)
+
+        log('Creating {:d} podcasts'.format(podcasts))
+        issued = list(Episode.objects.filter(
+            programme__in=programme_objects, issue_date__isnull=False
+        ).values_list('pk', flat=True))
+        issued = sorted(rng.sample(issued, min(podcasts, len(issued))))
+        for offset in range(0, len(issued), BATCH_SIZE):
+            batch = []
+            for episode in Episode.objects.filter(
+                    pk__in=issued[offset:offset + BATCH_SIZE]).select_related('programme'):
+                podcast = Podcast(
+                    episode=episode,
+                    url='http://example.com/{:s}_{:d}x{:d}.mp3'.format(
+                        episode.programme.slug, episode.season,
+                        episode.number_in_season),
+                    mime_type='audio/mpeg', length=rng.randint(10 ** 6, 10 ** 8),
+                    duration=rng.randint(1200, 7200))
+                podcast.item_xml = render_item(podcast)
+                batch.append(podcast)
+            Podcast.objects.bulk_create(batch)
+
+        log('Indexing')
+        rebuild_index(Programme.objects.all(), Episode.objects.all())
+    cache.clear()
+
+
+BenchmarkResult = collections.namedtuple(
+    'BenchmarkResult',
+    ('name', 'cold_time', 'cold_queries', 'warm_time', 'warm_queries'))
+
+
+def _host():
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def _client():
+    return Client(HTTP_HOST=_host())
+
+
+def _get(client, url, **params):
+    def get():
+        response = client.get(url, params)
+        if response.status_code != 200:
+            raise AssertionError('{:s} returned {:d}'.format(url, response.status_code))
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+    return get
+
+
+def _render(renderer, at, until):
+    data = []
+
+    def render():
+        # serialized on the first run, only rendering is timed after it
+        if not data:
+            request = Request(APIRequestFactory().get(
+                '/api/2/transmissions', HTTP_HOST=_host()))
+            data.append(TransmissionSerializer(
+                Transmission.between(at, until), many=True,
+                context={'request': request}).data)
+        return renderer.render(data[0])
+    return render
+
+
+def benchmarks(at):
+    """
+        Yields (name, callable) of every benchmark
+
+        at is the date the schedules are looked at.
+    """
+    week = datetime.timedelta(days=7)
+    programme = Programme.objects.order_by('pk').first()
+    episode = Episode.objects.order_by('pk').first()
+    client = _client()
+
+    yield 'Transmission.between (1 day)', lambda: list(
+        Transmission.between(at, at + datetime.timedelta(days=1)))
+    yield 'Transmission.between (1 week)', lambda: list(
+        Transmission.between(at, at + week))
+    yield 'Transmission.at', lambda: list(Transmission.at(at))
+    if programme is not None:
+        yield 'rearrange_episodes', lambda: rearrange_episodes(programme, at)
+
+    yield 'GET /api/2/programmes', _get(client, '/api/2/programmes')
+    yield 'GET /api/2/slots', _get(client, '/api/2/slots')
+    yield 'GET /api/2/schedules', _get(client, '/api/2/schedules')
+    yield 'GET /api/2/episodes', _get(client, '/api/2/episodes')
+    yield 'GET /api/2/transmissions (1 week)', _get(
+        client, '/api/2/transmissions',
+        after=at.isoformat(), before=(at + week).isoformat())
+    yield 'JSONRenderer /api/2/transmissions (1 week)', _render(
+        JSONRenderer(), at, at + week)
+    yield 'FastJSONRenderer /api/2/transmissions (1 week)', _render(
+        FastJSONRenderer(), at, at + week)
+    yield 'GET /api/2/transmissions/now', _get(client, '/api/2/transmissions/now')
+    yield 'GET /api/2/search', _get(client, '/api/2/search', q='classic hits')
+    yield 'GET /api/2/recorder/manifest', _get(client, '/api/2/recorder/manifest')
+    yield 'GET /api/2/rss', _get(client, '/api/2/rss')
+    if programme is not None:
+        yield 'GET /api/2/programmes/<slug>', _get(
+            client, '/api/2/programmes/{:s}'.format(programme.slug))
+        yield 'GET /api/2/programmes/<slug>/rss', _get(
+            client, '/api/2/programmes/{:s}/rss'.format(programme.slug))
+    if episode is not None:
+        yield 'GET /api/2/episodes/<pk>', _get(
+            client, '/api/2/episodes/{:d}'.format(episode.pk))
+
+
+def run_benchmark(name, function, runs=5):
+    """
+        Time function with cold caches once, then runs - 1 times more
+
+        Changes to the database are rolled back after every run.
+    """
+    timings = []
+    # large pages run more queries than the debug cursor keeps by default
+    queries_log, connection.queries_log = connection.queries_log, collections.deque()
+    try:
+        for run in range(runs):
+            if run == 0:
+                cache.clear()
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    function()
+                    elapsed = time.perf_counter() - started
+                timings.append((elapsed, len(queries)))
+                transaction.set_rollback(True)
+    finally:
+        connection.queries_log = queries_log
+    cold_time, cold_queries = timings[0]
+    warm = timings[1:] or timings
+    return BenchmarkResult(
+        name, cold_time, cold_queries,
+        statistics.median(timing for timing, queries in warm),
+        max(queries for timing, queries in warm))
+
+
+def run_benchmarks(at=None, runs=5, names=None):
+    """
+        Yields a BenchmarkResult for every benchmark whose name contains
+        one of names, or every benchmark
+    """
+    if at is None:
+        at = timezone.now()
+    for name, function in benchmarks(at):
+        if names and not any(part in name for part in names):
+            continue
+        yield run_benchmark(name, function, runs)
+
+
+MemoryResult = collections.namedtuple(
+    'MemoryResult', ('name', 'count', 'retained', 'peak'))
+
+
+def memory_benchmarks(at):
+    """
+        Yields (name, callable) of every benchmark measuring the memory of
+        the list it returns
+    """
+    year = datetime.timedelta(days=365)
+    yield 'Transmission.between (1 year)', lambda: list(
+        Transmission.between(at, at + year))
+
+
+def measure_memory(name, function):
+    """
+        Return the memory retained by the result of function and the peak
+        while running it, traced with tracemalloc
+    """
+    # the debug cursor would keep every query
+    queries_log, connection.queries_log = connection.queries_log, collections.deque(maxlen=0)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with transaction.atomic():
+            result = function()
+            retained, peak = tracemalloc.get_traced_memory()
+            transaction.set_rollback(True)
+    finally:
+        tracemalloc.stop()
+        connection.queries_log = queries_log
+    return MemoryResult(name, len(result), retained, peak)
+
+
+def run_memory_benchmarks(at=None, names=None):
+    """
+        Yields a MemoryResult for every memory benchmark whose name contains
+        one of names, or every memory benchmark
+    """
+    if at is None:
+        at = timezone.now()
+    for name, function in memory_benchmarks(at):
+        if names and not any(part in name for part in names):
+            continue
+        yield measure_memory(name, function)
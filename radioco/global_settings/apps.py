@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class GlobalSettings(AppConfig):
+    name = 'radioco.global_settings'
+
+    def ready(self):
+        from radioco.global_settings.models import provision_recorder_on_migrate
+        post_migrate.connect(provision_recorder_on_migrate, sender=self)
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from radioco.global_settings.models import provision_recorder
+
+
+class Command(BaseCommand):
+    help = 'Create the user and the API token of the recorder program'
+
+    def handle(self, *args, **options):
+        if not hasattr(settings, 'USERNAME_RADIOCO_RECORDER'):
+            raise CommandError(
+                'Variable USERNAME_RADIOCO_RECORDER doesn\'t exist in your settings file')
+        self.stdout.write(provision_recorder())
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 13:03
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('global_settings', '0007_auto_20180317_2251'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='podcastconfiguration',
+            name='feed_items',
+            field=models.PositiveIntegerField(default=50, help_text='Maximum number of podcasts in a feed. Older podcasts are available in the feed archive', validators=[django.core.validators.MinValueValidator(1)], verbose_name='feed items'),
+        ),
+    ]
@@ -15,15 +15,25 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import copy
 import datetime
 
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Permission, User
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.translation import ugettext as _u
 from django.utils.translation import ugettext_lazy as _
 from rest_framework.authtoken.models import Token
 
+from radioco.cache import bump_generation, get_generation, is_shared, shared_cache
+
+
+# (version, instance) of every singleton model, per process
+_singletons = {}
+
 
 class SingletonModelManager(models.Manager):
     def get(self, *args, **kwargs):
@@ -37,14 +47,36 @@ class SingletonModel(models.Model):
     def save(self, *args, **kwargs):
         self.pk = 1
         super(SingletonModel, self).save(*args, **kwargs)
+        bump_generation(self.version_key())
 
     def delete(self, *args, **kwargs):
         pass
 
+    @classmethod
+    def version_key(cls):
+        return 'singleton-version:{:s}'.format(cls._meta.label_lower)
+
     @classmethod
     def get_global(cls):
-        obj, created = cls.objects.get_or_create(pk=1)
-        return obj
+        """
+            Return the configuration without querying the database, unless it
+            was saved since this process last read it
+
+            Without a shared cache, saves in other processes aren't seen and
+            the database is always queried.
+        """
+        if not is_shared():
+            return cls.objects.get_or_create(pk=1)[0]
+        version = get_generation(cls.version_key())
+        cached = _singletons.get(cls)
+        if cached is None or cached[0] != version:
+            obj, created = cls.objects.get_or_create(pk=1)
+            if created:
+                # creating it saved a new version
+                version = get_generation(cls.version_key())
+            cached = _singletons[cls] = (version, obj)
+        # callers may modify their copy
+        return copy.copy(cached[1])
 
     class Meta:
         abstract = True
@@ -89,19 +121,19 @@ class PodcastConfiguration(SingletonModel):
         default=32, verbose_name=_("next events"),
         help_text=_("In hours. The next events supplied to the recorder program")
     )
+    feed_items = models.PositiveIntegerField(
+        default=50, validators=[MinValueValidator(1)], verbose_name=_("feed items"),
+        help_text=_("Maximum number of podcasts in a feed. Older podcasts are available in the feed archive")
+    )
 
     @property
     def recorder_token(self):
-        if hasattr(settings, 'USERNAME_RADIOCO_RECORDER'):
-            username = settings.USERNAME_RADIOCO_RECORDER
-            user, created = User.objects.get_or_create(username=username)
-            if created:
-                user.set_password(User.objects.make_random_password())
-                user.save()
-            token, created = Token.objects.get_or_create(user=user)
-            return token.key
-        else:
+        if not hasattr(settings, 'USERNAME_RADIOCO_RECORDER'):
             return _('Variable USERNAME_RADIOCO_RECORDER doesn\'t exist in your settings file')
+        key = recorder_token_key()
+        if key is None:
+            return _('Run "python manage.py provision_recorder" to create the recorder token')
+        return key
 
     def __unicode__(self):
         # In django 1.7 we can't use lazy
@@ -113,6 +145,57 @@ class PodcastConfiguration(SingletonModel):
         verbose_name_plural = _('Podcast Configuration')
 
 
+def _recorder_token_cache_key():
+    return 'recorder-token:{:s}'.format(settings.USERNAME_RADIOCO_RECORDER)
+
+
+def provision_recorder():
+    """
+        Create the recorder user and its token, if they don't exist yet, and
+        return the token key
+
+        The recorder is allowed to publish podcasts.
+    """
+    user, created = User.objects.get_or_create(
+        username=settings.USERNAME_RADIOCO_RECORDER)
+    if created:
+        user.set_password(User.objects.make_random_password())
+        user.save()
+    user.user_permissions.add(*Permission.objects.filter(
+        content_type__app_label='programmes',
+        codename__in=('add_podcast', 'change_podcast')))
+    token, created = Token.objects.get_or_create(user=user)
+    shared_cache.set(_recorder_token_cache_key(), token.key, None)
+    return token.key
+
+
+def provision_recorder_on_migrate(**kwargs):
+    # new and upgraded installations get the recorder and its permissions
+    if hasattr(settings, 'USERNAME_RADIOCO_RECORDER'):
+        provision_recorder()
+
+
+def recorder_token_key():
+    """
+        Return the key of the provisioned recorder token, or None
+    """
+    key = shared_cache.get(_recorder_token_cache_key())
+    if key is None:
+        key = Token.objects.filter(
+            user__username=settings.USERNAME_RADIOCO_RECORDER
+        ).values_list('key', flat=True).first()
+        # a missing token is cached too, as an empty key
+        shared_cache.set(_recorder_token_cache_key(), key or '', None)
+    return key or None
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_recorder_token(**kwargs):
+    if hasattr(settings, 'USERNAME_RADIOCO_RECORDER'):
+        shared_cache.delete(_recorder_token_cache_key())
+
+
 class CalendarConfiguration(SingletonModel):
     MO = 0
     TU = 1
@@ -0,0 +1,130 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+from rest_framework.authtoken.models import Token
+
+from radioco.cache import get_generation
+from radioco.global_settings import models
+from radioco.global_settings.models import (
+    CalendarConfiguration, PodcastConfiguration, SiteConfiguration)
+
+
+class SingletonModelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # a new generation may collide with the one of a previous test
+        models._singletons.clear()
+
+    def test_get_global_cached(self):
+        SiteConfiguration.get_global()
+        with self.assertNumQueries(0):
+            self.assertEqual(SiteConfiguration.get_global().site_name, 'RadioCo')
+
+    def test_get_global_saved(self):
+        site_configuration = SiteConfiguration.get_global()
+        site_configuration.site_name = 'Radio Corax'
+        site_configuration.save()
+        self.assertEqual(SiteConfiguration.get_global().site_name, 'Radio Corax')
+
+    def test_get_global_saved_by_other_process(self):
+        SiteConfiguration.get_global()
+        SiteConfiguration.objects.filter(pk=1).update(site_name='Radio Corax')
+        models.bump_generation(SiteConfiguration.version_key())
+        self.assertEqual(SiteConfiguration.get_global().site_name, 'Radio Corax')
+
+    def test_get_global_copy(self):
+        SiteConfiguration.get_global().site_name = 'Radio Corax'
+        self.assertEqual(SiteConfiguration.get_global().site_name, 'RadioCo')
+
+    def test_get_global_per_model(self):
+        self.assertIsInstance(PodcastConfiguration.get_global(), PodcastConfiguration)
+        self.assertIsInstance(CalendarConfiguration.get_global(), CalendarConfiguration)
+        podcast_configuration = PodcastConfiguration.get_global()
+        podcast_configuration.save()
+        with self.assertNumQueries(0):
+            CalendarConfiguration.get_global()
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_get_global_without_shared_cache(self):
+        SiteConfiguration.get_global()
+        SiteConfiguration.objects.filter(pk=1).update(site_name='Radio Corax')
+        self.assertEqual(SiteConfiguration.get_global().site_name, 'Radio Corax')
+
+    def test_saved_bumped_on_commit(self):
+        version = get_generation(SiteConfiguration.version_key())
+        with mock.patch('radioco.cache.transaction.on_commit') as on_commit:
+            with transaction.atomic():
+                SiteConfiguration.get_global().save()
+        self.assertNotEqual(get_generation(SiteConfiguration.version_key()), version)
+        version = get_generation(SiteConfiguration.version_key())
+        # run by the commit
+        on_commit.call_args[0][0]()
+        self.assertNotEqual(get_generation(SiteConfiguration.version_key()), version)
+
+
+class RecorderTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_provisioned_by_migrate(self):
+        user = User.objects.get(username='RadioCo_Recorder')
+        self.assertTrue(Token.objects.filter(user=user).exists())
+        self.assertTrue(user.has_perms(['programmes.add_podcast', 'programmes.change_podcast']))
+
+    def test_not_provisioned(self):
+        Token.objects.all().delete()
+        podcast_configuration = PodcastConfiguration.get_global()
+        self.assertIn('provision_recorder', podcast_configuration.recorder_token)
+        with self.assertNumQueries(0):
+            self.assertIn('provision_recorder', podcast_configuration.recorder_token)
+
+    def test_provision(self):
+        out = StringIO()
+        call_command('provision_recorder', stdout=out)
+        token = Token.objects.get(user__username='RadioCo_Recorder')
+        self.assertEqual(out.getvalue().strip(), token.key)
+        podcast_configuration = PodcastConfiguration.get_global()
+        with self.assertNumQueries(0):
+            self.assertEqual(podcast_configuration.recorder_token, token.key)
+
+    def test_provision_twice(self):
+        self.assertEqual(models.provision_recorder(), models.provision_recorder())
+        self.assertEqual(Token.objects.count(), 1)
+
+    def test_provisioned_before_cache_cleared(self):
+        key = models.provision_recorder()
+        cache.clear()
+        podcast_configuration = PodcastConfiguration.get_global()
+        with self.assertNumQueries(1):
+            self.assertEqual(podcast_configuration.recorder_token, key)
+        with self.assertNumQueries(0):
+            self.assertEqual(podcast_configuration.recorder_token, key)
+
+    def test_token_regenerated(self):
+        models.provision_recorder()
+        Token.objects.all().delete()
+        key = Token.objects.create(
+            user=User.objects.get(username='RadioCo_Recorder')).key
+        self.assertEqual(PodcastConfiguration.get_global().recorder_token, key)
@@ -0,0 +1,140 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Process-local metrics in the Prometheus text format.
+
+Every process (e.g. every WSGI worker) keeps its own metrics, Prometheus
+aggregates them when it scrapes every process.
+"""
+
+
+import bisect
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _labels(labels):
+    return ','.join(
+        '{:s}="{:s}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in sorted(labels.items()))
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _labels(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, value
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # labels -> [count per bucket, sum]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        with _lock:
+            counts, total = self.values.get(key) or ([0] * len(self.buckets), 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = counts, total + value
+
+    def samples(self):
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + '_bucket', ','.join(
+                    filter(None, [key, 'le="{:s}"'.format(_format(bucket))])), cumulative
+            yield self.name + '_sum', key, total
+            yield self.name + '_count', key, cumulative
+
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append('# HELP {:s} {:s}'.format(metric.name, metric.help))
+            lines.append('# TYPE {:s} {:s}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('{:s}{:s} {:s}'.format(
+                    name, '{' + labels + '}' if labels else '', _format(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        for metric in _registry:
+            metric.values.clear()
+
+
+def _allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer {:s}'.format(token)):
+        return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    # not the loopback addresses, a reverse proxy on the same host sends
+    # every request from them
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'INTERNAL_IPS', ())
+
+
+def metrics_view(request):
+    """
+        The metrics of this process, for the METRICS_TOKEN bearer, staff
+        users and INTERNAL_IPS
+    """
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,160 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from radioco import metrics
+
+
+request_duration = metrics.Histogram(
+    'radioco_request_duration_seconds', 'Time spent per request.')
+db_queries = metrics.Histogram(
+    'radioco_request_db_queries', 'SQL queries per request.', metrics.COUNT_BUCKETS)
+db_duration = metrics.Histogram(
+    'radioco_request_db_duration_seconds', 'Time spent in SQL queries per request.')
+serialization_duration = metrics.Histogram(
+    'radioco_request_serialization_duration_seconds',
+    'Time spent rendering the response per request.')
+response_size = metrics.Histogram(
+    'radioco_response_size_bytes', 'Size of the response body.', metrics.SIZE_BUCKETS)
+
+_local = threading.local()
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0
+        self.serialization_time = 0
+
+
+class TimedCursor(object):
+    """
+        Cursor wrapper adding its queries to the stats of the current request
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.cursor.__exit__(*exc_info)
+
+    def _timed(self, method, *args):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - started
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+
+    def callproc(self, procname, params=None):
+        return self._timed(self.cursor.callproc, procname, params)
+
+
+def _timed_cursor(method):
+    def cursor(*args, **kwargs):
+        cursor = method(*args, **kwargs)
+        # chunked_cursor() may return an already timed cursor()
+        return cursor if isinstance(cursor, TimedCursor) else TimedCursor(cursor)
+    return cursor
+
+
+def _instrument(connection):
+    if getattr(connection, 'instrumented', False):
+        return
+    connection.cursor = _timed_cursor(connection.cursor)
+    connection.chunked_cursor = _timed_cursor(connection.chunked_cursor)
+    connection.instrumented = True
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    """
+        Record SQL queries, database time, rendering time and response size
+        of every view
+
+        The timings are added as Server-Timing header to the response and
+        to the histograms of radioco.metrics.
+    """
+
+    def process_request(self, request):
+        for connection in connections.all():
+            _instrument(connection)
+        _local.stats = RequestStats()
+
+    def process_template_response(self, request, response):
+        stats = getattr(_local, 'stats', None)
+        render = response.render
+
+        def timed_render():
+            started = time.perf_counter()
+            try:
+                return render()
+            finally:
+                if stats is not None:
+                    stats.serialization_time += time.perf_counter() - started
+
+        response.render = timed_render
+        return response
+
+    def process_response(self, request, response):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return response
+        del _local.stats
+
+        duration = time.perf_counter() - stats.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        if view == 'metrics':
+            return response
+
+        request_duration.observe(duration, view=view)
+        db_queries.observe(stats.queries, view=view)
+        db_duration.observe(stats.db_time, view=view)
+        serialization_duration.observe(stats.serialization_time, view=view)
+        if not response.streaming:
+            response_size.observe(len(response.content), view=view)
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur={:.1f};desc="{:d} queries"'.format(stats.db_time * 1000, stats.queries),
+            'render;dur={:.1f}'.format(stats.serialization_time * 1000),
+            'total;dur={:.1f}'.format(duration * 1000),
+        ])
+        return response
@@ -16,35 +16,226 @@
 
 
 import datetime
+import heapq
+import io
+import itertools
 
 from django.contrib.syndication.views import Feed
+from django.core.urlresolvers import reverse
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import feedgenerator
+from django.utils.six.moves.urllib.parse import urlsplit
+from django.utils.xmlutils import SimplerXMLGenerator
+from xml.sax.saxutils import escape
 
+from radioco.cache import (
+    bump_generation, get_generation, get_generations, shared_cache)
+from radioco.compression import load_response, store_response
+from radioco.global_settings.models import (
+    PodcastConfiguration, SiteConfiguration)
 from radioco.programmes.models import Programme, Podcast
 
 
+STATION_FEED_GENERATION_KEY = 'station-feed-generation'
+
+
+def feed_generation_key(programme_id):
+    return 'programme-feed-generation:{:d}'.format(programme_id)
+
+
+def invalidate_feed(programme_id):
+    bump_generation(feed_generation_key(programme_id))
+    bump_generation(STATION_FEED_GENERATION_KEY)
+
+
+def feed_podcasts(programme_id):
+    return Podcast.objects.filter(
+        episode__programme=programme_id,
+        episode__issue_date__isnull=False,
+    ).select_related('episode__programme')
+
+
+def _item_key(podcast):
+    return podcast.episode.issue_date, podcast.pk
+
+
+def _items_key(programme_id, size, generation):
+    return 'programme-feed-items:{:d}:{:d}:{:d}'.format(
+        programme_id, size, generation)
+
+
+def _station_items_key(size):
+    return 'station-feed-items:{:d}:{:d}'.format(
+        size, get_generation(STATION_FEED_GENERATION_KEY))
+
+
+def programmes_items(programme_ids, size):
+    """
+        Return the newest podcasts of every programme, using the item caches
+    """
+    generations = get_generations(
+        [feed_generation_key(pk) for pk in programme_ids])
+    keys = {
+        pk: _items_key(pk, size, generations[feed_generation_key(pk)])
+        for pk in programme_ids}
+    cached = shared_cache.get_many(keys.values())
+
+    items = {}
+    for pk, key in keys.items():
+        if key not in cached:
+            cached[key] = list(
+                feed_podcasts(pk).order_by('-episode__issue_date', '-pk')[:size])
+            shared_cache.set(key, cached[key], None)
+        items[pk] = cached[key]
+    return items
+
+
+def station_items(size):
+    """
+        Return the newest podcasts of the station
+
+        The per programme item lists are already sorted, a k-way merge of them
+        is enough to build the station list.
+    """
+    key = _station_items_key(size)
+    items = shared_cache.get(key)
+    if items is None:
+        programme_ids = list(Programme.objects.values_list('pk', flat=True))
+        merged = heapq.merge(
+            *programmes_items(programme_ids, size).values(),
+            key=_item_key, reverse=True)
+        items = list(itertools.islice(merged, size))
+        shared_cache.set(key, items, None)
+    return items
+
+
+def publish_feed_item(podcast):
+    """
+        Add a podcast newer than any other of its programme to the item caches
+
+        Only the cached lists are updated, nothing is rebuilt. A lost update
+        between concurrent publications is fixed on the next invalidation.
+    """
+    size = PodcastConfiguration.get_global().feed_items
+    programme_id = podcast.episode.programme_id
+    generation = get_generation(feed_generation_key(programme_id))
+
+    for key in (_items_key(programme_id, size, generation),
+                _station_items_key(size)):
+        items = shared_cache.get(key)
+        if items is None:
+            continue
+        items = [item for item in items if item.pk != podcast.pk]
+        items.append(podcast)
+        items.sort(key=_item_key, reverse=True)
+        shared_cache.set(key, items[:size], None)
+
+
+class FeedArchive(object):
+    """
+        RFC 5005 archive of a programme feed
+
+        Archive pages are numbered from the oldest podcast on, so a full page
+        doesn't change when new podcasts are published. The newest podcasts
+        are listed in the subscription document (page None).
+    """
+    def __init__(self, programme, size, page=None):
+        self.programme = programme
+        self.podcasts = feed_podcasts(programme.pk)
+        self.size = size
+        self.pages = self.podcasts.count() // size
+
+        if page is not None:
+            try:
+                page = int(page)
+            except ValueError:
+                raise Http404('Invalid feed page.')
+            if not 1 <= page <= self.pages:
+                raise Http404('Feed page does not exist.')
+        self.page = page
+
+    def items(self):
+        if self.page is None:
+            return programmes_items([self.programme.pk], self.size)[
+                self.programme.pk]
+
+        offset = (self.page - 1) * self.size
+        podcasts = self.podcasts.order_by(
+            'episode__issue_date', 'pk')[offset:offset + self.size]
+        return reversed(list(podcasts))
+
+
 class iTunesFeed(feedgenerator.Rss201rev2Feed):
     def __init__(self, title, link, description, language=None, author_email=None,
                  author_name=None, author_link=None, subtitle=None, categories=None,
                  feed_url=None, feed_copyright=None, feed_guid=None, ttl=None, **kwargs):
-        self.programme = kwargs['programme']
+        self.programme = kwargs.get('programme')
+        self.archive = kwargs.get('archive')
+        self.podcasts = kwargs.get('podcasts', ())
+        self.current_url = feed_url
+        if self.programme:
+            language = self.programme.language.lower()
+        if self.archive and self.archive.page:
+            feed_url = self.archive_url(self.archive.page)
         feedgenerator.Rss201rev2Feed.__init__(
-            self, title, link, description, self.programme.language.lower(), author_email, author_name,
+            self, title, link, description, language, author_email, author_name,
             author_link, subtitle, categories, feed_url, feed_copyright, feed_guid, ttl
         )
 
+    def archive_url(self, page):
+        return '{:s}?page={:d}'.format(self.current_url, page)
+
     def rss_attributes(self):
         attrs = super(iTunesFeed, self).rss_attributes()
         attrs['xmlns:itunes'] = 'http://www.itunes.com/dtds/podcast-1.0.dtd'
+        if self.archive:
+            attrs['xmlns:fh'] = 'http://purl.org/syndication/history/1.0'
         return attrs
 
     def add_root_elements(self, handler):
         super(iTunesFeed, self).add_root_elements(handler)
         handler.addQuickElement('itunes:explicit', 'clean')
-        handler.addQuickElement('itunes:summary', self.programme.synopsis)
-        if self.programme.category:
+        handler.addQuickElement('itunes:summary', self.feed['description'])
+        if self.programme and self.programme.category:
             handler.addQuickElement('itunes:category', self.programme.category)
+        if self.archive:
+            self.add_archive_elements(handler)
+
+    def add_archive_elements(self, handler):
+        page, pages = self.archive.page, self.archive.pages
+        if page is None:
+            if pages:
+                handler.addQuickElement('atom:link', None, {
+                    'rel': 'prev-archive', 'href': self.archive_url(pages)})
+            return
+
+        handler.addQuickElement('fh:archive', None)
+        handler.addQuickElement('atom:link', None, {
+            'rel': 'current', 'href': self.current_url})
+        if page > 1:
+            handler.addQuickElement('atom:link', None, {
+                'rel': 'prev-archive', 'href': self.archive_url(page - 1)})
+        if page < pages:
+            handler.addQuickElement('atom:link', None, {
+                'rel': 'next-archive', 'href': self.archive_url(page + 1)})
+
+    def write_items(self, handler):
+        super(iTunesFeed, self).write_items(handler)
+        if not self.podcasts:
+            return
+
+        link = '<link>' + escape(
+            '{0.scheme}://{0.netloc}'.format(urlsplit(self.current_url)))
+        for podcast in self.podcasts:
+            item_xml = podcast.item_xml or render_item(podcast)
+            # the fragments are trusted XML, written without escaping
+            handler.ignorableWhitespace(item_xml.replace('<link>', link, 1))
+
+    def latest_post_date(self):
+        if self.podcasts:
+            return max(podcast.episode.issue_date for podcast in self.podcasts)
+        return super(iTunesFeed, self).latest_post_date()
 
     def add_item_elements(self, handler, item):
         super(iTunesFeed, self).add_item_elements(handler, item)
@@ -55,12 +246,79 @@ class iTunesFeed(feedgenerator.Rss201rev2Feed):
         handler.addQuickElement("itunes:duration", str(datetime.timedelta(seconds=podcast.duration)))
 
 
-class ProgrammeFeed(Feed):
+def render_item(podcast):
+    """
+        Return the feed item XML of a podcast, stored as Podcast.item_xml
+    """
+    episode = podcast.episode
+    feed = iTunesFeed(title='', link='', description='')
+    feed.add_item(
+        title=episode,
+        # made absolute when the feed is written
+        link=episode.get_absolute_url(),
+        description=episode.summary,
+        pubdate=episode.issue_date,
+        enclosures=[feedgenerator.Enclosure(
+            podcast.url, str(podcast.length), podcast.mime_type)],
+        podcast=podcast)
+
+    stream = io.StringIO()
+    feed.write_items(SimplerXMLGenerator(stream, 'utf-8'))
+    return stream.getvalue()
+
+
+class PodcastFeed(Feed):
+    """
+        Feed of podcasts assembled from their pre-rendered items
+    """
+    def items(self, obj):
+        return ()
+
+    def podcasts(self, programme):
+        """
+            The newest podcasts of a programme, from the item cache
+        """
+        size = PodcastConfiguration.get_global().feed_items
+        return programmes_items([programme.pk], size)[programme.pk]
+
+    def feed_extra_kwargs(self, obj):
+        return {'podcasts': self.podcasts(obj)}
+
+
+class ProgrammeFeed(PodcastFeed):
+    def __call__(self, request, *args, **kwargs):
+        page = request.GET.get('page')
+        if page is None:
+            return super(ProgrammeFeed, self).__call__(request, *args, **kwargs)
+        try:
+            page = int(page)
+        except ValueError:
+            raise Http404('Invalid feed page.')
+
+        # archive pages are immutable until a podcast is edited or removed,
+        # they are cached compressed, per origin of their absolute links
+        programme_id = get_object_or_404(
+            Programme.objects.values_list('pk', flat=True), slug=kwargs['slug'])
+        key = 'programme-feed:{:s}://{:s}:{:d}:{:d}:{:d}:{:d}'.format(
+            request.scheme, request.get_host(), programme_id,
+            PodcastConfiguration.get_global().feed_items, page,
+            get_generation(feed_generation_key(programme_id)))
+        stored = shared_cache.get(key)
+        if stored is None:
+            stored = store_response(super(ProgrammeFeed, self).__call__(
+                request, *args, **kwargs))
+            shared_cache.set(key, stored, None)
+        return load_response(request, stored)
+
     def title(self, programme):
         return programme.name
 
     def get_object(self, request, slug):
         self.programme = get_object_or_404(Programme, slug=slug)
+        self.programme.archive = FeedArchive(
+            self.programme,
+            PodcastConfiguration.get_global().feed_items,
+            request.GET.get('page'))
         return self.programme
 
     def link(self, programme):
@@ -72,45 +330,37 @@ class ProgrammeFeed(Feed):
     # feed_copyright = podcast_config.copyright
 
     def feed_extra_kwargs(self, programme):
-        return {'programme': programme}
-
-    def items(self, programme):
-        return Podcast.objects.filter(
-            episode__programme=programme
-        ).order_by('-episode__issue_date').select_related('episode')
+        extra = super(ProgrammeFeed, self).feed_extra_kwargs(programme)
+        extra.update({'programme': programme, 'archive': programme.archive})
+        return extra
 
-    def item_title(self, podcast):
-        return podcast.episode
+    def podcasts(self, programme):
+        return list(programme.archive.items())
 
-    def item_description(self, podcast):
-        return podcast.episode.summary
 
-    def item_pubdate(self, podcast):
-        return podcast.episode.issue_date
+class RssProgrammeFeed(ProgrammeFeed):
+    feed_type = iTunesFeed
 
-    def item_enclosure_url(self, podcast):
-        return podcast.url
+    def description(self, programme):
+        return programme.synopsis
 
-    def item_enclosure_length(self, podcast):
-        return podcast.length
 
-    def item_enclosure_mime_type(self, podcast):
-        return podcast.mime_type
+class StationFeed(PodcastFeed):
+    def get_object(self, request):
+        return SiteConfiguration.get_global()
 
-    def item_keywords(self, podcast):
-        return podcast.keywords
+    def title(self, site_configuration):
+        return site_configuration.site_name
 
-    def item_extra_kwargs(self, podcast):
-        extra = {}
-        extra["podcast"] = podcast
-        return extra
+    def link(self, site_configuration):
+        return reverse('api:api-root')
 
+    def description(self, site_configuration):
+        return site_configuration.about_footer
 
-class RssProgrammeFeed(ProgrammeFeed):
-    feed_type = iTunesFeed
+    def podcasts(self, site_configuration):
+        return station_items(PodcastConfiguration.get_global().feed_items)
 
-    def item_guid(self, episode):
-        return None
 
-    def description(self, programme):
-        return programme.synopsis
+class RssStationFeed(StationFeed):
+    feed_type = iTunesFeed
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from radioco.programmes.recordings import import_recordings
+
+
+class Command(BaseCommand):
+    help = 'Create or update the podcasts of the recorded episodes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root', help='Directory of the recordings, PODCAST_RECORDINGS_ROOT by default')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of processes probing the recordings')
+        parser.add_argument(
+            '--interval', type=int, default=None,
+            help='Keep importing new recordings every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            podcasts = import_recordings(options['root'], workers=options['workers'])
+            for podcast in podcasts:
+                self.stdout.write(podcast.url)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
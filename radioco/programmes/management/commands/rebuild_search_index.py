@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from radioco.programmes.models import Episode, Programme
+from radioco.programmes.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of programmes and episodes'
+
+    def handle(self, *args, **options):
+        rebuild_index(Programme.objects.all(), Episode.objects.all())
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 13:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programmes', '0017_auto_20180317_2251'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='podcast',
+            name='item_xml',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
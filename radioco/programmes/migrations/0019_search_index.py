@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from radioco.programmes import search
+
+
+def create_index(apps, schema_editor):
+    Programme = apps.get_model('programmes', 'Programme')
+    Episode = apps.get_model('programmes', 'Episode')
+    alias = schema_editor.connection.alias
+    search.rebuild_index(
+        Programme.objects.using(alias).all(),
+        Episode.objects.using(alias).all(), alias)
+
+
+def drop_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        search.get_backend(schema_editor.connection).drop_index(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programmes', '0018_podcast_item_xml'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
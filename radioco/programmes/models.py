@@ -99,6 +99,9 @@ class Programme(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def get_absolute_url(self):
+        return reverse('api:programme-detail', args=[self.slug])
+
     def __str__(self):
         return u"%s" % (self.name)
 
@@ -140,6 +143,23 @@ class EpisodeManager(models.Manager):
         episodes = Episode.objects.filter(programme=programme)
         return episodes.order_by("-season", "-number_in_season").first()
 
+    def resolve(self, keys):
+        """
+            Return a dict of the episodes identified by (programme slug,
+            season, number in season) keys, in a single query
+        """
+        keys = set(keys)
+        episodes = Episode.objects.filter(
+            programme__slug__in={slug for slug, season, number in keys},
+            season__in={season for slug, season, number in keys},
+            number_in_season__in={number for slug, season, number in keys})
+        resolved = {}
+        for episode in episodes.select_related('programme'):
+            key = (episode.programme.slug, episode.season, episode.number_in_season)
+            if key in keys:
+                resolved[key] = episode
+        return resolved
+
     def unfinished(self, programme, after=None):
         if not after:
             after = timezone.now()
@@ -175,6 +195,9 @@ class Episode(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def get_absolute_url(self):
+        return reverse('api:episode-detail', args=[self.pk])
+
     def __str__(self):
         return u"{:d}x{:d} {:s}".format(self.season,
                                         self.number_in_season,
@@ -231,6 +254,8 @@ class Podcast(models.Model):
     mime_type = models.CharField(max_length=20)
     length = models.PositiveIntegerField()  # bytes
     duration = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    # pre-rendered feed item, see radioco.programmes.feeds.render_item
+    item_xml = models.TextField(blank=True, editable=False)
 
     def get_absolute_url(self):
         return self.episode.get_absolute_url()
@@ -0,0 +1,407 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Recordings of episodes and their podcasts.
+
+Recordings are named after their episode, see recording_name. Their length,
+duration and type are read from the file headers only, so probing a long
+recording doesn't read the whole file.
+"""
+
+
+import collections
+import concurrent.futures
+import math
+import os
+import re
+import struct
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils.six.moves.urllib.parse import quote, urlsplit
+from django.utils.six.moves.urllib.request import url2pathname
+
+from radioco.global_settings.models import PodcastConfiguration
+from radioco.programmes.feeds import invalidate_feed, render_item
+from radioco.programmes.models import Episode, Podcast
+
+
+RECORDING_NAME_RE = re.compile(
+    r'^(?P<slug>[-\w]+)_(?P<season>\d+)x(?P<number>\d+)\.\w+$')
+
+# how far the headers are searched for, and read back from the end of a file
+PROBE_WINDOW = 64 * 1024
+
+Recording = collections.namedtuple(
+    'Recording', ('path', 'length', 'duration', 'mime_type'))
+
+# sent by upsert_podcasts instead of the save signals of every podcast
+podcasts_upserted = Signal(providing_args=['programme_ids'])
+
+
+def recording_name(episode, extension=None):
+    name = '{:s}_{:d}x{:d}'.format(
+        episode.programme.slug, episode.season, episode.number_in_season)
+    if extension is None:
+        return name
+    return '{:s}.{:s}'.format(name, extension)
+
+
+def recordings_root():
+    """
+        Return the local directory of the recordings published at url_source
+    """
+    root = getattr(settings, 'PODCAST_RECORDINGS_ROOT', None)
+    if root:
+        return root
+
+    url_source = PodcastConfiguration.get_global().url_source
+    if url_source.startswith('file://'):
+        return url2pathname(urlsplit(url_source).path)
+    if url_source.startswith(settings.MEDIA_URL):
+        return os.path.join(
+            settings.MEDIA_ROOT, url_source[len(settings.MEDIA_URL):])
+    raise ImproperlyConfigured(
+        'Set PODCAST_RECORDINGS_ROOT to the local directory of {:s}'.format(
+            url_source or 'the recordings'))
+
+
+# MPEG audio, indexed by version bits and layer bits of the frame header
+MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+MPEG_LAYERS = {1: 3, 2: 2, 3: 1}
+MPEG_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG_SAMPLE_RATES = {
+    1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+
+
+def _mpeg_frame(header):
+    """
+        Return the properties of an MPEG audio frame header or None
+    """
+    b0, b1, b2, b3 = header
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = MPEG_VERSIONS.get((b1 >> 3) & 3)
+    layer = MPEG_LAYERS.get((b1 >> 1) & 3)
+    bitrate_index, sample_rate_index = b2 >> 4, (b2 >> 2) & 3
+    if not version or not layer or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = MPEG_BITRATES[(min(version, 2), layer)][bitrate_index] * 1000
+    sample_rate = MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples = 384
+        size = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        size = samples // 8 * bitrate // sample_rate + padding
+    mono = b3 >> 6 == 3
+    if version == 1:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    return {
+        'bitrate': bitrate, 'sample_rate': sample_rate, 'samples': samples,
+        'size': size, 'side_info': side_info}
+
+
+def _id3_size(data):
+    if data[:3] != b'ID3' or len(data) < 10:
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = size << 7 | byte & 0x7F
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def probe_mpeg(stream, length, offset):
+    stream.seek(offset)
+    data = stream.read(PROBE_WINDOW)
+    for position in range(len(data) - 4):
+        frame = _mpeg_frame(data[position:position + 4])
+        if frame is None:
+            continue
+        # a second frame right after the first one confirms the sync
+        following = data[position + frame['size']:position + frame['size'] + 4]
+        if len(following) == 4 and _mpeg_frame(following) is None:
+            continue
+        break
+    else:
+        return None
+
+    # VBR files announce their number of frames in a Xing or VBRI header
+    frames = None
+    xing = position + 4 + frame['side_info']
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags, = struct.unpack('>I', data[xing + 4:xing + 8])
+        if flags & 1:
+            frames, = struct.unpack('>I', data[xing + 8:xing + 12])
+    elif data[position + 36:position + 40] == b'VBRI':
+        frames, = struct.unpack('>I', data[position + 50:position + 54])
+    if frames:
+        return frames * frame['samples'] / frame['sample_rate']
+
+    audio = length - offset - position
+    stream.seek(max(length - 128, 0))
+    if stream.read(3) == b'TAG':
+        audio -= 128
+    return audio * 8 / frame['bitrate']
+
+
+def probe_ogg(stream, length, offset):
+    stream.seek(offset)
+    page = stream.read(PROBE_WINDOW)
+    if page[:4] != b'OggS':
+        return None
+    packet = page[27 + page[26]:]
+    if packet[:7] == b'\x01vorbis':
+        sample_rate, = struct.unpack('<I', packet[12:16])
+        pre_skip = 0
+    elif packet[:8] == b'OpusHead':
+        sample_rate = 48000
+        pre_skip, = struct.unpack('<H', packet[10:12])
+    else:
+        return None
+
+    # the granule position of the last page counts the samples
+    stream.seek(max(length - PROBE_WINDOW, offset))
+    tail = stream.read(PROBE_WINDOW)
+    position = tail.rfind(b'OggS')
+    while position >= 0:
+        granule, = struct.unpack('<q', tail[position + 6:position + 14])
+        if granule >= 0:
+            return (granule - pre_skip) / sample_rate
+        position = tail.rfind(b'OggS', 0, position)
+    return None
+
+
+def probe_flac(stream, length, offset):
+    stream.seek(offset + 4)
+    header = stream.read(4 + 34)
+    if len(header) < 38 or header[0] & 0x7F != 0:
+        return None
+    value, = struct.unpack('>Q', header[4 + 10:4 + 18])
+    sample_rate, samples = value >> 44, value & 0xFFFFFFFFF
+    if not sample_rate:
+        return None
+    return samples / sample_rate
+
+
+def probe_wave(stream, length, offset):
+    position, byte_rate = offset + 12, None
+    while position + 8 <= length:
+        stream.seek(position)
+        chunk, size = struct.unpack('<4sI', stream.read(8))
+        if chunk == b'fmt ':
+            byte_rate, = struct.unpack('<I', stream.read(12)[8:12])
+        elif chunk == b'data':
+            if size == 0xFFFFFFFF:
+                size = length - position - 8
+            return size / byte_rate if byte_rate else None
+        position += 8 + size + size % 2
+    return None
+
+
+def _atoms(stream, start, end):
+    position = start
+    while position + 8 <= end:
+        stream.seek(position)
+        size, kind = struct.unpack('>I4s', stream.read(8))
+        header = 8
+        if size == 1:
+            size, = struct.unpack('>Q', stream.read(8))
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            return
+        yield kind, position + header, position + size
+        position += size
+
+
+def probe_mp4(stream, length, offset):
+    for kind, start, end in _atoms(stream, offset, length):
+        if kind != b'moov':
+            continue
+        for kind, start, end in _atoms(stream, start, end):
+            if kind != b'mvhd':
+                continue
+            stream.seek(start)
+            version = stream.read(4)[0]
+            if version == 1:
+                timescale, duration = struct.unpack('>16xIQ', stream.read(28))
+            else:
+                timescale, duration = struct.unpack('>8xII', stream.read(16))
+            return duration / timescale if timescale else None
+    return None
+
+
+def _probe_format(head):
+    if head[:4] == b'OggS':
+        return probe_ogg, 'audio/ogg'
+    if head[:4] == b'fLaC':
+        return probe_flac, 'audio/flac'
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return probe_wave, 'audio/wav'
+    if head[4:8] == b'ftyp':
+        return probe_mp4, 'audio/mp4'
+    if _mpeg_frame(head[:4]) or head[:3] == b'ID3':
+        return probe_mpeg, 'audio/mpeg'
+    return None, None
+
+
+def probe(path):
+    """
+        Return a Recording with the properties of the file at path, or None
+        if it isn't a known audio file
+    """
+    length = os.path.getsize(path)
+    with open(path, 'rb') as stream:
+        head = stream.read(PROBE_WINDOW)
+        # ID3 tags may precede any audio format
+        offset = _id3_size(head)
+        if offset:
+            stream.seek(offset)
+            head = stream.read(12)
+        probe_format, mime_type = _probe_format(head)
+        if probe_format is None:
+            return None
+        try:
+            duration = probe_format(stream, length, offset)
+        except (struct.error, IndexError, ZeroDivisionError):
+            duration = None
+    if not duration or duration < 0:
+        return None
+    return Recording(path, length, max(int(math.ceil(duration)), 1), mime_type)
+
+
+def probe_all(paths, workers=None):
+    """
+        Probe the files at paths in a pool of processes
+
+        Yields a Recording for every audio file, in no particular order.
+    """
+    if workers == 1:
+        recordings = map(probe, paths)
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+        with executor:
+            recordings = list(executor.map(probe, paths, chunksize=16))
+    for recording in recordings:
+        if recording is not None:
+            yield recording
+
+
+def find_recordings(root):
+    """
+        Yields (path, (programme slug, season, number in season)) for every
+        recording below root
+    """
+    for directory, directories, files in os.walk(root):
+        for name in sorted(files):
+            match = RECORDING_NAME_RE.match(name)
+            if match:
+                key = (match.group('slug'), int(match.group('season')),
+                       int(match.group('number')))
+                yield os.path.join(directory, name), key
+
+
+def _recording_url(url_source, root, path):
+    return '{:s}/{:s}'.format(
+        url_source.rstrip('/'),
+        quote(os.path.relpath(path, root).replace(os.sep, '/')))
+
+
+def upsert_podcasts(podcasts):
+    """
+        Create or update podcasts in bulk
+
+        Save signals are not sent, podcasts_upserted is sent once instead. The
+        feed items are rendered here and the feeds of every affected programme
+        are invalidated once. The episodes of the podcasts must have their
+        programme loaded.
+    """
+    fields = ('url', 'mime_type', 'length', 'duration')
+    podcasts = {podcast.episode.pk: podcast for podcast in podcasts}
+    existing = {
+        values['pk']: values for values in Podcast.objects.filter(
+            pk__in=podcasts.keys()).values('pk', *fields)}
+
+    created, updated = [], []
+    for pk, podcast in podcasts.items():
+        values = existing.get(pk)
+        if values and all(
+                getattr(podcast, field) == values[field] for field in fields):
+            continue
+        podcast.item_xml = render_item(podcast)
+        (updated if values else created).append(podcast)
+
+    with transaction.atomic():
+        Podcast.objects.bulk_create(created)
+        for podcast in updated:
+            Podcast.objects.filter(pk=podcast.pk).update(
+                item_xml=podcast.item_xml,
+                **{field: getattr(podcast, field) for field in fields})
+
+    changed = created + updated
+    programme_ids = {podcast.episode.programme_id for podcast in changed}
+    for programme_id in programme_ids:
+        invalidate_feed(programme_id)
+    if programme_ids:
+        podcasts_upserted.send(sender=Podcast, programme_ids=programme_ids)
+    return changed
+
+
+def import_recordings(root=None, url_source=None, workers=None):
+    """
+        Create or update the podcasts of the recordings below root
+
+        Returns the created or updated podcasts.
+    """
+    root = root or recordings_root()
+    url_source = url_source or PodcastConfiguration.get_global().url_source
+    recordings = dict(find_recordings(root))
+    episodes = Episode.objects.resolve(recordings.values())
+
+    # unchanged files are not probed again
+    paths = {path: episodes[key] for path, key in recordings.items()
+             if key in episodes}
+    urls = {path: _recording_url(url_source, root, path) for path in paths}
+    lengths = dict(Podcast.objects.filter(
+        episode__in=paths.values()).values_list('url', 'length'))
+    to_probe = [path for path, url in urls.items()
+                if lengths.get(url) != os.path.getsize(path)]
+
+    return upsert_podcasts(
+        Podcast(episode=paths[recording.path],
+                url=urls[recording.path],
+                mime_type=recording.mime_type,
+                length=recording.length,
+                duration=recording.duration)
+        for recording in probe_all(to_probe, workers))
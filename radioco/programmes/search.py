@@ -0,0 +1,267 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Full-text search over programmes and episodes.
+
+The index is a SQLite FTS5 table or a PostgreSQL table with a tsvector
+column, depending on the database backend. Programmes and episodes share the
+index, a programme is stored at row 2 * pk and an episode at row 2 * pk + 1.
+Other backends fall back to unindexed LIKE queries.
+"""
+
+
+import html
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.html import strip_tags
+
+
+TABLE = 'programmes_search'
+
+PROGRAMME = 'programme'
+EPISODE = 'episode'
+
+
+def plain_text(value):
+    return html.unescape(strip_tags(value or ''))
+
+
+def _terms(query):
+    return re.findall(r'\w+', query)
+
+
+class SearchBackend(object):
+    def create_index(self, cursor):
+        pass
+
+    def drop_index(self, cursor):
+        pass
+
+    def index(self, cursor, row, title, body):
+        pass
+
+    def remove(self, cursor, row):
+        pass
+
+    def count(self, cursor, query):
+        from radioco.programmes.models import Episode, Programme
+        return (Programme.objects.filter(self._programmes(query)).count() +
+                Episode.objects.filter(self._episodes(query)).count())
+
+    def search(self, cursor, query, offset, limit):
+        """
+            Return a list of (row, score) tuples, the best matches first
+        """
+        from radioco.programmes.models import Episode, Programme
+        rows = [
+            _row(PROGRAMME, pk) for pk in Programme.objects.filter(
+                self._programmes(query)).order_by('name').values_list('pk', flat=True)
+        ] + [
+            _row(EPISODE, pk) for pk in Episode.objects.filter(
+                self._episodes(query)).order_by('-issue_date').values_list('pk', flat=True)
+        ]
+        return [(row, 0.0) for row in rows[offset:offset + limit]]
+
+    def _programmes(self, query):
+        condition = Q()
+        for term in _terms(query):
+            condition &= Q(name__icontains=term) | Q(synopsis__icontains=term)
+        return condition
+
+    def _episodes(self, query):
+        condition = Q()
+        for term in _terms(query):
+            condition &= Q(title__icontains=term) | Q(summary__icontains=term)
+        return condition
+
+
+class SQLiteSearchBackend(SearchBackend):
+    def create_index(self, cursor):
+        cursor.execute(
+            'CREATE VIRTUAL TABLE {:s} USING fts5('
+            'title, body, tokenize="unicode61 remove_diacritics 1")'.format(TABLE))
+
+    def drop_index(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS {:s}'.format(TABLE))
+
+    def index(self, cursor, row, title, body):
+        self.remove(cursor, row)
+        cursor.execute(
+            'INSERT INTO {:s} (rowid, title, body) VALUES (%s, %s, %s)'.format(TABLE),
+            [row, title, body])
+
+    def remove(self, cursor, row):
+        cursor.execute('DELETE FROM {:s} WHERE rowid = %s'.format(TABLE), [row])
+
+    def _match(self, query):
+        # every term is a quoted prefix, so user input is never an operator
+        return ' '.join('"{:s}"*'.format(term) for term in _terms(query))
+
+    def count(self, cursor, query):
+        cursor.execute(
+            'SELECT count(*) FROM {0:s} WHERE {0:s} MATCH %s'.format(TABLE),
+            [self._match(query)])
+        return cursor.fetchone()[0]
+
+    def search(self, cursor, query, offset, limit):
+        # bm25 is lower for better matches, titles weight more than bodies
+        cursor.execute(
+            'SELECT rowid, -bm25({0:s}, 10.0, 1.0) AS score FROM {0:s} '
+            'WHERE {0:s} MATCH %s ORDER BY score DESC, rowid LIMIT %s OFFSET %s'.format(TABLE),
+            [self._match(query), limit, offset])
+        return cursor.fetchall()
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    def create_index(self, cursor):
+        cursor.execute(
+            'CREATE TABLE {0:s} (id bigint PRIMARY KEY, document tsvector NOT NULL)'.format(TABLE))
+        cursor.execute(
+            'CREATE INDEX {0:s}_document ON {0:s} USING gin(document)'.format(TABLE))
+
+    def drop_index(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS {:s}'.format(TABLE))
+
+    def index(self, cursor, row, title, body):
+        # the simple configuration doesn't stem, programmes are multilingual
+        cursor.execute(
+            'INSERT INTO {:s} (id, document) VALUES (%s, '
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s), 'B')) "
+            'ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document'.format(TABLE),
+            [row, title, body])
+
+    def remove(self, cursor, row):
+        cursor.execute('DELETE FROM {:s} WHERE id = %s'.format(TABLE), [row])
+
+    def _tsquery(self, query):
+        return ' & '.join('{:s}:*'.format(term) for term in _terms(query))
+
+    def count(self, cursor, query):
+        cursor.execute(
+            "SELECT count(*) FROM {:s} WHERE document @@ to_tsquery('simple', %s)".format(TABLE),
+            [self._tsquery(query)])
+        return cursor.fetchone()[0]
+
+    def search(self, cursor, query, offset, limit):
+        cursor.execute(
+            'SELECT id, ts_rank(document, query) AS score '
+            "FROM {:s}, to_tsquery('simple', %s) query WHERE document @@ query "
+            'ORDER BY score DESC, id LIMIT %s OFFSET %s'.format(TABLE),
+            [self._tsquery(query), limit, offset])
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor, SearchBackend)()
+
+
+def _row(kind, pk):
+    return pk * 2 + (kind == EPISODE)
+
+
+def _kind(row):
+    return (EPISODE if row % 2 else PROGRAMME), row // 2
+
+
+def _documents(programmes, episodes):
+    for programme in programmes:
+        yield _row(PROGRAMME, programme.pk), programme.name, plain_text(programme.synopsis)
+    for episode in episodes:
+        yield _row(EPISODE, episode.pk), episode.title or '', plain_text(episode.summary)
+
+
+def update_index(programmes=(), episodes=(), using='default'):
+    connection = connections[using]
+    backend = get_backend(connection)
+    with connection.cursor() as cursor:
+        for row, title, body in _documents(programmes, episodes):
+            backend.index(cursor, row, title, body)
+
+
+def remove_from_index(kind, pk, using='default'):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        get_backend(connection).remove(cursor, _row(kind, pk))
+
+
+def rebuild_index(programmes, episodes, using='default'):
+    connection = connections[using]
+    backend = get_backend(connection)
+    with connection.cursor() as cursor:
+        backend.drop_index(cursor)
+        backend.create_index(cursor)
+    update_index(programmes.iterator(), episodes.iterator(), using)
+
+
+class SearchResults(object):
+    """
+        Lazy ranked search results, sliceable like a queryset
+
+        Items are (kind, object, score) tuples, only the requested slice is
+        fetched from the index and the database.
+    """
+
+    def __init__(self, query, using='default'):
+        self.query = query
+        self.using = using
+
+    def count(self):
+        if not _terms(self.query):
+            return 0
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            return get_backend(connection).count(cursor, self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        if index.stop is None or not _terms(self.query):
+            return []
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            hits = get_backend(connection).search(
+                cursor, self.query, offset, index.stop - offset)
+        return self._resolve(hits)
+
+    def _resolve(self, hits):
+        from radioco.programmes.models import Episode, Programme
+        hits = [(_kind(row), score) for row, score in hits]
+        pks = {PROGRAMME: [], EPISODE: []}
+        for (kind, pk), score in hits:
+            pks[kind].append(pk)
+        objects = {
+            PROGRAMME: Programme.objects.in_bulk(pks[PROGRAMME]) if pks[PROGRAMME] else {},
+            EPISODE: Episode.objects.select_related('programme').in_bulk(
+                pks[EPISODE]) if pks[EPISODE] else {},
+        }
+        return [
+            (kind, objects[kind][pk], score) for (kind, pk), score in hits
+            if pk in objects[kind]]
@@ -1,10 +1,78 @@
-from django.db.models.signals import pre_save
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.template.defaultfilters import slugify
 
-from radioco.programmes.models import Programme
+from radioco.programmes.feeds import (
+    invalidate_feed, publish_feed_item, render_item)
+from radioco.programmes.models import Episode, Podcast, Programme
+from radioco.programmes.search import (
+    EPISODE, PROGRAMME, remove_from_index, update_index)
 
 
 @receiver(pre_save, sender=Programme)
 def generate_slug(instance, **kwargs):
         instance.slug = slugify(instance.name)
+
+
+def refresh_items(podcasts):
+    for podcast in podcasts.select_related('episode__programme'):
+        Podcast.objects.filter(pk=podcast.pk).update(
+            item_xml=render_item(podcast))
+
+
+@receiver(post_save, sender=Programme)
+def invalidate_programme_feed(instance, **kwargs):
+    # untitled episodes are named after their programme
+    refresh_items(Podcast.objects.filter(
+        Q(episode__title=None) | Q(episode__title=''),
+        episode__programme=instance))
+    invalidate_feed(instance.pk)
+
+
+@receiver(post_save, sender=Episode)
+def invalidate_episode_feed(instance, **kwargs):
+    refresh_items(Podcast.objects.filter(episode=instance))
+    invalidate_feed(instance.programme_id)
+
+
+@receiver(pre_save, sender=Podcast)
+def render_podcast_item(instance, **kwargs):
+    instance.item_xml = render_item(instance)
+
+
+@receiver(post_save, sender=Podcast)
+def invalidate_podcast_feed(instance, created, **kwargs):
+    episode = instance.episode
+    if created and episode.issue_date and not Podcast.objects.filter(
+            episode__programme=episode.programme_id,
+            episode__issue_date__gt=episode.issue_date).exists():
+        # appended after the newest podcast, full archive pages are unchanged
+        publish_feed_item(instance)
+        return
+    invalidate_feed(episode.programme_id)
+
+
+@receiver(post_delete, sender=Podcast)
+def invalidate_deleted_podcast_feed(instance, **kwargs):
+    invalidate_feed(instance.episode.programme_id)
+
+
+@receiver(post_save, sender=Programme)
+def index_programme(instance, using, **kwargs):
+    update_index(programmes=[instance], using=using)
+
+
+@receiver(post_save, sender=Episode)
+def index_episode(instance, using, **kwargs):
+    update_index(episodes=[instance], using=using)
+
+
+@receiver(post_delete, sender=Programme)
+def remove_programme_from_index(instance, using, **kwargs):
+    remove_from_index(PROGRAMME, instance.pk, using)
+
+
+@receiver(post_delete, sender=Episode)
+def remove_episode_from_index(instance, using, **kwargs):
+    remove_from_index(EPISODE, instance.pk, using)
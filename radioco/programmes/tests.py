@@ -15,17 +15,33 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import gzip
 import mock
+import os
+import shutil
+import struct
+import tempfile
+import wave
+from xml.etree import ElementTree
 
 from django.contrib.admin.options import ModelAdmin
 from django.contrib.admin.sites import AdminSite
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
-from radioco.programmes.models import Programme, Episode, EpisodeManager
+from radioco.global_settings.models import PodcastConfiguration
+from radioco.programmes import feeds
+from radioco.programmes.models import (
+    Programme, Episode, EpisodeManager, Podcast)
+from radioco.programmes.recordings import (
+    import_recordings, probe, recordings_root)
 from radioco.test.utils import TestDataMixin, now
 
 
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+
 class ProgrammeModelTests(TestCase):
     @mock.patch('django.utils.timezone.now', now)
     def setUp(self):
@@ -149,3 +165,340 @@ class EpisodeModelTests(TestCase):
 
     def test_str(self):
         self.assertEqual(str(self.episode), "8x1 Test programme")
+
+
+class ProgrammeFeedTests(TestDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        podcast_configuration = PodcastConfiguration.objects.get()
+        podcast_configuration.feed_items = 2
+        podcast_configuration.save()
+
+        self.episodes = list(
+            self.programme.episode_set.order_by('issue_date')[:5])
+        for episode in self.episodes:
+            Podcast.objects.create(
+                episode=episode, url='http://example.com/podcast.mp3',
+                mime_type='audio/mp3', length=0, duration=3600)
+
+    def get_feed(self, **params):
+        response = self.client.get(
+            '/api/2/programmes/classic-hits/rss', params)
+        self.assertEqual(response.status_code, 200)
+        return ElementTree.fromstring(response.content).find('channel')
+
+    def get_items(self, channel):
+        return [item.find('pubDate').text for item in channel.findall('item')]
+
+    def get_links(self, channel):
+        return {
+            link.get('rel'): link.get('href')
+            for link in channel.findall(ATOM + 'link')}
+
+    def test_items_limit(self):
+        channel = self.get_feed()
+        self.assertListEqual(self.get_items(channel), [
+            'Mon, 05 Jan 2015 13:00:00 +0000',
+            'Sun, 04 Jan 2015 13:00:00 +0000'])
+
+    def test_prev_archive(self):
+        links = self.get_links(self.get_feed())
+        self.assertEqual(
+            links['prev-archive'],
+            'http://testserver/api/2/programmes/classic-hits/rss?page=2')
+        self.assertNotIn('current', links)
+
+    def test_archive_page(self):
+        channel = self.get_feed(page=1)
+        self.assertListEqual(self.get_items(channel), [
+            'Fri, 02 Jan 2015 13:00:00 +0000',
+            'Thu, 01 Jan 2015 13:00:00 +0000'])
+        self.assertIsNotNone(channel.find(
+            '{http://purl.org/syndication/history/1.0}archive'))
+
+    def test_archive_page_links(self):
+        links = self.get_links(self.get_feed(page=1))
+        self.assertDictEqual(links, {
+            'self': 'http://testserver/api/2/programmes/classic-hits/rss?page=1',
+            'current': 'http://testserver/api/2/programmes/classic-hits/rss',
+            'next-archive': 'http://testserver/api/2/programmes/classic-hits/rss?page=2'})
+
+    def test_incomplete_archive_page(self):
+        response = self.client.get(
+            '/api/2/programmes/classic-hits/rss', {'page': 3})
+        self.assertEqual(response.status_code, 404)
+
+    def test_item(self):
+        item = self.get_feed().find('item')
+        self.assertEqual(item.find('title').text, '1x5 Episode 5')
+        self.assertEqual(
+            item.find('link').text,
+            'http://testserver/api/2/episodes/{:d}'.format(
+                self.episodes[-1].pk))
+        self.assertEqual(
+            item.find('enclosure').attrib, {
+                'url': 'http://example.com/podcast.mp3',
+                'length': '0', 'type': 'audio/mp3'})
+        self.assertEqual(
+            item.find('{http://www.itunes.com/dtds/podcast-1.0.dtd}duration').text,
+            '1:00:00')
+
+    def test_invalid_archive_page(self):
+        response = self.client.get(
+            '/api/2/programmes/classic-hits/rss', {'page': 'last'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_archive_page_cached(self):
+        self.get_feed(page=1)
+        with self.assertNumQueries(1):
+            self.get_feed(page=1)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_without_cache(self):
+        self.assertEqual(len(self.get_items(self.get_feed())), 2)
+        self.assertEqual(len(self.get_items(self.get_feed(page=1))), 2)
+
+    def test_archive_page_compressed(self):
+        content = self.client.get(
+            '/api/2/programmes/classic-hits/rss', {'page': 1}).content
+        response = self.client.get(
+            '/api/2/programmes/classic-hits/rss', {'page': 1},
+            HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['Content-Type'].startswith('application/rss+xml'))
+        self.assertEqual(gzip.decompress(response.content), content)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'radio.example.com'])
+    def test_archive_page_cached_per_origin(self):
+        self.get_feed(page=1)
+        response = self.client.get(
+            '/api/2/programmes/classic-hits/rss', {'page': 1},
+            HTTP_HOST='radio.example.com', secure=True)
+        links = self.get_links(ElementTree.fromstring(response.content).find('channel'))
+        self.assertEqual(
+            links['self'], 'https://radio.example.com/api/2/programmes/classic-hits/rss?page=1')
+
+    def test_archive_page_unchanged_by_new_podcast(self):
+        self.get_feed(page=1)
+        episode = self.programme.episode_set.order_by('issue_date')[5]
+        Podcast.objects.create(
+            episode=episode, url='http://example.com/podcast.mp3',
+            mime_type='audio/mp3', length=0, duration=3600)
+        with self.assertNumQueries(1):
+            self.get_feed(page=1)
+
+    def test_archive_page_invalidated(self):
+        self.get_feed(page=1)
+        self.episodes[0].podcast.delete()
+        self.assertListEqual(self.get_items(self.get_feed(page=1)), [
+            'Sat, 03 Jan 2015 13:00:00 +0000',
+            'Fri, 02 Jan 2015 13:00:00 +0000'])
+
+    def test_default_podcasts(self):
+        self.assertListEqual(
+            feeds.PodcastFeed().podcasts(self.programme),
+            list(Podcast.objects.filter(
+                episode__in=self.episodes[-2:]).order_by('-episode__issue_date')))
+
+
+class StationFeedTests(TestDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        podcast_configuration = PodcastConfiguration.objects.get()
+        podcast_configuration.feed_items = 3
+        podcast_configuration.save()
+
+        for name in ('Classic hits', 'Local Gossips'):
+            episodes = Episode.objects.filter(
+                programme__name=name).order_by('issue_date')[:3]
+            for episode in episodes:
+                Podcast.objects.create(
+                    episode=episode, url='http://example.com/podcast.mp3',
+                    mime_type='audio/mp3', length=0, duration=3600)
+
+    def get_items(self):
+        response = self.client.get('/api/2/rss')
+        self.assertEqual(response.status_code, 200)
+        channel = ElementTree.fromstring(response.content).find('channel')
+        return [
+            (item.find('title').text, item.find('pubDate').text)
+            for item in channel.findall('item')]
+
+    def test_items(self):
+        self.assertListEqual(self.get_items(), [
+            ('1x3 Episode 3', 'Sat, 03 Jan 2015 13:00:00 +0000'),
+            ('1x3 Episode 3', 'Sat, 03 Jan 2015 12:00:00 +0000'),
+            ('1x2 Episode 2', 'Fri, 02 Jan 2015 13:00:00 +0000')])
+
+    def test_items_cached(self):
+        self.get_items()
+        with self.assertNumQueries(0):
+            self.get_items()
+
+    def test_publish_item(self):
+        self.get_items()
+        episode = self.programme.episode_set.order_by('issue_date')[3]
+        Podcast.objects.create(
+            episode=episode, url='http://example.com/podcast.mp3',
+            mime_type='audio/mp3', length=0, duration=3600)
+
+        with self.assertNumQueries(0):
+            items = self.get_items()
+        self.assertListEqual(items, [
+            ('1x4 Episode 4', 'Sun, 04 Jan 2015 13:00:00 +0000'),
+            ('1x3 Episode 3', 'Sat, 03 Jan 2015 13:00:00 +0000'),
+            ('1x3 Episode 3', 'Sat, 03 Jan 2015 12:00:00 +0000')])
+
+    def test_remove_item(self):
+        self.get_items()
+        Podcast.objects.get(
+            episode__programme=self.programme,
+            episode__number_in_season=3, episode__season=1).delete()
+        self.assertListEqual(self.get_items(), [
+            ('1x3 Episode 3', 'Sat, 03 Jan 2015 12:00:00 +0000'),
+            ('1x2 Episode 2', 'Fri, 02 Jan 2015 13:00:00 +0000'),
+            ('1x2 Episode 2', 'Fri, 02 Jan 2015 12:00:00 +0000')])
+
+
+class PodcastItemTests(TestDataMixin, TestCase):
+    def setUp(self):
+        self.podcast = Podcast.objects.create(
+            episode=self.episode, url='http://example.com/podcast.mp3',
+            mime_type='audio/mp3', length=0, duration=3600)
+
+    def test_item_xml(self):
+        self.assertTrue(self.podcast.item_xml.startswith(
+            '<item><title>1x1 Episode 1</title>'))
+
+    def test_item_xml_episode_saved(self):
+        self.episode.title = 'New title'
+        self.episode.save()
+        self.podcast.refresh_from_db()
+        self.assertTrue(self.podcast.item_xml.startswith(
+            '<item><title>1x1 New title</title>'))
+
+    def test_item_xml_programme_saved(self):
+        self.episode.title = None
+        self.episode.save()
+        self.programme.name = 'Classic hits forever'
+        self.programme.save()
+        self.podcast.refresh_from_db()
+        self.assertTrue(self.podcast.item_xml.startswith(
+            '<item><title>1x1 Classic hits forever</title>'))
+
+
+class RecordingTestsMixin(object):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def write_mpeg(self, name, frames):
+        # MPEG-1 layer III, 128 kbps, 44.1 kHz, 417 bytes per frame
+        frame = b'\xff\xfb\x90\x00' + b'\x00' * 413
+        return self.write(name, b'ID3\x03\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10 + frame * frames)
+
+    def write_wave(self, name, seconds):
+        path = os.path.join(self.root, name)
+        recording = wave.open(path, 'wb')
+        recording.setnchannels(1)
+        recording.setsampwidth(2)
+        recording.setframerate(8000)
+        recording.writeframes(b'\x00\x00' * 8000 * seconds)
+        recording.close()
+        return path
+
+
+class RecordingProbeTests(RecordingTestsMixin, TestCase):
+    def test_mpeg(self):
+        path = self.write_mpeg('recording.mp3', 1000)
+        recording = probe(path)
+        self.assertEqual(recording.mime_type, 'audio/mpeg')
+        self.assertEqual(recording.length, 20 + 417 * 1000)
+        self.assertEqual(recording.duration, 27)
+
+    def test_wave(self):
+        recording = probe(self.write_wave('recording.wav', 5))
+        self.assertEqual(recording.mime_type, 'audio/wav')
+        self.assertEqual(recording.duration, 5)
+
+    def test_flac(self):
+        streaminfo = b'\x00' * 10 + struct.pack(
+            '>Q', 44100 << 44 | 1 << 41 | 15 << 36 | 44100 * 90) + b'\x00' * 16
+        recording = probe(self.write(
+            'recording.flac', b'fLaC\x80\x00\x00\x22' + streaminfo))
+        self.assertEqual(recording.mime_type, 'audio/flac')
+        self.assertEqual(recording.duration, 90)
+
+    def test_unknown_format(self):
+        self.assertIsNone(probe(self.write('notes.txt', b'Not a recording')))
+
+
+class ImportRecordingsTests(RecordingTestsMixin, TestDataMixin, TestCase):
+    def setUp(self):
+        super(ImportRecordingsTests, self).setUp()
+        cache.clear()
+        self.url_source = 'http://example.com/recordings/'
+
+    def test_import(self):
+        self.write_wave('classic-hits_1x1.wav', 5)
+        self.write_mpeg('classic-hits_1x2.mp3', 1000)
+        self.write_wave('unknown-programme_1x1.wav', 5)
+        self.write('notes.txt', b'Not a recording')
+        import_recordings(self.root, self.url_source, workers=1)
+
+        podcasts = Podcast.objects.filter(
+            episode__programme=self.programme).order_by('episode__number_in_season')
+        self.assertListEqual(
+            [(podcast.url, podcast.mime_type, podcast.duration) for podcast in podcasts], [
+                ('http://example.com/recordings/classic-hits_1x1.wav', 'audio/wav', 5),
+                ('http://example.com/recordings/classic-hits_1x2.mp3', 'audio/mpeg', 27)])
+        self.assertTrue(podcasts[0].item_xml.startswith(
+            '<item><title>1x1 Episode 1</title>'))
+
+    def test_import_pool(self):
+        self.write_wave('classic-hits_1x1.wav', 5)
+        import_recordings(self.root, self.url_source, workers=2)
+        self.assertEqual(Podcast.objects.get(episode=self.episode).duration, 5)
+
+    def test_import_unchanged(self):
+        self.write_wave('classic-hits_1x1.wav', 5)
+        import_recordings(self.root, self.url_source, workers=1)
+        with mock.patch('radioco.programmes.recordings.probe') as probe_mock:
+            self.assertListEqual(
+                import_recordings(self.root, self.url_source, workers=1), [])
+        self.assertFalse(probe_mock.called)
+
+    def test_import_changed(self):
+        self.write_wave('classic-hits_1x1.wav', 5)
+        import_recordings(self.root, self.url_source, workers=1)
+        self.write_wave('classic-hits_1x1.wav', 7)
+        import_recordings(self.root, self.url_source, workers=1)
+        self.assertEqual(Podcast.objects.get(episode=self.episode).duration, 7)
+
+    def test_import_invalidates_feed(self):
+        url = '/api/2/programmes/classic-hits/rss'
+        self.assertEqual(len(ElementTree.fromstring(
+            self.client.get(url).content).findall('channel/item')), 0)
+        self.write_wave('classic-hits_1x1.wav', 5)
+        import_recordings(self.root, self.url_source, workers=1)
+        self.assertEqual(len(ElementTree.fromstring(
+            self.client.get(url).content).findall('channel/item')), 1)
+
+    @override_settings(MEDIA_ROOT='/srv/media', MEDIA_URL='/media/')
+    def test_recordings_root(self):
+        podcast_configuration = PodcastConfiguration.objects.get()
+        podcast_configuration.url_source = '/media/recordings/'
+        podcast_configuration.save()
+        self.assertEqual(recordings_root(), '/srv/media/recordings/')
+        with self.settings(PODCAST_RECORDINGS_ROOT='/srv/recordings'):
+            self.assertEqual(recordings_root(), '/srv/recordings')
@@ -15,8 +15,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from radioco.schedules.models import Schedule, Slot
-from django.contrib import admin
+import copy
+
+from django import forms
+from django.contrib import admin, messages
+from django.forms.models import construct_instance
+
+from radioco.schedules.conflicts import describe, find_conflicts
+from radioco.schedules.models import BlackoutPeriod, Schedule, Slot
 
 
 @admin.register(Slot)
@@ -29,9 +35,41 @@ class SlotAdmin(admin.ModelAdmin):
     name.admin_order_field = 'programme__name'
 
 
+class ScheduleAdminForm(forms.ModelForm):
+    class Meta:
+        model = Schedule
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super(ScheduleAdminForm, self).clean()
+        self.warnings = []
+        if self.errors:
+            return cleaned_data
+        schedule = construct_instance(
+            self, copy.copy(self.instance), self._meta.fields, self._meta.exclude)
+        conflicts = find_conflicts(schedule)
+        errors = [conflict for conflict in conflicts if conflict.is_error]
+        if errors:
+            raise forms.ValidationError(describe(errors))
+        self.warnings = describe(conflicts)
+        return cleaned_data
+
+
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
     change_list_template = "admin/schedules/calendar.html"
+    form = ScheduleAdminForm
+
+    def save_model(self, request, obj, form, change):
+        super(ScheduleAdmin, self).save_model(request, obj, form, change)
+        for warning in form.warnings:
+            messages.warning(request, warning)
 
     def has_add_permission(self, request):
         return False
+
+
+@admin.register(BlackoutPeriod)
+class BlackoutPeriodAdmin(admin.ModelAdmin):
+    list_display = ('start', 'end', 'programme', 'description')
+    list_filter = ('programme__name',)
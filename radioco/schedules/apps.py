@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class Schedules(AppConfig):
@@ -6,3 +7,6 @@ class Schedules(AppConfig):
 
     def ready(self):
         from radioco.schedules import signals
+        if getattr(settings, 'SCHEDULE_PROFILING', False):
+            from radioco.schedules import profiling
+            profiling.enable()
@@ -0,0 +1,139 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Overlapping transmissions.
+
+The occurrences of all schedules within a horizon are sorted once and swept
+in time order, keeping the transmissions still on air in a heap, so finding
+the conflicts takes O(n log n) plus the number of conflicts.
+"""
+
+
+import collections
+import copy
+import datetime
+import heapq
+
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+
+from radioco.schedules.models import Schedule
+
+
+HORIZON = datetime.timedelta(days=90)
+
+Occurrence = collections.namedtuple('Occurrence', ('start', 'end', 'schedule'))
+
+
+class Conflict(collections.namedtuple('Conflict', ('first', 'second'))):
+    """
+        Two overlapping occurrences, first starts before or with second
+    """
+
+    @property
+    def is_error(self):
+        # nobody can be live in two programmes at once
+        return self.first.schedule.type == self.second.schedule.type == Schedule.LIVE
+
+    def __str__(self):
+        return _('%(first)s on %(first_start)s overlaps %(second)s on %(second_start)s') % {
+            'first': self.first.schedule.slot.programme.name,
+            'first_start': timezone.localtime(self.first.start).strftime('%Y-%m-%d %H:%M'),
+            'second': self.second.schedule.slot.programme.name,
+            'second_start': timezone.localtime(self.second.start).strftime('%Y-%m-%d %H:%M'),
+        }
+
+
+def occurrences(schedules, after, before):
+    """
+        Yields the occurrences of schedules on air between after and before
+    """
+    for schedule in schedules:
+        runtime = schedule.runtime
+        for start in schedule.dates_between(after - runtime, before):
+            if start + runtime > after:
+                yield Occurrence(start, start + runtime, schedule)
+
+
+def sweep(occurrences):
+    """
+        Yields a Conflict for every pair of overlapping occurrences
+    """
+    on_air = []
+    for index, occurrence in enumerate(sorted(occurrences, key=lambda occurrence: occurrence.start)):
+        while on_air and on_air[0][0] <= occurrence.start:
+            heapq.heappop(on_air)
+        for end, other_index, other in on_air:
+            yield Conflict(other, occurrence)
+        heapq.heappush(on_air, (occurrence.end, index, occurrence))
+
+
+def find_conflicts(schedule, after=None, horizon=HORIZON):
+    """
+        Return the conflicts of schedule, which may be unsaved, with itself
+        and every other schedule from after, or now, until the horizon
+    """
+    if schedule.slot_id is None:
+        return []
+    if after is None:
+        after = timezone.now()
+    start = schedule.start
+    if start is not None and timezone.is_aware(start):
+        # recurrences are expanded in naive local time, like loaded ones
+        schedule = copy.copy(schedule)
+        schedule.recurrences = copy.deepcopy(schedule.recurrences)
+        schedule.start = timezone.make_naive(start)
+    elif start is not None:
+        start = timezone.make_aware(start)
+    if start is not None and start > after:
+        after = start
+    before = after + horizon
+    others = Schedule.objects.select_related('slot__programme')
+    if schedule.pk is not None:
+        others = others.exclude(pk=schedule.pk)
+    candidates = list(occurrences([schedule], after, before))
+    if not candidates:
+        return []
+    # others can only conflict while the schedule is on air
+    on_air = candidates[0].start, max(occurrence.end for occurrence in candidates)
+    others = occurrences(others.on_air(*on_air), *on_air)
+    return [
+        conflict for conflict in sweep(candidates + list(others))
+        if schedule in (conflict.first.schedule, conflict.second.schedule)]
+
+
+def describe(conflicts, limit=5):
+    """
+        Return messages for the first conflicts, and how many were left out
+    """
+    messages = [str(conflict) for conflict in conflicts[:limit]]
+    if len(conflicts) > limit:
+        messages.append(_('and %(count)d more overlaps') % {'count': len(conflicts) - limit})
+    return messages
+
+
+def audit_conflicts(after=None, horizon=HORIZON):
+    """
+        Return the conflicts between all schedules from after, or now, until
+        the horizon
+    """
+    if after is None:
+        after = timezone.now()
+    before = after + horizon
+    schedules = Schedule.objects.on_air(after, before).select_related('slot__programme')
+    return list(sweep(occurrences(schedules, after, before)))
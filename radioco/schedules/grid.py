@@ -0,0 +1,210 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The weekly grid of the public schedule page.
+
+A week is expanded once and cached as JSON, along with its compressed
+variants, under its ISO week and the schedule generation, which is bumped
+whenever a schedule, slot, programme or episode changes.
+"""
+
+
+import datetime
+import json
+import re
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from radioco.cache import bump_generation, get_generation, shared_cache
+from radioco.compression import IDENTITY, compress
+from radioco.schedules.models import Schedule, Transmission
+
+
+SCHEDULE_GENERATION_KEY = 'schedule-generation'
+WEEK_RE = re.compile(r'^(?P<year>\d{4})-W(?P<week>\d{2})$')
+GRID_TIMEOUT = 60 * 60 * 24 * 7
+# transmissions on air are looked up once per window
+ON_AIR_WINDOW = datetime.timedelta(hours=1)
+ON_AIR_TIMEOUT = 2 * 60 * 60
+
+
+def schedule_generation():
+    return get_generation(SCHEDULE_GENERATION_KEY)
+
+
+def invalidate_schedule():
+    bump_generation(SCHEDULE_GENERATION_KEY)
+
+
+def parse_week(value):
+    """
+        Return (year, week) of an ISO week like "2015-W02"
+    """
+    match = WEEK_RE.match(value)
+    if match is None:
+        raise ValueError('{:s} is not an ISO week like 2015-W02'.format(value))
+    year, week = int(match.group('year')), int(match.group('week'))
+    if not 1 <= week <= datetime.date(year, 12, 28).isocalendar()[1]:
+        raise ValueError('{:d} has no week {:d}'.format(year, week))
+    return year, week
+
+
+def current_week(now=None):
+    if now is None:
+        now = timezone.now()
+    year, week, weekday = timezone.localtime(now).isocalendar()
+    return year, week
+
+
+def week_range(year, week):
+    """
+        Return the local midnights of the monday of an ISO week and of the
+        next monday
+    """
+    january_4 = datetime.date(year, 1, 4)
+    monday = january_4 + datetime.timedelta(
+        days=-january_4.weekday(), weeks=week - 1)
+    return tuple(
+        timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+        for day in (monday, monday + datetime.timedelta(days=7)))
+
+
+def assign_columns(transmissions):
+    """
+        Sort transmissions and set the column of every transmission and the
+        number of columns of its group of overlapping transmissions
+    """
+    transmissions.sort(key=lambda transmission: (
+        transmission['start'], transmission['end'], transmission['programme']['name']))
+    group, ends, group_end = [], [], None
+    for transmission in transmissions:
+        if group_end is not None and transmission['start'] >= group_end:
+            for member in group:
+                member['columns'] = len(ends)
+            group, ends, group_end = [], [], None
+        for column, end in enumerate(ends):
+            if end <= transmission['start']:
+                break
+        else:
+            column = len(ends)
+            ends.append(None)
+        ends[column] = transmission['end']
+        transmission['column'] = column
+        group.append(transmission)
+        group_end = max(group_end or transmission['end'], transmission['end'])
+    for member in group:
+        member['columns'] = len(ends)
+    return transmissions
+
+
+def _transmission(transmission):
+    programme, episode = transmission.programme, transmission.episode
+    return {
+        'start': transmission.start,
+        'end': transmission.end,
+        'type': transmission.type,
+        'schedule': transmission.schedule.pk,
+        'programme': {
+            'name': programme.name,
+            'slug': programme.slug,
+            'category': programme.category,
+            'url': programme.get_absolute_url(),
+        },
+        'episode': episode and {
+            'title': episode.title,
+            'season': episode.season,
+            'number_in_season': episode.number_in_season,
+            'url': episode.get_absolute_url(),
+        },
+    }
+
+
+def build_week(year, week):
+    """
+        Return the grid of an ISO week
+    """
+    start, end = week_range(year, week)
+    schedules = Schedule.objects.between(start, end).select_related('slot__programme')
+    transmissions = assign_columns([
+        _transmission(transmission)
+        for transmission in Transmission.between(start, end, schedules=schedules)
+        if transmission.start < end])
+    return {
+        'week': '{:04d}-W{:02d}'.format(year, week),
+        'start': start,
+        'end': end,
+        'transmissions': transmissions,
+    }
+
+
+def week_grid_variants(year, week):
+    """
+        Return the grid of an ISO week as JSON per encoding, from the cache if
+        the schedules didn't change
+    """
+    key = 'schedule-grid:{:04d}-W{:02d}:{:d}'.format(year, week, schedule_generation())
+    variants = shared_cache.get(key)
+    if variants is None:
+        variants = compress(json.dumps(build_week(year, week), cls=DjangoJSONEncoder))
+        shared_cache.set(key, variants, GRID_TIMEOUT)
+    return variants
+
+
+def week_grid(year, week):
+    """
+        Return the grid of an ISO week as JSON
+    """
+    return week_grid_variants(year, week)[IDENTITY].decode('utf-8')
+
+
+def _on_air_window(start):
+    end = start + ON_AIR_WINDOW
+    occurrences = {
+        (transmission.schedule.pk, transmission.start): transmission.end
+        for transmission in Transmission.at(start)}
+    for transmission in Transmission.between(start, end):
+        if transmission.start < end:
+            occurrences[transmission.schedule.pk, transmission.start] = transmission.end
+    return sorted(
+        (start, end, schedule_id) for (schedule_id, start), end in occurrences.items())
+
+
+def on_air(at=None):
+    """
+        Return the transmissions on air at a date, now by default, sorted by
+        start
+
+        The occurrences on air during the window around at are cached, until
+        the schedules change.
+    """
+    if at is None:
+        at = timezone.now()
+    start = at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    key = 'on-air:{:%Y%m%dT%H}:{:d}'.format(start, schedule_generation())
+    occurrences = shared_cache.get(key)
+    if occurrences is None:
+        occurrences = _on_air_window(start)
+        shared_cache.set(key, occurrences, ON_AIR_TIMEOUT)
+    occurrences = [
+        (start, schedule_id) for start, end, schedule_id in occurrences if start <= at < end]
+    schedules = Schedule.objects.select_related('slot__programme').in_bulk(
+        [schedule_id for start, schedule_id in occurrences])
+    return [
+        Transmission._occurrence(schedules[schedule_id], start)
+        for start, schedule_id in occurrences if schedule_id in schedules]
@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from radioco.schedules.conflicts import HORIZON, audit_conflicts
+
+
+class Command(BaseCommand):
+    help = 'Report overlapping transmissions of all schedules'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--after', help='Start of the audited range, now by default')
+        parser.add_argument('--days', type=int, default=HORIZON.days)
+
+    def handle(self, *args, **options):
+        after = None
+        if options['after']:
+            after = parse_datetime(options['after'])
+            if timezone.is_naive(after):
+                after = timezone.make_aware(after)
+
+        conflicts = audit_conflicts(after, datetime.timedelta(days=options['days']))
+        for conflict in conflicts:
+            if conflict.is_error:
+                self.stdout.write(self.style.ERROR('ERROR   {!s}'.format(conflict)))
+            else:
+                self.stdout.write(self.style.WARNING('WARNING {!s}'.format(conflict)))
+        self.stdout.write('{:d} conflicts, {:d} between live schedules'.format(
+            len(conflicts), sum(conflict.is_error for conflict in conflicts)))
@@ -0,0 +1,47 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from radioco.schedules import profiling
+from radioco.schedules.models import Schedule, Transmission
+
+
+class Command(BaseCommand):
+    help = 'Time the recurrence expansion of every schedule and flag expensive recurrences'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--at', help='Start of the expanded range, now by default')
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument(
+            '--limit', type=int, default=20, help='Number of schedules reported')
+
+    def handle(self, *args, **options):
+        at = timezone.now()
+        if options['at']:
+            at = parse_datetime(options['at'])
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+        before = at + datetime.timedelta(days=options['days'])
+
+        schedules = list(Schedule.objects.select_related('slot__programme'))
+        profiling.reset()
+        with profiling.profiling():
+            list(Transmission.between(at, before, schedules=schedules))
+            for schedule in schedules:
+                schedule.date_before(at)
+                schedule.date_after(before)
+        stats = profiling.stats()
+
+        self.stdout.write('{:>8s} {:<30s} {:>6s} {:>12s} {:>10s}  {:s}'.format(
+            'schedule', 'programme', 'calls', 'occurrences', 'ms', 'problems'))
+        schedules.sort(key=lambda schedule: -stats[schedule.pk].seconds)
+        for schedule in schedules[:options['limit']]:
+            calls, occurrences, seconds = stats[schedule.pk]
+            self.stdout.write('{:>8d} {:<30s} {:>6d} {:>12d} {:>10.2f}  {:s}'.format(
+                schedule.pk, schedule.slot.programme.name[:30], calls, occurrences,
+                seconds * 1000, ', '.join(profiling.pathologies(schedule, at))))
+        self.stdout.write('{:d} schedules expanded in {:.1f} ms'.format(
+            len(schedules), sum(entry.seconds for entry in stats.values()) * 1000))
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 13:42
+from __future__ import unicode_literals
+
+import datetime
+
+import recurrence
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def occurrence_window(recurrences):
+    # a copy of radioco.schedules.models.occurrence_window at this migration
+    recurrences = recurrence.deserialize(recurrence.serialize(recurrences))
+    if recurrences.dtstart is None:
+        return None, None
+    first = timezone.make_aware(
+        min([recurrences.dtstart] + list(recurrences.rdates)), is_dst=False)
+    if any(rule.until is None and rule.count is None for rule in recurrences.rrules):
+        return first, None
+    # the original method, radioco.schedules.recurrence patches it
+    before = getattr(recurrence.Recurrence, '_before', recurrence.Recurrence.before)
+    last = before(recurrences, datetime.datetime(9999, 1, 1), inc=True)
+    if last is None:
+        return first, first
+    if timezone.is_naive(last):
+        last = timezone.make_aware(last, is_dst=False)
+    return first, last
+
+
+def compute_occurrence_windows(apps, schema_editor):
+    Schedule = apps.get_model('schedules', 'Schedule')
+    for schedule in Schedule.objects.all():
+        first_occurrence, last_occurrence = occurrence_window(schedule.recurrences)
+        Schedule.objects.filter(pk=schedule.pk).update(
+            first_occurrence=first_occurrence, last_occurrence=last_occurrence)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0008_auto_20180317_2251'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='first_occurrence',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='last_occurrence',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(compute_occurrence_windows, migrations.RunPython.noop),
+    ]
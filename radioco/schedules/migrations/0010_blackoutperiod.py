@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 13:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programmes', '0019_search_index'),
+        ('schedules', '0009_schedule_occurrence_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlackoutPeriod',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('description', models.CharField(blank=True, max_length=255, verbose_name='description')),
+                ('programme', models.ForeignKey(blank=True, help_text='Leave empty to suspend every programme.', null=True, on_delete=django.db.models.deletion.CASCADE, to='programmes.Programme', verbose_name='programme')),
+            ],
+            options={
+                'verbose_name': 'blackout period',
+                'verbose_name_plural': 'blackout periods',
+                'ordering': ['start'],
+            },
+        ),
+    ]
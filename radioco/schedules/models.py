@@ -15,11 +15,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import bisect
+import datetime
+
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from recurrence import deserialize, serialize
 from recurrence.fields import RecurrenceField
 
+from radioco.cache import bump_generation, get_generation, is_shared
 from radioco.programmes.models import Episode, Programme
 from radioco.schedules import recurrence
 
@@ -38,6 +45,177 @@ class Slot(models.Model):
         return "{:s} ({:s})".format(self.programme.name, str(self.runtime))
 
 
+BLACKOUT_GENERATION_KEY = 'blackout-generation'
+
+
+
+class _BlackoutsMemo(object):
+    """
+        The blackout periods known to this process, validated against the
+        shared generation once per request or batch of lookups
+    """
+    generation = None
+    checked = False
+    # periods per programme id, None for station-wide ones
+    periods = {}
+    # programme id per slot id, for slots of programmes with periods
+    programmes = {}
+    # Blackouts per programme id
+    cached = {}
+
+
+_blackouts = _BlackoutsMemo()
+
+
+class BlackoutPeriod(models.Model):
+    start = models.DateTimeField(verbose_name=_("start"))
+    end = models.DateTimeField(verbose_name=_("end"))
+    programme = models.ForeignKey(
+        Programme, blank=True, null=True, verbose_name=_("programme"),
+        help_text=_("Leave empty to suspend every programme."))
+    description = models.CharField(
+        blank=True, max_length=255, verbose_name=_("description"))
+
+    class Meta:
+        ordering = ['start']
+        verbose_name = _('blackout period')
+        verbose_name_plural = _('blackout periods')
+
+    def clean(self):
+        if self.start and self.end and self.end <= self.start:
+            raise ValidationError({'end': _('must be later than start')})
+
+    def __str__(self):
+        return ' - '.join([
+            timezone.localtime(self.start).strftime('%x %X'),
+            timezone.localtime(self.end).strftime('%x %X')])
+
+
+class Blackouts(object):
+    """
+        Sorted, non-overlapping blackout periods
+
+        Only occurrences starting inside a period are dropped, one starting
+        before a period and running into it is kept whole.
+    """
+
+    def __init__(self, periods):
+        self.starts, self.ends = [], []
+        for start, end in sorted(periods):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def covering(self, date):
+        """
+            Return the (start, end) of the period containing date, or None
+        """
+        index = bisect.bisect_right(self.starts, date) - 1
+        if index >= 0 and date < self.ends[index]:
+            return self.starts[index], self.ends[index]
+        return None
+
+
+def invalidate_blackouts():
+    bump_generation(BLACKOUT_GENERATION_KEY)
+    _blackouts.checked = False
+
+
+def recheck_blackouts(**kwargs):
+    """
+        Validate the known blackout periods again on the next lookup, at the
+        start of every request or batch of lookups
+    """
+    _blackouts.checked = False
+
+
+def _check_blackouts():
+    generation = get_generation(BLACKOUT_GENERATION_KEY)
+    # without a shared cache, periods changed by other processes aren't seen
+    if _blackouts.generation != generation or not is_shared():
+        periods = {}
+        for row in BlackoutPeriod.objects.values_list('programme_id', 'start', 'end'):
+            periods.setdefault(row[0], []).append(row[1:])
+        programme_ids = [programme_id for programme_id in periods if programme_id is not None]
+        _blackouts.programmes = dict(Slot.objects.filter(
+            programme__in=programme_ids).values_list('pk', 'programme'))
+        _blackouts.periods, _blackouts.cached = periods, {}
+        _blackouts.generation = generation
+    _blackouts.checked = True
+
+
+def blackouts(programme_id):
+    """
+        Return the Blackouts of a programme, including station-wide ones
+    """
+    if not _blackouts.checked:
+        _check_blackouts()
+    cached = _blackouts.cached
+    if programme_id not in cached:
+        periods = list(_blackouts.periods.get(None, []))
+        if programme_id is not None:
+            periods += _blackouts.periods.get(programme_id, [])
+        cached[programme_id] = Blackouts(periods)
+    return cached[programme_id]
+
+
+def slot_blackouts(slot_id):
+    """
+        Return the Blackouts of the programme of a slot, without loading it
+    """
+    if not _blackouts.checked:
+        _check_blackouts()
+    return blackouts(_blackouts.programmes.get(slot_id))
+
+
+def occurrence_window(recurrences):
+    """
+        Return the earliest possible and the last occurrence of recurrences,
+        None when it's unknown or unbounded
+    """
+    # naive local dates, as if loaded from the database
+    recurrences = deserialize(serialize(recurrences))
+    if recurrences.dtstart is None:
+        return None, None
+    # dates within a DST transition are resolved to standard time, the
+    # window only has to contain the occurrences
+    first = timezone.make_aware(
+        min([recurrences.dtstart] + list(recurrences.rdates)), is_dst=False)
+    if any(rule.until is None and rule.count is None for rule in recurrences.rrules):
+        return first, None
+    # unpatched, it returns a naive date
+    last = recurrences._before(datetime.datetime(9999, 1, 1), inc=True)
+    if last is None:
+        return first, first
+    return first, timezone.make_aware(last, is_dst=False)
+
+
+class ScheduleQuerySet(models.QuerySet):
+    def between(self, after, before):
+        """
+            Schedules with occurrences starting between after and before
+        """
+        return self.filter(
+            models.Q(first_occurrence__isnull=True) | models.Q(first_occurrence__lte=before),
+            models.Q(last_occurrence__isnull=True) | models.Q(last_occurrence__gte=after))
+
+    def on_air(self, after, before):
+        """
+            Schedules with occurrences on air between after and before
+        """
+        return self.filter(
+            models.Q(first_occurrence__isnull=True) | models.Q(first_occurrence__lte=before),
+            models.Q(last_occurrence__isnull=True) |
+            models.Q(last_occurrence__gt=models.ExpressionWrapper(
+                models.Value(after) - models.F('slot__runtime'),
+                output_field=models.DateTimeField())))
+
+
 class Schedule(models.Model):
     LIVE = 'L'
     BROADCAST = 'B'
@@ -62,6 +240,13 @@ class Schedule(models.Model):
         on_delete=models.SET_NULL,
         verbose_name=_("source"),
         help_text=_("It is used when is a broadcast."))
+    # denormalized from recurrences to skip finished schedules in SQL
+    first_occurrence = models.DateTimeField(
+        blank=True, null=True, editable=False, db_index=True)
+    last_occurrence = models.DateTimeField(
+        blank=True, null=True, editable=False, db_index=True)
+
+    objects = ScheduleQuerySet.as_manager()
 
     @property
     def runtime(self):
@@ -81,17 +266,42 @@ class Schedule(models.Model):
             return None
         return self.start + self.runtime
 
+    def save(self, *args, **kwargs):
+        self.first_occurrence, self.last_occurrence = occurrence_window(self.recurrences)
+        super(Schedule, self).save(*args, **kwargs)
+
+    def blackouts(self):
+        return slot_blackouts(self.slot_id)
+
     def dates_between(self, after, before):
         """
             Return a sorted list of dates between after and before
         """
-        return self.recurrences.between(after, before, inc=True)
+        dates = self.recurrences.between(after, before, inc=True)
+        blackouts = self.blackouts()
+        if not blackouts:
+            return dates
+        return (date for date in dates if blackouts.covering(date) is None)
 
     def date_before(self, before):
-        return self.recurrences.before(before, inc=True)
+        date = self.recurrences.before(before, inc=True)
+        blackouts = self.blackouts()
+        while date is not None and blackouts:
+            period = blackouts.covering(date)
+            if period is None:
+                break
+            date = self.recurrences.before(period[0], inc=False)
+        return date
 
     def date_after(self, after, inc=True):
-        return self.recurrences.after(after, inc=inc)
+        date = self.recurrences.after(after, inc=inc)
+        blackouts = self.blackouts()
+        while date is not None and blackouts:
+            period = blackouts.covering(date)
+            if period is None:
+                break
+            date = self.recurrences.after(period[1], inc=True)
+        return date
 
     def __str__(self):
         return ' - '.join(
@@ -99,24 +309,41 @@ class Schedule(models.Model):
 
 
 class Transmission(object):
+    """
+        A schedule occurrence, sharing the schedule, slot and programme
+        instances of every transmission of the schedule
+    """
+    __slots__ = ('schedule', 'start', 'episode')
+
     @classmethod
     def at(cls, at):
-        schedules = Schedule.objects.all()
+        recheck_blackouts()
+        schedules = Schedule.objects.on_air(at, at)
         for schedule in schedules:
             date = schedule.date_before(at)
             if date is None:
                 continue
             if at < date + schedule.runtime:
-                yield cls(schedule, date)
+                yield cls._occurrence(schedule, date)
 
     @classmethod
     def between(cls, after, before, schedules=None):
         if schedules is None:
-            schedules = Schedule.objects.all()
+            schedules = Schedule.objects.between(after, before)
 
+        recheck_blackouts()
         for schedule in schedules:
             for date in schedule.dates_between(after, before):
-                yield cls(schedule, date)
+                yield cls._occurrence(schedule, date)
+
+    @classmethod
+    def _occurrence(cls, schedule, date):
+        # date is known to be an occurrence of schedule
+        transmission = cls.__new__(cls)
+        transmission.schedule = schedule
+        transmission.start = date
+        transmission.episode = transmission._get_or_create_episode()
+        return transmission
 
     def __init__(self, schedule, date):
         if not (schedule.date_before(date) == date):
@@ -124,14 +351,21 @@ class Transmission(object):
 
         # we need to track the schedule id for admin calendar
         self.schedule = schedule
-
-        self.programme = schedule.slot.programme
-        self.type = schedule.type
         self.start = date
-        self.end = date + schedule.slot.runtime
-
         self.episode = self._get_or_create_episode()
 
+    @property
+    def programme(self):
+        return self.schedule.slot.programme
+
+    @property
+    def type(self):
+        return self.schedule.type
+
+    @property
+    def end(self):
+        return self.start + self.schedule.slot.runtime
+
     def _get_or_create_episode(self):
         try:
             if self.type == Schedule.REPETITION:
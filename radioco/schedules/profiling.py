@@ -0,0 +1,212 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Optional profiling of the recurrence expansion of schedules.
+
+Every occurrence lookup goes through Schedule.dates_between, date_before and
+date_after. When enabled (SCHEDULE_PROFILING setting or enable()), these
+methods count the calls, the occurrences produced and the time spent per
+schedule, and report them to radioco.metrics.
+"""
+
+
+import collections
+import contextlib
+import datetime
+import functools
+import logging
+import threading
+import time
+
+import recurrence
+from django.utils import timezone
+
+from radioco import metrics
+from radioco.schedules.models import Schedule
+
+
+PROFILED_METHODS = ('dates_between', 'date_before', 'date_after')
+
+FREQUENCIES = {
+    recurrence.YEARLY: datetime.timedelta(days=365),
+    recurrence.MONTHLY: datetime.timedelta(days=30),
+    recurrence.WEEKLY: datetime.timedelta(days=7),
+    recurrence.DAILY: datetime.timedelta(days=1),
+    recurrence.HOURLY: datetime.timedelta(hours=1),
+    recurrence.MINUTELY: datetime.timedelta(minutes=1),
+    recurrence.SECONDLY: datetime.timedelta(seconds=1),
+}
+FREQUENCY_NAMES = {
+    recurrence.HOURLY: 'HOURLY', recurrence.MINUTELY: 'MINUTELY',
+    recurrence.SECONDLY: 'SECONDLY'}
+
+# rules are expanded from their start, every lookup steps over this many
+MAX_OCCURRENCES_SINCE_START = 5000
+MAX_DATES = 100
+
+duration = metrics.Histogram(
+    'radioco_recurrence_duration_seconds',
+    'Time spent expanding schedule recurrences.',
+    (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+occurrences_total = metrics.Counter(
+    'radioco_recurrence_occurrences_total',
+    'Occurrences produced by schedule recurrences.')
+pathological_total = metrics.Counter(
+    'radioco_recurrence_pathological_calls_total',
+    'Expansions of schedules with pathological recurrences.')
+
+ScheduleStats = collections.namedtuple(
+    'ScheduleStats', ('calls', 'occurrences', 'seconds'))
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_lock = threading.Lock()
+_originals = {}
+# (schedule id, pathologies) already logged
+_reported = set()
+
+
+def pathologies(schedule, now=None):
+    """
+        Return a list describing why the recurrences of schedule are
+        expensive to expand
+    """
+    if now is None:
+        now = timezone.now()
+    recurrences = schedule.recurrences
+    dtstart = recurrences.dtstart
+    if dtstart is not None and timezone.is_naive(dtstart):
+        dtstart = timezone.make_aware(dtstart)
+    problems = []
+    for rule in list(recurrences.rrules) + list(recurrences.exrules):
+        if rule.freq in FREQUENCY_NAMES:
+            problems.append('{:s} rule'.format(FREQUENCY_NAMES[rule.freq]))
+        until = rule.until
+        if until is not None and timezone.is_naive(until):
+            until = timezone.make_aware(until)
+        if dtstart and not rule.count and (until is None or until > now):
+            per_period = max(len(rule.byday or ()), len(rule.bymonthday or ()), 1)
+            estimated = int(
+                (now - dtstart) / (FREQUENCIES[rule.freq] * (rule.interval or 1))
+            ) * per_period
+            if estimated > MAX_OCCURRENCES_SINCE_START:
+                problems.append('about {:d} occurrences since start'.format(estimated))
+    if len(recurrences.exdates) > MAX_DATES:
+        problems.append('{:d} exdates'.format(len(recurrences.exdates)))
+    if len(recurrences.rdates) > MAX_DATES:
+        problems.append('{:d} rdates'.format(len(recurrences.rdates)))
+    return problems
+
+
+def _record(schedule, method, seconds, occurrences):
+    with _lock:
+        stats = _stats.get(schedule.pk, ScheduleStats(0, 0, 0))
+        _stats[schedule.pk] = ScheduleStats(
+            stats.calls + 1, stats.occurrences + occurrences,
+            stats.seconds + seconds)
+    duration.observe(seconds, method=method)
+    occurrences_total.inc(occurrences, method=method)
+    if _pathologies(schedule):
+        pathological_total.inc()
+
+
+def _pathologies(schedule):
+    # checked once per loaded schedule, not on every expansion
+    try:
+        return schedule._profiled_pathologies
+    except AttributeError:
+        pass
+    problems = schedule._profiled_pathologies = pathologies(schedule)
+    reported = (schedule.pk, tuple(problems))
+    if problems and reported not in _reported:
+        _reported.add(reported)
+        logger.warning(
+            'Schedule %s has pathological recurrences: %s', schedule.pk, ', '.join(problems))
+    return problems
+
+
+def _counted(schedule, method, dates, seconds):
+    count = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                date = next(dates)
+            finally:
+                seconds += time.perf_counter() - started
+            count += 1
+            yield date
+    except StopIteration:
+        pass
+    finally:
+        _record(schedule, method, seconds, count)
+
+
+def _profiled(method):
+    name = method.__name__
+
+    @functools.wraps(method)
+    def profiled(schedule, *args, **kwargs):
+        started = time.perf_counter()
+        result = method(schedule, *args, **kwargs)
+        seconds = time.perf_counter() - started
+        if name == 'dates_between':
+            # occurrences are generated lazily
+            return _counted(schedule, name, iter(result), seconds)
+        _record(schedule, name, seconds, int(result is not None))
+        return result
+    return profiled
+
+
+def enable():
+    for name in PROFILED_METHODS:
+        if name not in _originals:
+            _originals[name] = getattr(Schedule, name)
+            setattr(Schedule, name, _profiled(_originals[name]))
+
+
+def disable():
+    for name, method in _originals.items():
+        setattr(Schedule, name, method)
+    _originals.clear()
+
+
+@contextlib.contextmanager
+def profiling():
+    enabled = bool(_originals)
+    enable()
+    try:
+        yield
+    finally:
+        if not enabled:
+            disable()
+
+
+def stats():
+    """
+        Return a dict of ScheduleStats per schedule id
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _reported.clear()
@@ -0,0 +1,211 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The upcoming transmissions supplied to the recorder program.
+
+The recorder window is versioned: the version changes whenever a schedule,
+slot, episode or the podcast configuration changes, so the recorder only
+needs to fetch the window again when its version is outdated.
+
+The recording jobs of the manifest are built from the occurrences of live
+schedules, materialized per schedule and UTC day in the cache. Saving a
+schedule only discards its own occurrences.
+"""
+
+
+import datetime
+import hashlib
+import json
+
+import pytz
+from django.core.cache import cache
+from django.utils import timezone
+
+from radioco.cache import bump_generation, get_generation, get_generations
+from radioco.global_settings.models import PodcastConfiguration
+from radioco.programmes.models import Episode
+from radioco.programmes.recordings import recording_name
+from radioco.schedules.models import Schedule, Transmission
+
+
+RECORDER_VERSION_KEY = 'recorder-version'
+
+OCCURRENCES_TIMEOUT = 2 * 24 * 60 * 60
+# how long the recorder can fetch a diff against a manifest
+MANIFEST_TIMEOUT = 24 * 60 * 60
+
+
+def recorder_version():
+    return get_generation(RECORDER_VERSION_KEY)
+
+
+def invalidate_recorder():
+    bump_generation(RECORDER_VERSION_KEY)
+
+
+def recorder_window(after=None):
+    """
+        Return the transmissions starting in the next hours configured for
+        the recorder, sorted by start
+    """
+    if after is None:
+        after = timezone.now()
+    before = after + datetime.timedelta(
+        hours=PodcastConfiguration.get_global().next_events)
+    schedules = Schedule.objects.between(after, before).select_related('slot__programme')
+    return sorted(
+        Transmission.between(after, before, schedules=schedules),
+        key=lambda transmission: transmission.start)
+
+
+def occurrences_generation_key(schedule_id):
+    return 'schedule-occurrences-generation:{:d}'.format(schedule_id)
+
+
+def invalidate_occurrences(schedule_id):
+    bump_generation(occurrences_generation_key(schedule_id))
+
+
+def _days(after, before):
+    day = after.astimezone(pytz.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    while day <= before:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def occurrences(schedules, after, before):
+    """
+        Yields (schedule, start) for every start between after and before
+    """
+    days = list(_days(after, before))
+    generations = get_generations(
+        [occurrences_generation_key(schedule.pk) for schedule in schedules])
+    keys = {
+        (schedule.pk, day): 'schedule-occurrences:{:d}:{:d}:{:%Y%m%d}'.format(
+            schedule.pk,
+            generations[occurrences_generation_key(schedule.pk)], day)
+        for schedule in schedules for day in days}
+    cached = cache.get_many(keys.values())
+
+    missing = {}
+    for schedule in schedules:
+        for day in days:
+            key = keys[schedule.pk, day]
+            if key not in cached:
+                cached[key] = missing[key] = list(schedule.dates_between(
+                    day, day + datetime.timedelta(days=1, microseconds=-1)))
+            for start in cached[key]:
+                if after <= start <= before:
+                    yield schedule, start
+    cache.set_many(missing, OCCURRENCES_TIMEOUT)
+
+
+def _isoformat(date):
+    return timezone.localtime(date).isoformat()
+
+
+def recording_jobs(now=None):
+    """
+        Return the recording jobs of live transmissions in progress or
+        starting in the next hours configured for the recorder
+
+        Delays are applied and adjacent transmissions of the same programme
+        are merged into one job.
+    """
+    if now is None:
+        now = timezone.now()
+    configuration = PodcastConfiguration.get_global()
+    before = now + datetime.timedelta(hours=configuration.next_events)
+
+    schedules = list(Schedule.objects.filter(
+        type=Schedule.LIVE).on_air(now, before).select_related('slot__programme'))
+    if not schedules:
+        return []
+    longest = max(schedule.runtime for schedule in schedules)
+    transmissions = sorted((
+        (start, start + schedule.runtime, schedule)
+        for schedule, start in occurrences(schedules, now - longest, before)
+        if start + schedule.runtime > now), key=lambda transmission: transmission[:2])
+
+    episodes = {
+        (episode.programme_id, episode.issue_date): episode
+        for episode in Episode.objects.filter(
+            programme__in={schedule.slot.programme_id for schedule in schedules},
+            issue_date__in=[start for start, end, schedule in transmissions]
+        ).select_related('programme')}
+
+    merged = []
+    for start, end, schedule in transmissions:
+        programme = schedule.slot.programme
+        previous = merged[-1] if merged else None
+        if previous and previous['programme'] == programme and previous['end'] >= start:
+            previous['end'] = max(previous['end'], end)
+            continue
+        merged.append({
+            'schedule': schedule, 'programme': programme,
+            'episode': episodes.get((programme.pk, start)),
+            'start': start, 'end': end})
+
+    start_delay = datetime.timedelta(seconds=configuration.start_delay)
+    end_delay = datetime.timedelta(seconds=configuration.end_delay)
+    jobs = []
+    for job in merged:
+        episode = job['episode']
+        if episode is not None:
+            file_name = recording_name(episode)
+        else:
+            file_name = '{:s}_{:%Y%m%d%H%M}'.format(
+                job['programme'].slug, timezone.localtime(job['start']))
+        jobs.append({
+            'id': '{:d}:{:%Y%m%dT%H%M%SZ}'.format(
+                job['schedule'].pk, job['start'].astimezone(pytz.utc)),
+            'programme': job['programme'].slug,
+            'season': episode.season if episode else None,
+            'number_in_season': episode.number_in_season if episode else None,
+            'start': _isoformat(job['start'] + start_delay),
+            'end': _isoformat(job['end'] + end_delay),
+            'file_name': file_name,
+        })
+    return jobs
+
+
+def manifest(since=None, now=None):
+    """
+        Return the recording jobs as a versioned manifest
+
+        When the manifest of version since is still known only the new or
+        changed jobs and the ids of removed jobs are returned.
+    """
+    jobs = recording_jobs(now)
+    version = hashlib.sha1(
+        json.dumps(jobs, sort_keys=True).encode('utf-8')).hexdigest()
+    current = {job['id']: job for job in jobs}
+    cache.set('recorder-manifest:{:s}'.format(version), current, MANIFEST_TIMEOUT)
+
+    previous = None
+    if since:
+        previous = cache.get('recorder-manifest:{:s}'.format(since))
+    if previous is None:
+        return {'version': version, 'full': True, 'jobs': jobs, 'removed': []}
+    return {
+        'version': version,
+        'full': False,
+        'jobs': [job for job in jobs if previous.get(job['id']) != job],
+        'removed': sorted(set(previous) - set(current)),
+    }
@@ -1,9 +1,15 @@
 from pytz.exceptions import NonExistentTimeError
+import calendar
 import datetime
 import recurrence
 
 from django.utils import timezone
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 """
 Monkey patch to deal with various date/time issues in origin Recurrence
@@ -48,6 +54,87 @@ def after(self, dt, **kwargs):
     return None
 
 
+def _weekday(day):
+    return getattr(day, 'number', day)
+
+
+def is_simple(self):
+    """
+        Whether the occurrences of self can be computed arithmetically: a
+        single DAILY rule, or WEEKLY rule on plain weekdays, and exdates
+    """
+    if (numpy is None or self.dtstart is None or timezone.is_aware(self.dtstart) or
+            self.dtend or self.exrules or self.rdates or len(self.rrules) != 1):
+        return False
+    rule = self.rrules[0]
+    if rule.freq not in (recurrence.DAILY, recurrence.WEEKLY) or rule.count:
+        return False
+    if rule.until and timezone.is_aware(rule.until):
+        return False
+    if any(getattr(rule, param) for param in rule.byparams if param != 'byday'):
+        return False
+    if rule.byday and (rule.freq == recurrence.DAILY or any(
+            getattr(day, 'index', None) for day in rule.byday)):
+        return False
+    return True
+
+
+def _days(first, start, end, step):
+    """
+        Return the days first + k * step between start and end as datetime64
+    """
+    low = -((first - start).days // step)
+    high = (end - first).days // step
+    offsets = numpy.arange(max(low, 0), high + 1) * step
+    return numpy.datetime64(first, 'D') + offsets
+
+
+def fast_between(self, after, before, inc=False):
+    """
+        Return the occurrences of a simple recurrence between the naive dates
+        after and before, computed as NumPy datetime64 arrays
+    """
+    rule = self.rrules[0]
+    dtstart = self.dtstart
+    interval = rule.interval or 1
+    start = max(dtstart.date(), after.date())
+    end = before.date()
+    if rule.until:
+        end = min(end, rule.until.date())
+
+    if rule.freq == recurrence.DAILY:
+        days = [_days(dtstart.date(), start, end, interval)]
+    else:
+        wkst = rule.wkst if rule.wkst is not None else calendar.firstweekday()
+        week = dtstart.date() - datetime.timedelta(
+            days=(dtstart.weekday() - _weekday(wkst)) % 7)
+        weekdays = set(map(_weekday, rule.byday or [dtstart.weekday()]))
+        days = [
+            _days(week + datetime.timedelta(days=(weekday - week.weekday()) % 7),
+                  start, end, 7 * interval)
+            for weekday in weekdays]
+
+    time = dtstart - datetime.datetime.combine(dtstart.date(), datetime.time())
+    dates = numpy.concatenate(days).astype('datetime64[us]') + numpy.timedelta64(time)
+    # django-recurrence < 1.5 always includes dtstart
+    if getattr(self, 'include_dtstart', True):
+        dates = numpy.append(dates, numpy.datetime64(dtstart, 'us'))
+    dates = numpy.unique(dates)
+
+    dates = dates[dates >= numpy.datetime64(dtstart, 'us')]
+    if rule.until:
+        dates = dates[dates <= numpy.datetime64(rule.until, 'us')]
+    after, before = numpy.datetime64(after, 'us'), numpy.datetime64(before, 'us')
+    if inc:
+        dates = dates[(dates >= after) & (dates <= before)]
+    else:
+        dates = dates[(dates > after) & (dates < before)]
+    if self.exdates:
+        exdates = numpy.array(self.exdates, dtype='datetime64[us]')
+        dates = dates[~numpy.isin(dates, exdates)]
+    return dates.tolist()
+
+
 def between(self, after, before, **kwargs):
     if timezone.is_aware(after):
         after = timezone.make_naive(after)
@@ -55,7 +142,12 @@ def between(self, after, before, **kwargs):
     if timezone.is_aware(before):
         before = timezone.make_naive(before)
 
-    for dt in self._between(after, before, **kwargs):
+    if is_simple(self) and set(kwargs) <= {'inc'}:
+        dates = fast_between(self, after, before, **kwargs)
+    else:
+        dates = self._between(after, before, **kwargs)
+
+    for dt in dates:
         try:
             yield timezone.make_aware(dt)
         except NonExistentTimeError:
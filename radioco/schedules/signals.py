@@ -1,12 +1,84 @@
-from django.db.models.signals import post_save, post_delete
+from django.core.signals import request_started
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
-from radioco.schedules.models import Schedule
-from radioco.schedules import utils
+from radioco.global_settings.models import PodcastConfiguration
+from radioco.programmes.models import Episode, Programme
+from radioco.schedules.models import (
+    BlackoutPeriod, Schedule, Slot, invalidate_blackouts, recheck_blackouts)
+from radioco.schedules import grid, recorder, utils
 
 
 @receiver(post_save, sender=Schedule)
 @receiver(post_delete, sender=Schedule)
 def rearrange_episodes(instance, **kwargs):
     utils.rearrange_episodes(instance.slot.programme, timezone.now())
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_save, sender=Slot)
+@receiver(post_delete, sender=Slot)
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Episode)
+@receiver(post_save, sender=PodcastConfiguration)
+def invalidate_recorder(**kwargs):
+    recorder.invalidate_recorder()
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def invalidate_occurrences(instance, **kwargs):
+    recorder.invalidate_occurrences(instance.pk)
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_save, sender=Slot)
+@receiver(post_delete, sender=Slot)
+@receiver(post_save, sender=Programme)
+@receiver(post_delete, sender=Programme)
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Episode)
+def invalidate_schedule(**kwargs):
+    grid.invalidate_schedule()
+
+
+@receiver(request_started)
+def recheck_request_blackouts(**kwargs):
+    recheck_blackouts()
+
+
+@receiver(post_save, sender=Slot)
+@receiver(post_delete, sender=Slot)
+def invalidate_slot_blackouts(**kwargs):
+    # the programme of a slot may have blackout periods
+    invalidate_blackouts()
+
+
+@receiver(pre_save, sender=BlackoutPeriod)
+def remember_blackout_programme(instance, **kwargs):
+    # the programme before an edit is affected too
+    instance._previous_programme_ids = set(BlackoutPeriod.objects.filter(
+        pk=instance.pk).values_list('programme_id', flat=True))
+
+
+@receiver(post_save, sender=BlackoutPeriod)
+@receiver(post_delete, sender=BlackoutPeriod)
+def apply_blackouts(instance, **kwargs):
+    invalidate_blackouts()
+    grid.invalidate_schedule()
+    recorder.invalidate_recorder()
+    programme_ids = {instance.programme_id} | getattr(instance, '_previous_programme_ids', set())
+    schedules = Schedule.objects.all()
+    programmes = Programme.objects.filter(slot__schedule__type=Schedule.LIVE)
+    if None not in programme_ids:
+        # only the programmes of the period, a station-wide one affects all
+        schedules = schedules.filter(slot__programme__in=programme_ids)
+        programmes = programmes.filter(pk__in=programme_ids)
+    for schedule_id in schedules.values_list('pk', flat=True):
+        recorder.invalidate_occurrences(schedule_id)
+    now = timezone.now()
+    for programme in programmes.distinct():
+        utils.rearrange_episodes(programme, now)
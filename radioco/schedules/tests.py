@@ -16,16 +16,29 @@
 
 
 import datetime
+import io
+import json
 import mock
+import random
+import unittest
 import recurrence
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
+from radioco.global_settings.models import PodcastConfiguration
 from radioco.programmes.models import Programme
-from radioco.schedules import utils
-from radioco.schedules.models import Slot, Schedule, Transmission
+from radioco import metrics
+from radioco.schedules import conflicts, grid, profiling, recorder, utils
+from radioco.schedules import recurrence as patched_recurrence
+from radioco.schedules.admin import ScheduleAdminForm
+from radioco.schedules import models
+from radioco.schedules.models import BlackoutPeriod, Blackouts, Slot, Schedule, Transmission
 from radioco.test.utils import TestDataMixin, now
 
 
@@ -101,6 +114,67 @@ class ScheduleModelTests(TestDataMixin, TestCase):
         schedule = Schedule(slot=Slot())
         self.assertIsNone(schedule.start)
 
+    def test_occurrence_window_unbounded(self):
+        self.assertEqual(
+            self.schedule.first_occurrence,
+            timezone.make_aware(datetime.datetime(2014, 1, 6, 14, 0)))
+        self.assertIsNone(self.schedule.last_occurrence)
+
+    def test_occurrence_window_until(self):
+        self.schedule.recurrences.dtend = None
+        self.schedule.recurrences.rrules[0].until = datetime.datetime(2014, 2, 1)
+        self.schedule.recurrences.rdates = [datetime.datetime(2013, 12, 30, 14, 0)]
+        self.schedule.save()
+        self.assertEqual(
+            self.schedule.first_occurrence,
+            timezone.make_aware(datetime.datetime(2013, 12, 30, 14, 0)))
+        self.assertEqual(
+            self.schedule.last_occurrence,
+            timezone.make_aware(datetime.datetime(2014, 1, 27, 14, 0)))
+
+    def test_occurrence_window_count(self):
+        self.schedule.recurrences.dtend = None
+        self.schedule.recurrences.rrules[0].count = 2
+        self.schedule.save()
+        self.assertEqual(
+            self.schedule.last_occurrence,
+            timezone.make_aware(datetime.datetime(2014, 1, 13, 14, 0)))
+
+    def test_occurrence_window_dst_transition(self):
+        # 02:30 happens twice in Europe/Berlin that night
+        self.schedule.start = datetime.datetime(2015, 10, 25, 2, 30)
+        self.schedule.recurrences.dtend = None
+        self.schedule.recurrences.rrules[0].count = 1
+        self.schedule.save()
+        self.assertEqual(
+            self.schedule.first_occurrence,
+            timezone.make_aware(datetime.datetime(2015, 10, 25, 2, 30), is_dst=False))
+        self.assertEqual(self.schedule.last_occurrence, self.schedule.first_occurrence)
+
+    def test_between_prunes_finished_schedules(self):
+        self.schedule.recurrences.dtend = None
+        self.schedule.recurrences.rrules[0].count = 2
+        self.schedule.save()
+        after = timezone.make_aware(datetime.datetime(2015, 1, 1))
+        before = after + datetime.timedelta(days=1)
+        self.assertNotIn(self.schedule, Schedule.objects.between(after, before))
+        self.assertNotIn(self.schedule, Schedule.objects.between(
+            timezone.make_aware(datetime.datetime(2013, 1, 1)),
+            timezone.make_aware(datetime.datetime(2013, 1, 2))))
+        self.assertIn(self.schedule, Schedule.objects.between(
+            timezone.make_aware(datetime.datetime(2014, 1, 13, 14, 0)), after))
+        self.assertEqual(
+            Schedule.objects.between(after, before).count(), Schedule.objects.count() - 1)
+
+    def test_on_air(self):
+        self.schedule.recurrences.dtend = None
+        self.schedule.recurrences.rrules[0].count = 2
+        self.schedule.save()
+        at = timezone.make_aware(datetime.datetime(2014, 1, 13, 14, 30))
+        self.assertIn(self.schedule, Schedule.objects.on_air(at, at))
+        at = timezone.make_aware(datetime.datetime(2014, 1, 13, 15, 0))
+        self.assertNotIn(self.schedule, Schedule.objects.on_air(at, at))
+
     def test_end(self):
         self.assertEqual(
             self.schedule.end, datetime.datetime(2014, 1, 6, 15, 0))
@@ -244,6 +318,21 @@ class TransmissionModelTests(TestDataMixin, TestCase):
             self.transmission.end,
             timezone.make_aware(datetime.datetime(2015, 1, 6, 15, 0, 0)))
 
+    def test_type(self):
+        self.assertEqual(self.transmission.type, self.schedule.type)
+
+    def test_compact(self):
+        self.assertFalse(hasattr(self.transmission, '__dict__'))
+        after = timezone.make_aware(datetime.datetime(2015, 1, 6))
+        transmissions = [
+            transmission for transmission in Transmission.between(
+                after, after + datetime.timedelta(days=7))
+            if transmission.schedule == self.schedule]
+        self.assertEqual(len(transmissions), 7)
+        self.assertTrue(all(
+            transmission.programme is transmissions[0].programme
+            for transmission in transmissions))
+
     def test_get_or_create_existent_episode(self):
         transmission = Transmission(
             self.schedule,
@@ -382,3 +471,477 @@ class ScheduleUtilsTests(TestDataMixin, TestCase):
                 timezone.make_aware(datetime.datetime(2015, 1, 3, 14, 0)),
                 timezone.make_aware(datetime.datetime(2015, 1, 3, 16, 0)),
                 timezone.make_aware(datetime.datetime(2015, 1, 4, 14, 0))])
+
+
+class RecorderManifestTests(TestDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.make_aware(datetime.datetime(2015, 1, 6, 14, 30))
+
+    def manifest(self, since=None):
+        return recorder.manifest(since, now=self.now)
+
+    def test_jobs(self):
+        manifest = self.manifest()
+        self.assertTrue(manifest['full'])
+        self.assertListEqual(
+            [(job['start'], job['end'], job['file_name']) for job in manifest['jobs']][:3], [
+                ('2015-01-06T14:00:00+01:00', '2015-01-06T15:00:00+01:00', 'classic-hits_2x1'),
+                ('2015-01-07T08:00:00+01:00', '2015-01-07T09:00:00+01:00', 'morning-news_201501070800'),
+                ('2015-01-07T11:00:00+01:00', '2015-01-07T12:00:00+01:00', 'places-to-go_2x2')])
+
+    def test_only_live(self):
+        starts = [job['start'] for job in self.manifest()['jobs']]
+        self.assertNotIn('2015-01-06T20:00:00+01:00', starts)
+
+    def test_delays(self):
+        podcast_configuration = PodcastConfiguration.get_global()
+        podcast_configuration.start_delay = 30
+        podcast_configuration.end_delay = 60
+        podcast_configuration.save()
+        job = self.manifest()['jobs'][0]
+        self.assertEqual(job['start'], '2015-01-06T14:00:30+01:00')
+        self.assertEqual(job['end'], '2015-01-06T15:01:00+01:00')
+
+    def test_adjacent_jobs_merged(self):
+        Schedule.objects.create(
+            slot=self.slot, type=Schedule.LIVE,
+            recurrences=recurrence.Recurrence(
+                dtstart=timezone.make_aware(datetime.datetime(2015, 1, 1, 15, 0)),
+                rrules=[recurrence.Rule(recurrence.DAILY)]))
+        job = self.manifest()['jobs'][0]
+        self.assertEqual(job['start'], '2015-01-06T14:00:00+01:00')
+        self.assertEqual(job['end'], '2015-01-06T16:00:00+01:00')
+
+    def test_diff_unchanged(self):
+        version = self.manifest()['version']
+        manifest = self.manifest(version)
+        self.assertFalse(manifest['full'])
+        self.assertEqual(manifest['version'], version)
+        self.assertListEqual(manifest['jobs'], [])
+        self.assertListEqual(manifest['removed'], [])
+
+    def test_diff_schedule_moved(self):
+        version = self.manifest()['version']
+        schedule = Schedule.objects.get(slot__programme__name='Places To Go')
+        schedule.start = timezone.make_aware(datetime.datetime(2015, 1, 1, 10, 0))
+        schedule.save()
+        manifest = self.manifest(version)
+        self.assertFalse(manifest['full'])
+        self.assertListEqual(
+            [job['start'] for job in manifest['jobs']], ['2015-01-07T10:00:00+01:00'])
+        self.assertListEqual(
+            manifest['removed'], ['{:d}:20150107T100000Z'.format(schedule.pk)])
+
+    def test_diff_unknown_version(self):
+        manifest = self.manifest('unknown')
+        self.assertTrue(manifest['full'])
+        self.assertEqual(len(manifest['jobs']), 6)
+
+
+class ProfilingTests(TestDataMixin, TestCase):
+    def setUp(self):
+        profiling.reset()
+        metrics.reset()
+        self.schedule = Schedule.objects.get(pk=self.schedule.pk)
+        self.after = timezone.make_aware(datetime.datetime(2015, 1, 6))
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled_by_default(self):
+        list(self.schedule.dates_between(self.after, self.after + datetime.timedelta(days=7)))
+        self.assertDictEqual(profiling.stats(), {})
+
+    def test_counts_occurrences(self):
+        with profiling.profiling():
+            dates = list(self.schedule.dates_between(
+                self.after, self.after + datetime.timedelta(days=7)))
+            self.schedule.date_before(self.after)
+            self.schedule.date_after(self.after)
+        stats = profiling.stats()[self.schedule.pk]
+        self.assertEqual(stats.calls, 3)
+        self.assertEqual(stats.occurrences, len(dates) + 2)
+        self.assertIn(
+            'radioco_recurrence_occurrences_total{{method="dates_between"}} {:d}'.format(len(dates)),
+            metrics.render())
+
+    def test_restores_methods(self):
+        original = Schedule.dates_between
+        with profiling.profiling():
+            self.assertNotEqual(Schedule.dates_between, original)
+        self.assertEqual(Schedule.dates_between, original)
+
+    def test_pathologies(self):
+        now = timezone.make_aware(datetime.datetime(2015, 1, 6))
+        self.assertListEqual(profiling.pathologies(self.schedule, now), [])
+        self.schedule.recurrences = recurrence.Recurrence(
+            dtstart=timezone.make_aware(datetime.datetime(2014, 12, 1)),
+            rrules=[recurrence.Rule(recurrence.MINUTELY)],
+            exdates=[now + datetime.timedelta(days=day) for day in range(101)])
+        self.assertListEqual(profiling.pathologies(self.schedule, now), [
+            'MINUTELY rule', 'about 51840 occurrences since start', '101 exdates'])
+
+    def test_pathological_calls(self):
+        self.schedule.recurrences = recurrence.Recurrence(
+            dtstart=datetime.datetime(2014, 12, 1),
+            rrules=[recurrence.Rule(recurrence.HOURLY)])
+        with mock.patch(
+                'radioco.schedules.profiling.pathologies',
+                wraps=profiling.pathologies) as pathologies:
+            with self.assertLogs('radioco.schedules.profiling', 'WARNING') as logs:
+                with profiling.profiling():
+                    self.schedule.date_before(self.after)
+                    self.schedule.date_after(self.after)
+        pathologies.assert_called_once_with(self.schedule)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Schedule {:d}'.format(self.schedule.pk), logs.output[0])
+        self.assertIn('radioco_recurrence_pathological_calls_total 2', metrics.render())
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command('profile_schedules', at='2015-01-06T00:00:00', stdout=stdout)
+        self.assertIn('Classic hits', stdout.getvalue())
+        self.assertIn('schedules expanded', stdout.getvalue())
+
+
+class WeekGridTests(TestDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def transmission(self, name, start, end):
+        return {'programme': {'name': name}, 'start': start, 'end': end}
+
+    def test_parse_week(self):
+        self.assertEqual(grid.parse_week('2015-W02'), (2015, 2))
+        self.assertEqual(grid.parse_week('2015-W53'), (2015, 53))
+        with self.assertRaises(ValueError):
+            grid.parse_week('2014-W53')
+        with self.assertRaises(ValueError):
+            grid.parse_week('2015-02-01')
+
+    def test_week_range(self):
+        self.assertEqual(grid.week_range(2015, 2), (
+            timezone.make_aware(datetime.datetime(2015, 1, 5)),
+            timezone.make_aware(datetime.datetime(2015, 1, 12))))
+        self.assertEqual(
+            grid.week_range(2015, 1)[0], timezone.make_aware(datetime.datetime(2014, 12, 29)))
+
+    def test_assign_columns(self):
+        transmissions = grid.assign_columns([
+            self.transmission('c', 2, 4),
+            self.transmission('a', 0, 2),
+            self.transmission('b', 1, 3),
+            self.transmission('d', 5, 6),
+        ])
+        self.assertListEqual(
+            [(t['programme']['name'], t['column'], t['columns']) for t in transmissions],
+            [('a', 0, 2), ('b', 1, 2), ('c', 0, 2), ('d', 0, 1)])
+
+    def test_week(self):
+        week = json.loads(grid.week_grid(2015, 2))
+        self.assertEqual(week['week'], '2015-W02')
+        self.assertEqual(week['start'], '2015-01-05T00:00:00+01:00')
+        starts = [transmission['start'] for transmission in week['transmissions']]
+        self.assertListEqual(starts, sorted(starts))
+        self.assertTrue(all(
+            week['start'] <= start < week['end'] for start in starts))
+        self.assertEqual(week['transmissions'][0]['programme']['url'], '/api/2/programmes/morning-news')
+
+    def test_week_cached(self):
+        grid.week_grid(2015, 2)
+        with self.assertNumQueries(0):
+            grid.week_grid(2015, 2)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_week_not_cached_without_shared_cache(self):
+        grid.week_grid(2015, 2)
+        with CaptureQueriesContext(connection) as queries:
+            grid.week_grid(2015, 2)
+        self.assertTrue(queries.captured_queries)
+
+    def test_week_invalidated(self):
+        week = grid.week_grid(2015, 2)
+        schedule = Schedule.objects.get(pk=self.schedule.pk)
+        schedule.start = schedule.start + datetime.timedelta(hours=1)
+        schedule.save()
+        self.assertNotEqual(grid.week_grid(2015, 2), week)
+
+
+    def test_on_air(self):
+        at = timezone.make_aware(datetime.datetime(2015, 1, 6))
+        for minutes in range(0, 24 * 60, 25):
+            now = at + datetime.timedelta(minutes=minutes)
+            self.assertListEqual(
+                [(transmission.schedule.pk, transmission.start)
+                 for transmission in grid.on_air(now)],
+                sorted(
+                    [(transmission.schedule.pk, transmission.start)
+                     for transmission in Transmission.at(now)],
+                    key=lambda occurrence: occurrence[1]))
+
+    def test_on_air_cached(self):
+        at = timezone.make_aware(datetime.datetime(2015, 1, 6, 14, 30))
+        grid.on_air(at)
+        with mock.patch.object(Schedule, 'date_before') as date_before:
+            with mock.patch.object(Schedule, 'dates_between') as dates_between:
+                transmissions = grid.on_air(at + datetime.timedelta(minutes=10))
+        self.assertFalse(date_before.called or dates_between.called)
+        self.assertListEqual(
+            [transmission.programme.name for transmission in transmissions], ['Classic hits'])
+
+    def test_on_air_invalidated(self):
+        at = timezone.make_aware(datetime.datetime(2015, 1, 6, 14, 30))
+        self.assertTrue(grid.on_air(at))
+        # rolled back periods may survive under a colliding generation
+        self.addCleanup(setattr, models._blackouts, 'generation', None)
+        BlackoutPeriod.objects.create(start=at - datetime.timedelta(hours=1), end=at)
+        self.assertListEqual(grid.on_air(at), [])
+
+class ConflictTests(TestDataMixin, TestCase):
+    def setUp(self):
+        self.after = timezone.make_aware(datetime.datetime(2015, 1, 6))
+
+    def new_schedule(self, type, hour, minute):
+        return Schedule(
+            slot=self.slot, type=type,
+            recurrences=recurrence.Recurrence(
+                dtstart=datetime.datetime(2015, 1, 1, hour, minute),
+                rrules=[recurrence.Rule(recurrence.DAILY)]))
+
+    def test_sweep(self):
+        occurrences = [
+            conflicts.Occurrence(start, end, name)
+            for start, end, name in ((2, 4, 'c'), (0, 2, 'a'), (1, 3, 'b'), (5, 6, 'd'))]
+        self.assertListEqual(
+            [(conflict.first.schedule, conflict.second.schedule)
+             for conflict in conflicts.sweep(occurrences)],
+            [('a', 'b'), ('b', 'c')])
+
+    def test_no_conflicts(self):
+        self.assertListEqual(conflicts.find_conflicts(
+            self.new_schedule(Schedule.LIVE, 15, 0), self.after), [])
+        self.assertListEqual(conflicts.audit_conflicts(self.after), [])
+
+    def test_live_conflict(self):
+        found = conflicts.find_conflicts(
+            self.new_schedule(Schedule.LIVE, 11, 30), self.after, datetime.timedelta(days=1))
+        self.assertListEqual(
+            [str(conflict) for conflict in found], [
+                'Places To Go on 2015-01-06 11:00 overlaps Classic hits on 2015-01-06 11:30',
+                'Classic hits on 2015-01-06 11:30 overlaps The best wine on 2015-01-06 12:00'])
+        self.assertTrue(all(conflict.is_error for conflict in found))
+
+    def test_repetition_conflict(self):
+        found = conflicts.find_conflicts(
+            self.new_schedule(Schedule.REPETITION, 11, 30), self.after, datetime.timedelta(days=1))
+        self.assertEqual(len(found), 2)
+        self.assertFalse(any(conflict.is_error for conflict in found))
+
+    def test_saved_schedule_ignores_itself(self):
+        schedule = Schedule.objects.get(pk=self.schedule.pk)
+        self.assertListEqual(conflicts.find_conflicts(schedule, self.after), [])
+
+    @mock.patch('django.utils.timezone.now', lambda: timezone.make_aware(datetime.datetime(2015, 1, 6)))
+    def test_admin_form(self):
+        data = {
+            'slot': self.slot.pk, 'type': Schedule.LIVE,
+            'recurrences': 'DTSTART:20150101T113000\nRRULE:FREQ=DAILY'}
+        form = ScheduleAdminForm(data, instance=Schedule.objects.get(pk=self.schedule.pk))
+        self.assertFalse(form.is_valid())
+        self.assertIn('overlaps', form.non_field_errors()[0])
+
+        data['type'] = Schedule.REPETITION
+        form = ScheduleAdminForm(data, instance=Schedule.objects.get(pk=self.schedule.pk))
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.warnings[-1], 'and 175 more overlaps')
+
+    def test_command(self):
+        self.new_schedule(Schedule.LIVE, 11, 30).save()
+        stdout = io.StringIO()
+        call_command('audit_schedules', after='2015-01-06T00:00:00', days=1, stdout=stdout)
+        self.assertIn('2 conflicts, 2 between live schedules', stdout.getvalue())
+
+
+@unittest.skipIf(patched_recurrence.numpy is None, 'NumPy is not installed')
+class FastRecurrenceTests(TestCase):
+    def random_recurrence(self, rng):
+        dtstart = datetime.datetime(2015, 1, 1) + datetime.timedelta(
+            days=rng.randrange(400), hours=rng.randrange(24), minutes=rng.choice((0, 30)))
+        rule = recurrence.Rule(
+            rng.choice((recurrence.DAILY, recurrence.WEEKLY)), interval=rng.choice((1, 1, 2, 3)))
+        if rule.freq == recurrence.WEEKLY:
+            rule.byday = rng.sample(range(7), rng.randint(0, 4))
+            rule.wkst = rng.choice((None, None, recurrence.SU))
+        if rng.random() < 0.3:
+            rule.until = dtstart + datetime.timedelta(days=rng.randrange(300))
+        exdates = [
+            dtstart + datetime.timedelta(days=rng.randrange(300))
+            for _ in range(rng.choice((0, 1, 10, 50)))]
+        return recurrence.Recurrence(
+            dtstart=dtstart, rrules=[rule], exdates=exdates)
+
+    def test_same_as_dateutil(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            recurrences = self.random_recurrence(rng)
+            self.assertTrue(patched_recurrence.is_simple(recurrences))
+            after = recurrences.dtstart + datetime.timedelta(
+                days=rng.randrange(-30, 300), hours=rng.randrange(24))
+            before = after + datetime.timedelta(days=rng.choice((0, 1, 7, 31, 365)))
+            if rng.random() < 0.2:
+                # window bounds on occurrences
+                after = recurrences.dtstart
+            inc = rng.random() < 0.5
+            self.assertListEqual(
+                patched_recurrence.fast_between(recurrences, after, before, inc=inc),
+                list(recurrences._between(after, before, inc=inc)),
+                recurrence.serialize(recurrences))
+
+    def test_without_include_dtstart(self):
+        # django-recurrence < 1.5
+        dtstart = datetime.datetime(2015, 1, 1, 10, 0)
+        recurrences = recurrence.Recurrence(
+            dtstart=dtstart, rrules=[recurrence.Rule(recurrence.WEEKLY, byday=[4])])
+        del recurrences.include_dtstart
+        self.assertListEqual(
+            patched_recurrence.fast_between(
+                recurrences, dtstart, dtstart + datetime.timedelta(days=2), inc=True),
+            [dtstart, datetime.datetime(2015, 1, 2, 10, 0)])
+
+    def test_complex_rules(self):
+        dtstart = datetime.datetime(2015, 1, 1, 10, 0)
+        for rule in (
+                recurrence.Rule(recurrence.MONTHLY),
+                recurrence.Rule(recurrence.WEEKLY, count=10),
+                recurrence.Rule(recurrence.WEEKLY, byday=recurrence.Weekday(0, 1)),
+                recurrence.Rule(recurrence.DAILY, byday=[0, 1]),
+                recurrence.Rule(recurrence.DAILY, byhour=[10, 12])):
+            self.assertFalse(patched_recurrence.is_simple(
+                recurrence.Recurrence(dtstart=dtstart, rrules=[rule])))
+        self.assertFalse(patched_recurrence.is_simple(recurrence.Recurrence(
+            dtstart=dtstart, rrules=[recurrence.Rule(recurrence.DAILY)],
+            rdates=[datetime.datetime(2015, 2, 1)])))
+
+    def test_without_numpy(self):
+        recurrences = recurrence.Recurrence(
+            dtstart=datetime.datetime(2015, 1, 1, 10, 0),
+            rrules=[recurrence.Rule(recurrence.DAILY)])
+        after = timezone.make_aware(datetime.datetime(2015, 1, 1))
+        before = after + datetime.timedelta(days=7)
+        dates = list(recurrences.between(after, before, inc=True))
+        with mock.patch('radioco.schedules.recurrence.numpy', None):
+            self.assertFalse(patched_recurrence.is_simple(recurrences))
+            self.assertListEqual(list(recurrences.between(after, before, inc=True)), dates)
+
+
+class BlackoutPeriodTests(TestDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.after = timezone.make_aware(datetime.datetime(2015, 1, 5))
+        self.before = timezone.make_aware(datetime.datetime(2015, 1, 12))
+
+    def tearDown(self):
+        # rolled back periods may survive under a colliding generation
+        models._blackouts.generation = None
+        models._blackouts.checked = False
+
+    def date(self, *args):
+        return timezone.make_aware(datetime.datetime(*args))
+
+    def starts(self):
+        return sorted(
+            (transmission.programme.name, transmission.start)
+            for transmission in Transmission.between(self.after, self.before))
+
+    def test_blackouts(self):
+        blackouts = Blackouts([(5, 8), (1, 3), (2, 4)])
+        self.assertListEqual(blackouts.starts, [1, 5])
+        self.assertListEqual(blackouts.ends, [4, 8])
+        self.assertEqual(blackouts.covering(3), (1, 4))
+        self.assertIsNone(blackouts.covering(4))
+        self.assertIsNone(blackouts.covering(0))
+        self.assertFalse(Blackouts([]))
+
+    def test_clean(self):
+        with self.assertRaises(ValidationError):
+            BlackoutPeriod(start=self.before, end=self.after).clean()
+
+    def test_station_wide(self):
+        starts = self.starts()
+        BlackoutPeriod.objects.create(
+            start=self.date(2015, 1, 6), end=self.date(2015, 1, 7))
+        self.assertListEqual(self.starts(), [
+            (name, start) for name, start in starts
+            if not self.date(2015, 1, 6) <= start < self.date(2015, 1, 7)])
+
+    def test_programme(self):
+        starts = self.starts()
+        BlackoutPeriod.objects.create(
+            start=self.after, end=self.before, programme=self.programme)
+        self.assertListEqual(self.starts(), [
+            (name, start) for name, start in starts if name != self.programme.name])
+
+    def test_date_before_and_after(self):
+        schedule = Schedule.objects.get(pk=self.schedule.pk)
+        BlackoutPeriod.objects.create(
+            start=self.date(2015, 1, 6), end=self.date(2015, 1, 8), programme=self.programme)
+        self.assertEqual(
+            schedule.date_before(self.date(2015, 1, 7, 20)), self.date(2015, 1, 5, 14))
+        self.assertEqual(
+            schedule.date_after(self.date(2015, 1, 6)), self.date(2015, 1, 8, 14))
+
+    def test_checked_once_per_batch(self):
+        BlackoutPeriod.objects.create(
+            start=self.date(2015, 1, 6), end=self.date(2015, 1, 8), programme=self.programme)
+        list(Transmission.between(self.after, self.before))
+        with mock.patch(
+                'radioco.schedules.models.get_generation',
+                wraps=models.get_generation) as get_generation:
+            with CaptureQueriesContext(connection) as queries:
+                transmissions = list(Transmission.between(self.after, self.before))
+        self.assertTrue(transmissions)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'schedules_blackoutperiod' in query['sql']])
+        get_generation.assert_called_once_with(models.BLACKOUT_GENERATION_KEY)
+
+    def test_invalidated_by_slot(self):
+        BlackoutPeriod.objects.create(
+            start=self.after, end=self.before, programme=self.programme)
+        self.starts()
+        slot = Slot.objects.create(
+            programme=self.programme, runtime=datetime.timedelta(minutes=60))
+        Schedule.objects.create(
+            slot=slot, type='L', recurrences=recurrence.Recurrence(
+                dtstart=datetime.datetime(2015, 1, 1, 20, 0),
+                rrules=[recurrence.Rule(recurrence.DAILY)]))
+        self.assertNotIn(self.programme.name, [name for name, start in self.starts()])
+
+    def test_applied_to_its_programmes(self):
+        other = Programme.objects.exclude(pk=self.programme.pk).filter(
+            slot__schedule__type=Schedule.LIVE).first()
+        with mock.patch('radioco.schedules.utils.rearrange_episodes') as rearrange_episodes:
+            period = BlackoutPeriod.objects.create(
+                start=self.after, end=self.before, programme=self.programme)
+            self.assertListEqual(
+                [call[0][0] for call in rearrange_episodes.call_args_list], [self.programme])
+            rearrange_episodes.reset_mock()
+            period.programme = other
+            period.save()
+            self.assertSetEqual(
+                {call[0][0] for call in rearrange_episodes.call_args_list},
+                {self.programme, other})
+            rearrange_episodes.reset_mock()
+            period.programme = None
+            period.save()
+            self.assertSetEqual(
+                {call[0][0] for call in rearrange_episodes.call_args_list},
+                set(Programme.objects.filter(slot__schedule__type=Schedule.LIVE)))
+
+    def test_invalidates_grid(self):
+        week = grid.week_grid(2015, 2)
+        BlackoutPeriod.objects.create(start=self.after, end=self.before)
+        self.assertListEqual(json.loads(grid.week_grid(2015, 2))['transmissions'], [])
+        self.assertNotEqual(json.loads(week)['transmissions'], [])
@@ -1,7 +1,7 @@
 from django.db import transaction
 
 from radioco.programmes.models import Episode
-from radioco.schedules.models import Schedule
+from radioco.schedules.models import Schedule, recheck_blackouts
 
 
 def available_dates(programme, after):
@@ -25,6 +25,7 @@ def available_dates(programme, after):
 
 
 def rearrange_episodes(programme, after):
+    recheck_blackouts()
     episodes = Episode.objects.unfinished(programme, after)
     dates = available_dates(programme, after)
 
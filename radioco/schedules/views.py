@@ -20,7 +20,7 @@ from radioco.global_settings.models import CalendarConfiguration
 
 
 def schedule_list(request):
-    calendar_configuration = CalendarConfiguration.objects.get()
+    calendar_configuration = CalendarConfiguration.get_global()
     context = {
         'scroll_time': calendar_configuration.scroll_time.strftime('%H:%M:%S'),
         'min_time': calendar_configuration.min_time.strftime('%H:%M:%S'),
@@ -61,11 +61,12 @@ INSTALLED_APPS = (
     'radioco.users',
     'radioco.programmes.apps.Programmes',
     'radioco.schedules.apps.Schedules',
-    'radioco.global_settings',
+    'radioco.global_settings.apps.GlobalSettings',
     'radioco.example',
 )
 
 MIDDLEWARE_CLASSES = (
+    'radioco.middleware.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -108,6 +109,21 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# Must be shared by every process serving RadioCo, see the CACHES setting in
+# the documentation
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(SITE_ROOT, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.6/topics/i18n/
 
@@ -0,0 +1,443 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Static snapshot of the public site, the API and the feeds.
+
+Every page is rendered through the middleware and views like a request and
+written below a root directory as <path>/index.html (or .json, .xml), with
+the query string of feed archive pages and week grids as a last directory.
+Static files are copied under their name and under a name with the hash of
+their content, which the exported HTML refers to.
+
+Pages are grouped by what they show, e.g. every page of a programme. When
+SNAPSHOT_ROOT is set, saving or deleting a model appends the groups it
+affects to a journal, and an incremental export renders only these groups,
+the pages created since and the pages of the current week.
+
+This module is the URLconf the pages are rendered with, the public pages
+aren't routed by the site itself. They are exported when their templates
+are installed.
+"""
+
+
+import collections
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.conf.urls import include, url
+from django.contrib.staticfiles import finders
+from django.core.handlers.base import BaseHandler
+from django.core.urlresolvers import set_urlconf
+from django.db import connections
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test import RequestFactory
+
+from radioco.global_settings.models import (
+    CalendarConfiguration, PodcastConfiguration, SiteConfiguration)
+from radioco.programmes.models import (
+    Episode, Participant, Podcast, Programme, Role)
+from radioco.programmes.recordings import podcasts_upserted
+from radioco.schedules import grid
+from radioco.schedules.models import BlackoutPeriod, Schedule, Slot
+from radioco.users.models import UserProfile
+
+
+urlpatterns = [
+    url(r'^programmes/', include('radioco.programmes.urls', namespace='programmes')),
+    url(r'^schedules/', include('radioco.schedules.urls', namespace='schedules')),
+    url(r'^users/', include('radioco.users.urls', namespace='users')),
+    url(r'^api/2/', include('radioco.api.urls', namespace='api')),
+]
+
+STATE_DIRECTORY = '.snapshot'
+MANIFEST = 'manifest.json'
+JOURNAL = 'journal'
+
+# groups of pages, besides one per programme
+ALL = 'all'
+PROGRAMMES = 'programmes'
+SCHEDULES = 'schedules'
+USERS = 'users'
+# pages of the current week, rendered by every export
+WEEK = 'week'
+
+EXTENSIONS = {
+    'text/html': '.html',
+    'application/json': '.json',
+    'application/rss+xml': '.xml',
+    'application/xml': '.xml',
+}
+IGNORED_STATIC_FILES = ['CVS', '.*', '*~']
+
+Export = collections.namedtuple('Export', ('rendered', 'removed', 'skipped'))
+Rendered = collections.namedtuple('Rendered', ('path', 'name', 'status'))
+
+# set before the workers are forked, they inherit it
+_options = {}
+_handler = None
+
+
+def programme_group(programme_id):
+    return 'programme:{:d}'.format(programme_id)
+
+
+def default_host():
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def _has_template(name):
+    try:
+        get_template(name)
+    except TemplateDoesNotExist:
+        return False
+    return True
+
+
+def _week_names(weeks):
+    year, week = grid.current_week()
+    monday, next_monday = grid.week_range(year, week)
+    for offset in range(weeks):
+        year, week, weekday = (monday + datetime.timedelta(weeks=offset)).isocalendar()
+        yield '{:04d}-W{:02d}'.format(year, week)
+
+
+def pages(weeks=2):
+    """
+        Yields (group, path) of every page of the snapshot
+    """
+    public = _has_template('programmes/programme_detail.html')
+    feed_items = PodcastConfiguration.get_global().feed_items
+    archived = dict(Podcast.objects.filter(
+        episode__issue_date__isnull=False,
+    ).values_list('episode__programme').annotate(count=Count('pk')))
+
+    if _has_template('programmes/programme_list.html'):
+        yield PROGRAMMES, '/programmes/'
+    yield PROGRAMMES, '/api/2/programmes'
+    yield PROGRAMMES, '/api/2/episodes'
+    yield PROGRAMMES, '/api/2/rss'
+    for pk, slug in Programme.objects.values_list('pk', 'slug'):
+        group = programme_group(pk)
+        if public:
+            yield group, '/programmes/{:s}/'.format(slug)
+            yield group, '/programmes/{:s}/rss/'.format(slug)
+        yield group, '/api/2/programmes/{:s}'.format(slug)
+        yield group, '/api/2/programmes/{:s}/rss'.format(slug)
+        for page in range(1, archived.get(pk, 0) // feed_items + 1):
+            yield group, '/api/2/programmes/{:s}/rss?page={:d}'.format(slug, page)
+
+    public_episodes = _has_template('programmes/episode_detail.html')
+    for pk, programme_id, slug, season, number in Episode.objects.values_list(
+            'pk', 'programme', 'programme__slug', 'season', 'number_in_season'):
+        group = programme_group(programme_id)
+        if public_episodes:
+            yield group, '/programmes/{:s}/{:d}x{:d}/'.format(slug, season, number)
+        yield group, '/api/2/episodes/{:d}'.format(pk)
+
+    yield SCHEDULES, '/api/2/slots'
+    for pk in Slot.objects.values_list('pk', flat=True):
+        yield SCHEDULES, '/api/2/slots/{:d}'.format(pk)
+    yield SCHEDULES, '/api/2/schedules'
+    for pk in Schedule.objects.values_list('pk', flat=True):
+        yield SCHEDULES, '/api/2/schedules/{:d}'.format(pk)
+
+    if _has_template('schedules/schedules_list.html'):
+        yield WEEK, '/schedules/'
+    yield WEEK, '/api/2/transmissions/week'
+    for week in _week_names(weeks):
+        yield WEEK, '/api/2/transmissions/week?week={:s}'.format(week)
+
+    if _has_template('users/userprofile_list.html'):
+        yield USERS, '/users/'
+    if _has_template('users/userprofile_detail.html'):
+        for slug in UserProfile.objects.filter(
+                display_personal_page=True).values_list('slug', flat=True):
+            yield USERS, '/users/{:s}/'.format(slug)
+
+
+def page_name(path, content_type):
+    """
+        Return the file name of the page at path, relative to the root
+    """
+    path, _, query = path.partition('?')
+    parts = [part for part in path.split('/') if part]
+    if query:
+        parts.append(query)
+    media_type = content_type.split(';')[0].strip()
+    parts.append('index' + EXTENSIONS.get(media_type, '.html'))
+    return os.path.join(*parts)
+
+
+def _write(root, name, content):
+    # atomically, a file server never sees a partial file
+    path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(descriptor, 'wb') as stream:
+        stream.write(content)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def hashed_name(name, content):
+    stem, extension = os.path.splitext(name)
+    return '{:s}.{:s}{:s}'.format(
+        stem, hashlib.md5(content).hexdigest()[:12], extension)
+
+
+def export_assets(root, previous=None):
+    """
+        Copy every static file below root, also under its hashed name
+
+        Returns a dict of hashed name per name. Files whose hashed name is in
+        previous aren't copied again.
+    """
+    previous = previous or {}
+    static_root = os.path.join(root, settings.STATIC_URL.strip('/'))
+    assets = {}
+    for finder in finders.get_finders():
+        for name, storage in finder.list(IGNORED_STATIC_FILES):
+            name = name.replace(os.sep, '/')
+            # the first one found is served, like in collectstatic
+            if name in assets:
+                continue
+            with storage.open(name) as stream:
+                content = stream.read()
+            assets[name] = hashed_name(name, content)
+            if previous.get(name) != assets[name]:
+                _write(static_root, name, content)
+                _write(static_root, assets[name], content)
+    return assets
+
+
+def _static_re():
+    return re.compile(re.escape(settings.STATIC_URL) + r'''(?P<name>[^"'\s?#)]+)''')
+
+
+def _handle(path):
+    global _handler
+    if _handler is None:
+        _handler = BaseHandler()
+        _handler.load_middleware()
+    request = RequestFactory().get(
+        path, secure=_options['secure'], HTTP_HOST=_options['host'])
+    request.urlconf = __name__
+    try:
+        return _handler.get_response(request)
+    finally:
+        set_urlconf(None)
+
+
+def render_page(path):
+    """
+        Render the page at path and write it below the root of the export
+    """
+    response = _handle(path)
+    if response.status_code != 200:
+        return Rendered(path, None, response.status_code)
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    content_type = response.get('Content-Type', 'text/html')
+    if content_type.startswith('text/html'):
+        assets, static_url = _options['assets'], settings.STATIC_URL
+        content = _options['static_re'].sub(
+            lambda match: static_url + assets.get(match.group('name'), match.group('name')),
+            content.decode(response.charset)).encode(response.charset)
+    name = page_name(path, content_type)
+    _write(_options['root'], name, content)
+    return Rendered(path, name, response.status_code)
+
+
+def render_all(paths, workers=None):
+    """
+        Render the pages at paths in a pool of processes
+
+        Yields a Rendered for every page, in no particular order.
+    """
+    if workers == 1:
+        return map(render_page, paths)
+    # every worker opens its own connections
+    connections.close_all()
+    executor = concurrent.futures.ProcessPoolExecutor(workers)
+    with executor:
+        return list(executor.map(render_page, paths, chunksize=16))
+
+
+def _state_path(root, name):
+    return os.path.join(root, STATE_DIRECTORY, name)
+
+
+def load_manifest(root):
+    try:
+        with open(_state_path(root, MANIFEST)) as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        return None
+
+
+def take_journal(root):
+    """
+        Return the groups journaled since the last export and empty the journal
+    """
+    path = _state_path(root, JOURNAL)
+    taken = '{:s}.{:d}'.format(path, os.getpid())
+    try:
+        os.replace(path, taken)
+    except FileNotFoundError:
+        return set()
+    with open(taken) as stream:
+        groups = {line.strip() for line in stream if line.strip()}
+    os.remove(taken)
+    return groups
+
+
+def journal(groups, root=None):
+    """
+        Append groups of pages to re-render to the journal of root, or of
+        SNAPSHOT_ROOT
+    """
+    root = root or getattr(settings, 'SNAPSHOT_ROOT', None)
+    if not root:
+        return
+    path = _state_path(root, JOURNAL)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as stream:
+        stream.write(''.join('{:s}\n'.format(group) for group in groups))
+
+
+def export(root, full=False, workers=None, host=None, secure=False, weeks=2):
+    """
+        Render the pages of the snapshot below root
+
+        Without full, only the journaled groups, the new pages and the pages
+        of the current week are rendered, if root was exported before. The
+        pages that don't exist anymore are removed.
+    """
+    manifest = load_manifest(root)
+    if manifest is None:
+        full = True
+        manifest = {'pages': {}, 'assets': {}}
+    groups = take_journal(root)
+    full = full or ALL in groups
+
+    assets = export_assets(root, None if full else manifest['assets'])
+    _options.update({
+        'root': root, 'assets': assets, 'static_re': _static_re(),
+        'host': host or default_host(), 'secure': secure})
+
+    current = collections.OrderedDict(
+        (path, group) for group, path in pages(weeks))
+    if full:
+        paths = list(current)
+    else:
+        groups.add(WEEK)
+        paths = [
+            path for path, group in current.items()
+            if group in groups or path not in manifest['pages']]
+
+    rendered, skipped = [], []
+    # a single page renders faster than a pool starts
+    for page in render_all(paths, workers if full else 1):
+        if page.name is None:
+            skipped.append(page)
+            manifest['pages'].pop(page.path, None)
+        else:
+            rendered.append(page)
+            manifest['pages'][page.path] = page.name
+
+    removed = [path for path in manifest['pages'] if path not in current]
+    for path in removed:
+        try:
+            os.remove(os.path.join(root, manifest['pages'].pop(path)))
+        except FileNotFoundError:
+            pass
+
+    manifest['assets'] = assets
+    _write(root, os.path.join(STATE_DIRECTORY, MANIFEST),
+           json.dumps(manifest, sort_keys=True).encode('utf-8'))
+    return Export(rendered, removed, skipped)
+
+
+def affected_groups(instance):
+    """
+        Return the groups of pages showing instance
+    """
+    if isinstance(instance, (SiteConfiguration, PodcastConfiguration, CalendarConfiguration)):
+        return [ALL]
+    if isinstance(instance, Programme):
+        return [programme_group(instance.pk), PROGRAMMES, SCHEDULES, USERS]
+    if isinstance(instance, Episode):
+        return [programme_group(instance.programme_id), PROGRAMMES]
+    if isinstance(instance, (Podcast, Participant)):
+        # the episode may be deleted already, its deletion is journaled too
+        return [PROGRAMMES] + [
+            programme_group(programme_id) for programme_id in Episode.objects.filter(
+                pk=instance.episode_id).values_list('programme', flat=True)]
+    if isinstance(instance, Role):
+        return [programme_group(instance.programme_id), USERS]
+    if isinstance(instance, UserProfile):
+        return [USERS] + [
+            programme_group(programme_id) for programme_id in Role.objects.filter(
+                person=instance.user_id).values_list('programme', flat=True)]
+    if isinstance(instance, (Slot, Schedule, BlackoutPeriod)):
+        return [SCHEDULES]
+    return []
+
+
+JOURNALED_MODELS = (
+    SiteConfiguration, PodcastConfiguration, CalendarConfiguration, Programme,
+    Episode, Podcast, Role, Participant, UserProfile, Slot, Schedule,
+    BlackoutPeriod)
+
+
+def journal_instance(instance, **kwargs):
+    journal(affected_groups(instance))
+
+
+def journal_podcasts(programme_ids, **kwargs):
+    # podcasts created or updated in bulk, without save signals
+    journal([PROGRAMMES] + [programme_group(programme_id) for programme_id in programme_ids])
+
+
+def enable():
+    for model in JOURNALED_MODELS:
+        for signal in (post_save, post_delete):
+            signal.connect(
+                journal_instance, sender=model,
+                dispatch_uid='snapshot-{:s}'.format(model.__name__))
+    podcasts_upserted.connect(journal_podcasts, dispatch_uid='snapshot-podcasts-upserted')
+
+
+def disable():
+    for model in JOURNALED_MODELS:
+        for signal in (post_save, post_delete):
+            signal.disconnect(
+                sender=model, dispatch_uid='snapshot-{:s}'.format(model.__name__))
+    podcasts_upserted.disconnect(dispatch_uid='snapshot-podcasts-upserted')
@@ -24,11 +24,14 @@ from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.utils.translation import ugettext_lazy as _
 from filebrowser.sites import site
 
+from radioco.metrics import metrics_view
+
 admin.site.site_header = _('RadioCo administration')
 admin.site.site_title = _('RadioCo site admin')
 
 
 urlpatterns = [
+    url(r'^metrics$', metrics_view, name='metrics'),
     url(r'^grappelli/', include('grappelli.urls')),
     url(r'^filebrowser/', include(site.urls)),
     url(r'^ckeditor/', include('ckeditor_uploader.urls')),
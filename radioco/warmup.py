@@ -0,0 +1,127 @@
+# Radioco - Broadcasting Radio Recording Scheduling system.
+# Copyright (C) 2014  Iago Veloso Abalo, Stefan Walluhn
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Warming the caches after a deploy, before the first visitors.
+
+Every family of cached values is computed like the first request needing it
+would. Only values which don't depend on the request are warmed, e.g. feed
+archive pages contain the host of the request and are left out.
+"""
+
+
+import collections
+import concurrent.futures
+import datetime
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from radioco.cache import get_generation
+from radioco.global_settings.models import (
+    CalendarConfiguration, PodcastConfiguration, SiteConfiguration)
+from radioco.programmes.feeds import programmes_items, station_items
+from radioco.programmes.models import Programme
+from radioco.schedules import grid, recorder
+
+
+Warmed = collections.namedtuple('Warmed', ('family', 'entries', 'seconds'))
+
+
+def warm_configuration(now):
+    """
+        Store the shared versions of the configuration models, every process
+        reads its own copy of them
+    """
+    models = (SiteConfiguration, PodcastConfiguration, CalendarConfiguration)
+    for model in models:
+        get_generation(model.version_key())
+    return len(models)
+
+
+def warm_weeks(now, weeks=2):
+    """
+        Cache the grids of the current week and the next weeks
+    """
+    year, week = grid.current_week(now)
+    monday, next_monday = grid.week_range(year, week)
+    for offset in range(weeks):
+        year, week, weekday = (monday + datetime.timedelta(weeks=offset)).isocalendar()
+        grid.week_grid_variants(year, week)
+    return weeks
+
+
+def warm_now_playing(now):
+    """
+        Cache the occurrences on air around now, looked up by the
+        transmissions on air
+    """
+    return len(grid.on_air(now))
+
+
+def warm_recorder(now):
+    """
+        Cache the recorder manifest and the occurrences of the live
+        transmissions it's built from
+    """
+    return len(recorder.manifest(now=now)['jobs'])
+
+
+def _programme_items(programme_id, size):
+    try:
+        programmes_items([programme_id], size)
+    finally:
+        # a connection per thread of the pool
+        connection.close()
+
+
+def warm_feeds(now, workers=None):
+    """
+        Cache the items of every programme feed, in a pool of threads, and
+        of the station feed
+    """
+    size = PodcastConfiguration.get_global().feed_items
+    programme_ids = list(Programme.objects.values_list('pk', flat=True))
+    if workers == 1:
+        for programme_id in programme_ids:
+            programmes_items([programme_id], size)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            list(executor.map(
+                _programme_items, programme_ids, [size] * len(programme_ids)))
+    station_items(size)
+    return len(programme_ids) + 1
+
+
+def warm_caches(now=None, weeks=2, workers=None):
+    """
+        Yields a Warmed for every family of cached values once it's warm
+    """
+    if now is None:
+        now = timezone.now()
+    families = (
+        ('configuration', lambda: warm_configuration(now)),
+        ('week grids', lambda: warm_weeks(now, weeks)),
+        ('now playing', lambda: warm_now_playing(now)),
+        ('recorder', lambda: warm_recorder(now)),
+        ('feeds', lambda: warm_feeds(now, workers)),
+    )
+    for family, warm in families:
+        started = time.perf_counter()
+        entries = warm()
+        yield Warmed(family, entries, time.perf_counter() - started)
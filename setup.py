@@ -67,6 +67,14 @@ setup(
         'python-dateutil',
         'pytz',
     ],
+    extras_require={
+        # vectorized expansion of simple recurrences
+        'fast': ['numpy'],
+        # faster API rendering with radioco.api.renderers.FastJSONRenderer
+        'json': ['orjson>=3.3'],
+        # brotli variants of cached responses
+        'brotli': ['brotli'],
+    },
     tests_require=['mock'],
     test_suite = "radioco.test.runner.runtests",
 )